@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Memory of the modelling data: wide housing_view frame and one-hot frame against compact listings,
+# district table and CSR design matrix
+
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import pandas as pd
+# Imported before the first timing, which would otherwise include the import of scipy.sparse
+import scipy.sparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from design_matrix import compact_view, design_matrix, matrix_nbytes
+
+CRIME_COLUMNS = ['furt', 'estafes', 'danys', 'rob_viol_intim', 'rob_en_vehicle', 'rob_força', 'lesions',
+                 'aprop_indeg', 'amenaces', 'rob_de_vehicle', 'ocupacions', 'salut_pub', 'abusos_sex',
+                 'entrada_domicili', 'agressio_sex', 'conviv_veinal', 'vigilancia_poli', 'molesties_espai_pub',
+                 'contra_prop_priv', 'incendis', 'estupefaents', 'agressions', 'proves_alcohol', 'proves_droga']
+DISTRICT_COLUMNS = ['superficie', 'poblacio'] + CRIME_COLUMNS
+
+
+# Original implementation from final_script.py, kept as the reference
+def design_reference(df):
+    df = df.drop(['id', 'price_per_sqm', 'discount'], axis=1)
+    ohe_bs = pd.get_dummies(df.building_subtype, prefix='bs')
+    ohe_cs = pd.get_dummies(df.conservation_state, prefix='cs')
+    ohe_d = pd.get_dummies(df.districte, prefix='d')
+    ohe_n = pd.get_dummies(df.neighbourhood, prefix='n')
+    df = pd.concat([df, ohe_bs, ohe_cs, ohe_d, ohe_n], axis=1)
+    df.drop(['building_subtype', 'conservation_state', 'districte', 'neighbourhood'], axis=1, inplace=True)
+    X = df.drop('price', axis=1)
+    # LinearRegression works on a float64 copy
+    return X.to_numpy(dtype=np.float64), list(X.columns)
+
+
+def design_compact(df):
+    listings, districts = compact_view(df.drop(columns=['id', 'price_per_sqm', 'discount']), DISTRICT_COLUMNS)
+    X, names = design_matrix(listings, districts, DISTRICT_COLUMNS)
+    return X, names, listings, districts
+
+
+def synthetic_housing_view(rng, n):
+    # Listings of 73 neighbourhoods in 10 districts, with the district columns repeated on every listing
+    districte_names = [f'Districte {d}' for d in range(10)]
+    neighbourhood_district = rng.integers(0, 10, 73)
+    district_table = pd.DataFrame({'districte': districte_names,
+                                   'superficie': rng.uniform(5, 25, 10).round(2),
+                                   'poblacio': rng.integers(50000, 250000, 10)})
+    for col in CRIME_COLUMNS:
+        district_table[col] = rng.integers(0, 20000, 10)
+    neighbourhood = rng.integers(0, 73, n)
+    df = pd.DataFrame({'id': np.arange(n),
+                       'bathrooms': rng.integers(1, 4, n),
+                       'building_subtype': rng.choice(['Flat', 'Apartment', 'Attic', 'Duplex', 'Penthouse',
+                                                       'Studio', 'Loft', 'House'], n),
+                       'conservation_state': rng.choice(['New construction', 'Nearly new', 'Very good', 'Good',
+                                                         'To renovate', 'Renovated'], n),
+                       'discount': rng.integers(0, 100, n),
+                       'floor_elevator': rng.random(n) < 0.7,
+                       'price': rng.lognormal(7, 0.5, n).round(),
+                       'rooms': rng.integers(1, 6, n),
+                       'sq_meters': rng.lognormal(4.3, 0.5, n).round(),
+                       'neighbourhood': np.array([f'Barri {b}' for b in range(73)], dtype=object)[neighbourhood]})
+    df['price_per_sqm'] = df['price'] / df['sq_meters']
+    df['districte'] = np.array(districte_names, dtype=object)[neighbourhood_district[neighbourhood]]
+    return df.merge(district_table, on='districte')
+
+
+def frame_nbytes(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+def traced(function, *args):
+    # Result, peak traced allocations and time of a call
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory of the modelling data representations.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--check-max', type=int, default=100000, help="largest size checked against the reference")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    mb = 1 << 20
+    for n in args.rows:
+        df = synthetic_housing_view(rng, n)
+        (dense, dense_names), dense_peak, dense_time = traced(design_reference, df)
+        (X, names, listings, districts), compact_peak, compact_time = traced(design_compact, df)
+        assert names == dense_names, "Design matrix columns differ from the one-hot encoding"
+        if n <= args.check_max:
+            assert np.array_equal(X.toarray(), dense), "Design matrix differs from the one-hot encoding"
+
+        print(f"{n} rows, {X.shape[1]} features:")
+        print(f"    wide housing_view {frame_nbytes(df) / mb:.1f}MB, dense float64 design {dense.nbytes / mb:.1f}MB, "
+              f"peak {dense_peak / mb:.1f}MB in {dense_time:.2f}s")
+        print(f"    listings {frame_nbytes(listings) / mb:.1f}MB + district table {frame_nbytes(districts) / 1024:.1f}kB, "
+              f"CSR design {matrix_nbytes(X) / mb:.1f}MB ({X.nnz / X.shape[0]:.1f} values per row), "
+              f"peak {compact_peak / mb:.1f}MB in {compact_time:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Benchmark of the entity resolution against the original all-pairs SequenceMatcher loop
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from entity_resolution import similar, entity
+
+
+# Original implementation from final_script.py, kept as the reference
+def entity_reference(df1, df2, col1, col2):
+    names_1 = df1[col1].unique()
+    names_2 = df2[col2].unique()
+
+    matching = {}
+    for name in names_1:
+        best = 0
+        best_name = 'None'
+        for name1 in names_2:
+            distance = similar(name, name1)
+            if distance > best:
+                best = distance
+                best_name = name1
+        matching[name] = best_name
+
+    for key in matching:
+        df1.loc[df1[col1] == key, col1] = matching[key]
+    return df1, matching
+
+
+def synthetic_names(rng, n):
+    syllables = ['sant', 'la', 'el', 'vila', 'poble', 'nou', 'barri', 'font', 'torre', 'mar',
+                 'gràcia', 'horta', 'sarrià', 'les', 'corts', 'clot', 'raval', 'besòs', 'port']
+    return [' '.join(rng.choice(syllables, size=rng.integers(2, 6))) for _ in range(n)]
+
+
+def noisy(rng, name):
+    # Raw names as they come in the housing extracts: lower case, suffixes and typos
+    name = name.lower()
+    if rng.random() < 0.3:
+        name += ' - aei ' + name.split(' ')[-1]
+    if rng.random() < 0.3 and len(name) > 3:
+        i = rng.integers(0, len(name) - 1)
+        name = name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    return name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entity resolution of neighbourhood names.")
+    parser.add_argument('--barris', help="barris-districtes CSV file (synthetic names are used otherwise)")
+    parser.add_argument('--raw-names', type=int, default=500, help="number of distinct raw names")
+    parser.add_argument('--rows', type=int, default=100000, help="number of housing rows")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.barris:
+        barris = pd.read_csv(args.barris)
+        barris.columns = barris.columns.str.lower()
+    else:
+        barris = pd.DataFrame({'nom_barri': sorted(set(synthetic_names(rng, 73)))})
+    canonical = barris['nom_barri'].unique()
+
+    raw = sorted({noisy(rng, name) for name in rng.choice(canonical, size=args.raw_names)})
+    housing = pd.DataFrame({'neighbourhood': rng.choice(raw, size=args.rows)})
+    print(f"{len(raw)} raw names x {len(canonical)} canonical names, {args.rows} rows")
+
+    timings = {}
+    results = {}
+    for label, method in [('reference', entity_reference), ('vectorized', entity)]:
+        start = time.perf_counter()
+        results[label] = method(housing.copy(), barris, 'neighbourhood', 'nom_barri')
+        timings[label] = time.perf_counter() - start
+        print(f"{label:>10}: {timings[label]:.3f}s")
+
+    assert results['reference'][1] == results['vectorized'][1], "Matchings differ"
+    assert results['reference'][0].equals(results['vectorized'][0]), "Rewritten columns differ"
+    print(f"Same matching and output, speedup x{timings['reference'] / timings['vectorized']:.1f}")
+
+
+if __name__ == '__main__':
+    main()
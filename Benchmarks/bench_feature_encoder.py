@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Micro-benchmark of the precomputed feature encoder against the get_dummies path
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from predictor import build_encoder
+from flat_inputs import INPUT_COLUMNS, BUILDING_SUBTYPES, CONSERVATION_STATES, NEIGHBOURHOODS, DISTRICTES
+
+CRIME_COLUMNS = ['furt', 'estafes', 'danys', 'rob_viol_intim', 'rob_en_vehicle', 'rob_força', 'lesions', 'aprop_indeg',
+                 'amenaces', 'rob_de_vehicle', 'ocupacions', 'salut_pub', 'abusos_sex', 'entrada_domicili', 'agressio_sex',
+                 'conviv_veinal', 'vigilancia_poli', 'molesties_espai_pub', 'contra_prop_priv', 'incendis',
+                 'estupefaents', 'agressions', 'proves_alcohol', 'proves_droga']
+
+
+# Original get_dummies implementation from predictor.py, kept as the reference
+def augment(df, barris_view):
+    # Add the district, surface, population and crime data of each neighbourhood, keeping the index of df
+    return df.join(barris_view.set_index('neighbourhood'), on='neighbourhood', how='inner')
+
+
+def encode(dfm, feature_order):
+    dfm = dfm.copy()
+
+    # Declare every level of the categorical variables, so all dummies exist whatever the rows to predict
+    dfm['building_subtype'] = pd.Categorical(dfm['building_subtype'], categories=BUILDING_SUBTYPES)
+    dfm['neighbourhood'] = pd.Categorical(dfm['neighbourhood'], categories=NEIGHBOURHOODS)
+    dfm['conservation_state'] = pd.Categorical(dfm['conservation_state'], categories=CONSERVATION_STATES)
+    dfm['districte'] = pd.Categorical(dfm['districte'], categories=DISTRICTES)
+
+    # One-hot encoding
+    ohe_bs = pd.get_dummies(dfm.building_subtype, prefix='bs')
+    ohe_cs = pd.get_dummies(dfm.conservation_state, prefix='cs')
+    ohe_d = pd.get_dummies(dfm.districte, prefix='d')
+    ohe_n = pd.get_dummies(dfm.neighbourhood, prefix='n')
+    dfmoh = pd.concat([dfm, ohe_bs, ohe_cs, ohe_d, ohe_n], axis=1)
+    dfmoh.drop(['building_subtype', 'conservation_state', 'districte', 'neighbourhood'], axis=1, inplace=True)
+
+    assert set(feature_order) == set(list(dfmoh.columns)), "The number of features does not coincide"
+    return dfmoh[feature_order]
+
+
+def build_features(df, barris_view, feature_order):
+    return encode(augment(df, barris_view), feature_order)
+
+
+def synthetic_barris_view(rng):
+    barris_view = pd.DataFrame({'districte': [DISTRICTES[i % len(DISTRICTES)] for i in range(len(NEIGHBOURHOODS))],
+                                'neighbourhood': NEIGHBOURHOODS,
+                                'superficie': rng.uniform(400, 2200, len(NEIGHBOURHOODS)).round(1),
+                                'poblacio': rng.integers(50000, 250000, len(NEIGHBOURHOODS))})
+    for col in CRIME_COLUMNS:
+        barris_view[col] = rng.integers(0, 5000, len(NEIGHBOURHOODS))
+    return barris_view
+
+
+def synthetic_flats(rng, n):
+    return pd.DataFrame({'bathrooms': rng.integers(1, 4, n),
+                         'building_subtype': rng.choice(BUILDING_SUBTYPES, n),
+                         'conservation_state': rng.choice(CONSERVATION_STATES, n),
+                         'floor_elevator': rng.choice([True, False], n),
+                         'rooms': rng.integers(1, 6, n),
+                         'sq_meters': rng.integers(30, 200, n),
+                         'neighbourhood': rng.choice(NEIGHBOURHOODS, n)}, columns=INPUT_COLUMNS)
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark feature row construction for the price model.")
+    parser.add_argument('--single', type=int, default=2000, help="repetitions of the single row encoding")
+    parser.add_argument('--rows', type=int, default=100000, help="rows of the batch encoding")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    barris_view = synthetic_barris_view(rng)
+    feature_order = (['bathrooms', 'floor_elevator', 'rooms', 'sq_meters', 'superficie', 'poblacio'] + CRIME_COLUMNS
+                     + ['bs_' + level for level in BUILDING_SUBTYPES] + ['cs_' + level for level in CONSERVATION_STATES]
+                     + ['d_' + level for level in DISTRICTES] + ['n_' + level for level in NEIGHBOURHOODS])
+    feature_order = list(rng.permutation(feature_order))
+    encoder = build_encoder(feature_order, barris_view)
+
+    flats = synthetic_flats(rng, args.rows)
+    flat = flats.iloc[0].to_dict()
+
+    pandas_time, expected = timed(lambda: build_features(pd.DataFrame([flat]), barris_view, feature_order), args.single)
+    encoder_time, row = timed(lambda: encoder.encode_one(flat), args.single)
+    assert np.allclose(expected.to_numpy(dtype=float), row), "Single row encodings differ"
+    print(f"single row: get_dummies {pandas_time * 1e6:.0f} us, encoder {encoder_time * 1e6:.1f} us "
+          f"(x{pandas_time / encoder_time:.0f})")
+
+    buffer = np.empty((len(flats), encoder.n_features + 1))
+    pandas_time, expected = timed(lambda: build_features(flats, barris_view, feature_order), 1)
+    encoder_time, matrix = timed(lambda: encoder.encode(flats, buffer), 3)
+    assert np.allclose(expected.to_numpy(dtype=float), matrix), "Batch encodings differ"
+    print(f"{len(flats)} rows: get_dummies {pandas_time:.3f}s, encoder {encoder_time:.3f}s "
+          f"(x{pandas_time / encoder_time:.0f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Benchmark of the sq_meters imputation against sklearn KNNImputer on the whole numeric frame
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from sklearn.impute import KNNImputer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from imputation import knn_impute
+
+
+# Original implementation from final_script.py, kept as the reference
+def impute_reference(newData):
+    imputer = KNNImputer(n_neighbors=5, weights="uniform")
+    newData = pd.DataFrame(imputer.fit_transform(newData), columns=newData.columns)
+    return newData['sq_meters'].to_numpy()
+
+
+def synthetic_numeric(rng, n, missing):
+    # Numeric columns of the housing table passed to the imputation, with discrete and continuous variables
+    df = pd.DataFrame({'discount': np.where(rng.random(n) < 0.9, 0, rng.integers(1, 300, n)).astype(float),
+                       'price': rng.lognormal(7, 0.5, n).round(),
+                       'rooms': rng.integers(1, 6, n).astype(float),
+                       'sq_meters': rng.lognormal(4.3, 0.5, n).round(),
+                       'neighbourhood_mean_price': rng.uniform(10, 25, n).round(2)})
+    df['sq_meters'] = (df['sq_meters'] + df['price'] / 40).round()
+    for col, rate in [('sq_meters', missing), ('discount', missing / 2), ('price', missing / 10)]:
+        df.loc[rng.random(n) < rate, col] = np.nan
+    return df
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sq_meters KNN imputation.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[2000, 20000, 200000, 1000000])
+    parser.add_argument('--missing', type=float, default=0.03, help="share of rows without sq_meters")
+    parser.add_argument('--reference-max', type=int, default=50000, help="largest size run through KNNImputer")
+    parser.add_argument('--exact-max', type=int, default=200000, help="largest size run in exact mode")
+    parser.add_argument('--workers', type=int, default=-1)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    for n in args.rows:
+        df = synthetic_numeric(rng, n, args.missing)
+        missing = df['sq_meters'].isna().to_numpy()
+        line = f"{n} rows, {missing.sum()} to impute:"
+
+        tree_time, tree = timed(lambda: knn_impute(df, 'sq_meters', method='tree', workers=args.workers))
+        exact_time = reference_time = None
+        if n <= args.exact_max:
+            exact_time, exact = timed(lambda: knn_impute(df, 'sq_meters', method='exact', workers=args.workers))
+            line += f" exact {exact_time:.2f}s,"
+        line += f" tree {tree_time:.2f}s"
+        if n <= args.reference_max:
+            reference_time, expected = timed(lambda: impute_reference(df))
+            assert np.array_equal(exact, expected), "Exact imputation differs from KNNImputer"
+            same = np.isclose(tree[missing], expected[missing]).mean()
+            line += (f", KNNImputer {reference_time:.2f}s (exact x{reference_time / exact_time:.0f}, "
+                     f"tree x{reference_time / tree_time:.0f}, tree equal on {same:.0%} of the imputed rows)")
+        elif exact_time is not None:
+            line += f" (tree x{exact_time / tree_time:.0f} over exact)"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
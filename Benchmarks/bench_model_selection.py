@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Model selection: cross-validation of the candidate grid with shared fold encodings for several numbers
+# of worker processes, against re-encoding the one-hot frame for every candidate and fold
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from bench_design_matrix import synthetic_housing_view, design_compact, CRIME_COLUMNS
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from model_selection import (FEATURE_SETS, candidate_estimators, cross_validate, evaluate, feature_columns,
+                             fold_indices)
+
+
+def cross_validate_reference(df, estimators, folds):
+    # Every candidate and fold encodes its own training and validation rows with pd.get_dummies
+    import pandas as pd
+    frame = df.drop(columns=['id', 'price_per_sqm', 'discount'])
+    frame = pd.get_dummies(frame, columns=['building_subtype', 'conservation_state', 'districte', 'neighbourhood'],
+                           prefix=['bs', 'cs', 'd', 'n'], dtype=np.float64)
+    y = frame.pop('price').to_numpy(dtype=np.float64)
+    results = []
+    for feature_set, flags in FEATURE_SETS.items():
+        for name, estimator in estimators.items():
+            for validation in folds:
+                train = np.ones(len(frame), dtype=bool)
+                train[validation] = False
+                columns = feature_columns(list(frame.columns), CRIME_COLUMNS, *flags)
+                X = frame.iloc[:, columns].to_numpy(dtype=np.float64)
+                results.append(evaluate(estimator, X[train], y[train], X[validation], y[validation])['rmse'])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the cross-validation of the model selection grid.")
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, -1])
+    parser.add_argument('--reference', action='store_true', help="also time the per-candidate one-hot encoding")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    df = synthetic_housing_view(np.random.default_rng(args.seed), args.rows)
+    X, names, listings, _ = design_compact(df)
+    y = listings['price'].to_numpy()
+    estimators = candidate_estimators()
+    n_candidates = len(estimators) * len(FEATURE_SETS)
+    print(f"{args.rows} rows, {n_candidates} candidates x {args.folds} folds")
+
+    for jobs in args.jobs:
+        start = time.perf_counter()
+        leaderboard = cross_validate(X, y, names, CRIME_COLUMNS, estimators, folds=args.folds, n_jobs=jobs,
+                                     seed=args.seed)
+        print(f"    {jobs} jobs: {time.perf_counter() - start:.2f}s")
+    print(leaderboard.head(10).to_string(index=False))
+
+    if args.reference:
+        start = time.perf_counter()
+        cross_validate_reference(df, estimators, fold_indices(len(df), args.folds, args.seed))
+        print(f"    one-hot frame encoded per candidate, 1 job: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Out-of-core training: normal equations accumulated over chunks of housing_view against the
+# LinearRegression fit of the whole one-hot frame held in memory
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from bench_design_matrix import synthetic_housing_view, design_reference, traced, DISTRICT_COLUMNS
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from design_matrix import compact_view, design_matrix, with_categories, holdout_mask, CATEGORICAL
+from linear_fit import fit_chunks
+
+
+def chunks_of(df, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def fit_reference(df):
+    # Original in-memory fit, on the rows kept for training by the out-of-core path
+    from sklearn.linear_model import LinearRegression
+    train = df[~holdout_mask(df['id'])]
+    X, names = design_reference(train)
+    return LinearRegression().fit(X, train['price']), names
+
+
+def fit_out_of_core(df, chunk_size, workers):
+    vocabulary = {col: sorted(df[col].unique()) for col in CATEGORICAL}
+
+    def encode(chunk):
+        chunk = with_categories(chunk[~holdout_mask(chunk['id'])].drop(columns=['id', 'price_per_sqm', 'discount']),
+                                vocabulary)
+        listings, districts = compact_view(chunk, DISTRICT_COLUMNS)
+        X, names = design_matrix(listings, districts, DISTRICT_COLUMNS)
+        return X, listings['price'].to_numpy(), names
+
+    return fit_chunks(chunks_of(df, chunk_size), encode, workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare out-of-core training with the in-memory fit.")
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    mb = 1 << 20
+    df = synthetic_housing_view(np.random.default_rng(args.seed), args.rows)
+    # Validation rows, scored by both models
+    X_val, _ = design_reference(df[holdout_mask(df['id'])])
+
+    (reference, names), peak, elapsed = traced(fit_reference, df)
+    expected = reference.predict(X_val)
+    print(f"{args.rows} rows, in memory: {elapsed:.2f}s, peak {peak / mb:.1f}MB")
+    for workers in args.workers:
+        start = time.perf_counter()
+        (reg, chunk_names), peak, _ = traced(fit_out_of_core, df, args.chunk_size, workers)
+        elapsed = time.perf_counter() - start
+        assert chunk_names == names, "Out-of-core design columns differ from the one-hot encoding"
+        difference = np.abs(reg.predict(X_val) - expected).max()
+        print(f"    chunks of {args.chunk_size}, {workers} workers: {elapsed:.2f}s, peak {peak / mb:.1f}MB, "
+              f"max prediction difference {difference:.2e}")
+
+
+if __name__ == '__main__':
+    main()
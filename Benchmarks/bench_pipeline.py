@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# End-to-end benchmark of final_script.py and prediction.py on synthetic inputs against a local PostgreSQL
+#
+# For every size, the synthetic input files are generated (and kept in --data for the next runs), the zone
+# schemas are dropped, final_script.py is run on the files and prediction.py scores as many flats in batch
+# mode. The stage and step timings written by final_script.py --timings, the wall time and the peak memory
+# of both scripts are saved as JSON with the commit they were measured on; --compare prints the stages
+# slower than in a previous results file.
+#
+# With --throwaway a temporary cluster is created with initdb and removed afterwards (needs the PostgreSQL
+# server binaries on the PATH). Otherwise the database is taken from the libpq environment variables
+# PGHOST, PGUSER and PGDATABASE (plus e.g. PGSSLMODE=disable), which must all be set.
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import platform
+import argparse
+import tempfile
+import subprocess
+from contextlib import contextmanager, nullcontext
+from synthetic_inputs import write_inputs, write_flats
+
+OPERATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations')
+
+ZONE_SCHEMAS = ['formatted_zone', 'trusted_zone', 'exploitation_zone']
+
+# libpq variables naming the local database when it is not a throwaway cluster
+REQUIRED_ENVIRONMENT = ['PGHOST', 'PGUSER', 'PGDATABASE']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def throwaway_postgres():
+    # Temporary PostgreSQL cluster listening on a Unix socket only, exported to the scripts through libpq variables
+    directory = tempfile.mkdtemp(prefix='bench_pg_')
+    data = os.path.join(directory, 'data')
+    port = str(free_port())
+    subprocess.run(['initdb', '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-locale'],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(['pg_ctl', '-D', data, '-l', os.path.join(directory, 'server.log'), '-w', 'start',
+                    '-o', f"-p {port} -k {directory} -c listen_addresses='' -c fsync=off"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        subprocess.run(['createdb', '-h', directory, '-p', port, '-U', 'postgres', 'bench'], check=True)
+        os.environ.update({'PGHOST': directory, 'PGPORT': port, 'PGUSER': 'postgres', 'PGDATABASE': 'bench',
+                           'PGPASSWORD': '', 'PGSSLMODE': 'disable'})
+        yield
+    finally:
+        subprocess.run(['pg_ctl', '-D', data, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def drop_zones():
+    # Start every run from an empty database
+    sys.path.insert(0, OPERATIONS)
+    from db import connect
+    conn = connect()
+    cursor = conn.cursor()
+    for schema in ZONE_SCHEMAS:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+def run_measured(command, cwd, stdin=None):
+    # Wall time and peak resident memory (MB) of a script, from the resource usage of its own process, and its output
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable] + command, cwd=cwd, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if stdin is not None:
+        process.stdin.write(stdin)
+    process.stdin.close()
+    output = process.stdout.read()
+    process.stdout.close()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+    returncode = process.returncode = os.waitstatus_to_exitcode(status)
+    if returncode != 0:
+        raise RuntimeError(f"{command[0]} failed with exit code {returncode}:\n{output}")
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    peak = usage.ru_maxrss / (1 << 20) if sys.platform == 'darwin' else usage.ru_maxrss / 1024
+    return {'wall': wall, 'peak_rss_mb': peak}, output
+
+
+def commit():
+    def git(*command):
+        return subprocess.run(['git'] + list(command), cwd=OPERATIONS, capture_output=True, text=True).stdout.strip()
+    return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def benchmark(rows, args):
+    inputs = os.path.join(args.data, str(rows))
+    start = time.perf_counter()
+    paths = [os.path.join(inputs, f'housing_{rows}.csv'), os.path.join(inputs, 'barris_districtes.csv'),
+             os.path.join(inputs, 'districtes.xlsx'), os.path.join(inputs, 'crime.xlsx')]
+    flats = os.path.join(inputs, 'flats.csv')
+    if not all(os.path.exists(path) for path in paths + [flats]):
+        paths = write_inputs(inputs, rows, args.seed)
+        write_flats(flats, rows, args.seed)
+    generate_time = time.perf_counter() - start
+    input_mb = sum(os.path.getsize(path) for path in paths) / (1 << 20)
+
+    # Models, checkpoints and timings of the run are written in their own directory
+    workdir = os.path.join(inputs, 'run')
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    timings_path = os.path.join(workdir, 'timings.json')
+
+    drop_zones()
+    print(f"{rows} listings ({input_mb:.1f}MB of input files)")
+    pipeline, output = run_measured([os.path.join(OPERATIONS, 'final_script.py'), '--no-cache', '--timings', timings_path]
+                               + args.script_args.split(), workdir, stdin=''.join(path + '\n' for path in paths))
+    pipeline['output'] = output.strip().splitlines()
+    with open(timings_path, encoding='utf-8') as file:
+        pipeline['timings'] = json.load(file)
+    print(f"    final_script.py {pipeline['wall']:.2f}s, peak {pipeline['peak_rss_mb']:.0f}MB")
+
+    predict, output = run_measured([os.path.join(OPERATIONS, 'prediction.py'), '--model', 'model.pkl',
+                                    '--batch', flats, '--output', 'predictions.parquet'], workdir)
+    predict['output'] = output.strip().splitlines()
+    print(f"    prediction.py --batch {predict['wall']:.2f}s, peak {predict['peak_rss_mb']:.0f}MB")
+    if not args.keep_runs:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'rows': rows, 'input_mb': input_mb, 'generate_time': generate_time, 'pipeline': pipeline,
+            'predict': predict}
+
+
+def stage_times(run):
+    # Time of every stage and step of a run, with the prediction as a last stage
+    timings = run['pipeline']['timings']
+    times = {name: stage['time'] for name, stage in {**timings['stages'], **timings['steps']}.items()}
+    times['final_script.py'] = run['pipeline']['wall']
+    times['predict'] = run['predict']['wall']
+    return times
+
+
+def summary(results):
+    for run in results['runs']:
+        print(f"{run['rows']} listings:")
+        for name, elapsed in sorted(stage_times(run).items(), key=lambda item: -item[1]):
+            print(f"    {name:<40} {elapsed:>8.2f}s")
+
+
+def compare(results, baseline_path, threshold):
+    # Stages slower than in the baseline results by more than the threshold ratio, for the sizes of both
+    with open(baseline_path, encoding='utf-8') as file:
+        baseline = json.load(file)
+    previous = {run['rows']: stage_times(run) for run in baseline['runs']}
+    print(f"Compared with {baseline['commit'][:12]} ({baseline['timestamp']}):")
+    regressions = 0
+    for run in results['runs']:
+        if run['rows'] not in previous:
+            continue
+        for name, elapsed in stage_times(run).items():
+            before = previous[run['rows']].get(name)
+            if before and elapsed > threshold * before and elapsed - before > 0.1:
+                regressions += 1
+                print(f"    {run['rows']} listings, {name}: {before:.2f}s -> {elapsed:.2f}s ({elapsed / before:.2f}x)")
+    print(f"    {regressions} stages slower by more than {threshold:.2f}x")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark final_script.py and prediction.py on synthetic inputs.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="listings of the synthetic housing files (up to 10M)")
+    parser.add_argument('--data', default='bench_data', help="directory of the generated inputs, reused by the next runs")
+    parser.add_argument('--script-args', default='',
+                        help="options of final_script.py, e.g. '--chunk-size 100000 --design sparse' "
+                             "(a single flag as --script-args=--pushdown)")
+    parser.add_argument('--throwaway', action='store_true', help="run against a temporary PostgreSQL cluster")
+    parser.add_argument('--output', default='bench_pipeline.json', help="JSON file of the results")
+    parser.add_argument('--compare', metavar='JSON', help="results of a previous version to compare with")
+    parser.add_argument('--threshold', type=float, default=1.2, help="slowdown ratio reported by --compare")
+    parser.add_argument('--keep-runs', action='store_true', help="keep the models and predictions of every run")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    args.data = os.path.abspath(args.data)
+
+    missing = [variable for variable in REQUIRED_ENVIRONMENT if not os.environ.get(variable)]
+    if not args.throwaway and missing:
+        parser.error(f"set {', '.join(missing)} to a local database, or use --throwaway")
+
+    results = {**commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+               'platform': platform.platform(), 'cpus': os.cpu_count(), 'script_args': args.script_args, 'runs': []}
+    with throwaway_postgres() if args.throwaway else nullcontext():
+        for rows in args.rows:
+            results['runs'].append(benchmark(rows, args))
+            # Saved after every size, so a long run interrupted at 10M rows keeps the smaller sizes
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=1)
+
+    summary(results)
+    print(f"Results saved to {args.output}")
+    if args.compare:
+        compare(results, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Load test of the prediction server: latency percentiles and throughput of POST /predict
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from predictor import BUILDING_SUBTYPES, CONSERVATION_STATES, NEIGHBOURHOODS
+
+
+def random_flat(rng):
+    return {'bathrooms': rng.randint(1, 3),
+            'building_subtype': rng.choice(BUILDING_SUBTYPES),
+            'conservation_state': rng.choice(CONSERVATION_STATES),
+            'floor_elevator': rng.choice([True, False]),
+            'rooms': rng.randint(1, 5),
+            'sq_meters': rng.randint(30, 200),
+            'neighbourhood': rng.choice(NEIGHBOURHOODS)}
+
+
+def worker(url, n_requests, seed, latencies):
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80)
+    for _ in range(n_requests):
+        body = json.dumps(random_flat(rng))
+        start = time.perf_counter()
+        conn.request('POST', '/predict', body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        assert response.status == 200, f"Unexpected status {response.status}"
+    conn.close()
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the prediction server.")
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--requests', type=int, default=2000, help="requests per client")
+    parser.add_argument('--concurrency', type=int, default=4, help="number of concurrent clients")
+    parser.add_argument('--warmup', type=int, default=50, help="requests sent before measuring")
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    worker(url, args.warmup, 0, [])
+
+    latencies = []
+    threads = [threading.Thread(target=worker, args=(url, args.requests, seed + 1, latencies))
+               for seed in range(args.concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(latencies)} requests with {args.concurrency} clients in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:.0f} requests/s)")
+    print(f"p50 {percentile(latencies, 50) * 1000:.2f} ms, p99 {percentile(latencies, 99) * 1000:.2f} ms, "
+          f"max {max(latencies) * 1000:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Startup time of a single prediction, with the import time breakdown of python -X importtime
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+OPERATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations')
+
+FLAT = {'bathrooms': 1, 'building_subtype': 'Flat', 'conservation_state': 'Good', 'floor_elevator': True,
+        'rooms': 3, 'sq_meters': 80, 'neighbourhood': 'la Dreta de l\'Eixample'}
+
+# What the original prediction.py imported before reading any input
+EAGER_IMPORTS = "import pandas, numpy, psycopg2, pickle, sklearn.linear_model"
+
+
+def run(command):
+    # Wall time of the command and its import times (self and cumulative microseconds by module)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=OPERATIONS,
+                            capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    imports = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line and 'self [us]' not in line:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall, imports, result
+
+
+def report(label, runs, top):
+    walls = sorted(wall for wall, _, _ in runs)
+    _, imports, _ = runs[-1]
+    # Top level modules only: their cumulative time includes everything they import
+    total = sum(cumulative for name, _, cumulative in imports if not name.startswith(' '))
+    print(f"{label}: wall {walls[len(walls) // 2] * 1e3:.0f} ms (median of {len(walls)}), "
+          f"imports {total / 1e3:.0f} ms in {len(imports)} modules")
+    for name, _, cumulative in sorted(imports, key=lambda item: -item[2])[:top]:
+        print(f"    {cumulative / 1e3:8.1f} ms  {name.strip()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup time of prediction.py.")
+    parser.add_argument('--model', default='final_model.pkl', help="model exported by final_script.py, relative to Operations")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="slowest imports listed")
+    args = parser.parse_args()
+
+    baseline = [run(['-c', EAGER_IMPORTS]) for _ in range(args.repeat)]
+    report("eager imports of the original script", baseline, args.top)
+
+    command = ['prediction.py', '--model', args.model, '--flat', json.dumps(FLAT)]
+    runs = [run(command) for _ in range(args.repeat)]
+    result = runs[-1][2]
+    if result.returncode != 0:
+        print(result.stderr.splitlines()[-1] if result.stderr else "prediction.py failed")
+        sys.exit(1)
+    print(result.stdout.strip())
+    report("prediction.py --flat", runs, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Query plans and timings of the exploitation zone lookups without and with their indexes
+#
+# The indexes are dropped in a transaction that is rolled back, so the tables keep them afterwards.
+# Needs the exploitation zone loaded by final_script.py.
+
+import os
+import sys
+import json
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from predictor import connect
+from exploitation_indexes import create_indexes, drop_indexes
+
+QUERIES = {
+    'prediction neighbourhood lookup':
+        "SELECT * FROM exploitation_zone.barris_view WHERE neighbourhood = %(neighbourhood)s",
+    'districte and price range':
+        "SELECT * FROM exploitation_zone.housing_view WHERE districte = %(districte)s "
+        "AND price BETWEEN %(low)s AND %(high)s",
+    'neighbourhood and price range':
+        "SELECT * FROM exploitation_zone.housing_view WHERE neighbourhood = %(neighbourhood)s "
+        "AND price BETWEEN %(low)s AND %(high)s",
+    'price range':
+        "SELECT * FROM exploitation_zone.housing_view WHERE price BETWEEN %(low)s AND %(high)s",
+}
+
+
+def query_params(cursor):
+    # A neighbourhood with its district and a narrow price range around the median
+    cursor.execute("SELECT neighbourhood, districte FROM exploitation_zone.housing_view "
+                   "GROUP BY neighbourhood, districte ORDER BY count(*) DESC LIMIT 1;")
+    neighbourhood, districte = cursor.fetchone()
+    cursor.execute("SELECT percentile_cont(ARRAY[0.45, 0.55]) WITHIN GROUP (ORDER BY price) "
+                   "FROM exploitation_zone.housing_view;")
+    low, high = cursor.fetchone()[0]
+    return {'neighbourhood': neighbourhood, 'districte': districte, 'low': low, 'high': high}
+
+
+def explain(cursor, query, params, repeat):
+    # Plan of the fastest of repeat executions
+    best = None
+    for _ in range(repeat):
+        cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+        plan = cursor.fetchone()[0][0]
+        if best is None or plan['Execution Time'] < best['Execution Time']:
+            best = plan
+    return best
+
+
+def plan_nodes(plan):
+    node = plan['Node Type'] + (' on ' + plan['Index Name'] if 'Index Name' in plan else '')
+    return [node] + [child for sub in plan.get('Plans', []) for child in plan_nodes(sub)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Capture the query plans of the exploitation zone lookups.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help="JSON file where the full plans are written")
+    args = parser.parse_args()
+
+    conn = connect()
+    create_indexes(conn)
+    cursor = conn.cursor()
+    params = query_params(cursor)
+
+    plans = {}
+    drop_indexes(cursor)
+    plans['before'] = {name: explain(cursor, query, params, args.repeat) for name, query in QUERIES.items()}
+    conn.rollback()
+    plans['after'] = {name: explain(cursor, query, params, args.repeat) for name, query in QUERIES.items()}
+    conn.rollback()
+    cursor.close()
+    conn.close()
+
+    for name in QUERIES:
+        before, after = plans['before'][name], plans['after'][name]
+        print(f"{name}: {before['Execution Time']:.3f}ms -> {after['Execution Time']:.3f}ms "
+              f"(x{before['Execution Time'] / max(after['Execution Time'], 1e-9):.1f})")
+        print(f"    before: {' / '.join(plan_nodes(before['Plan']))}")
+        print(f"    after:  {' / '.join(plan_nodes(after['Plan']))}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'params': params, 'plans': plans}, file, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Synthetic input files of final_script.py at any number of listings
+#
+# The four files follow the layout of the real extracts: the Fotocasa housing CSV (with its own spelling
+# of the neighbourhoods, missing values and outliers for the cleaning and imputation stages), the
+# barris-districtes CSV of the 73 neighbourhoods, and the crime and surface/population Excel files of the
+# 10 districts (with some district names spelled differently, as in the real files).
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from flat_inputs import INPUT_COLUMNS, BUILDING_SUBTYPES, CONSERVATION_STATES, NEIGHBOURHOODS, DISTRICTES
+
+# Last neighbourhood code (codi_barri) of every district, in district code order
+LAST_BARRI = [4, 10, 18, 21, 27, 32, 43, 56, 63, 73]
+
+HOUSING_COLUMNS = ['ID', 'address', 'bathrooms', 'building_subtype', 'building_type', 'conservation_state',
+                   'extraction_date', 'discount', 'floor_elevator', 'is_new_construction', 'link', 'price',
+                   'real_estate', 'real_estate_id', 'rooms', 'sq_meters', 'neighbourhood', 'neighbourhood_mean_price']
+
+# Column titles of the crime file (renamed by final_script.py)
+CRIME_TITLES = ['Districte', 'Furt', 'Estafes', 'Danys', 'Robatori amb violència o intimidació',
+                'Robatori en vehicle', 'Robatori amb força', 'Lesions', 'Apropiació indeguda', 'Amenaces',
+                'Robatori de vehicle', 'Ocupacions', 'Salut pública', 'Abusos sexuals', 'Entrada en domicili',
+                'Agressió sexual', 'Convivència veïnal', 'Vigilància policial', "Molèsties a l'espai públic",
+                'Contra la propietat privada', 'Incendis', 'Estupefaents', 'Agressions', "Proves d'alcoholèmia",
+                'Proves de drogues']
+
+# Codes of the conservation states in the housing file
+CONSERVATION_CODES = [0, 1, 2, 3, 4, 8]
+
+EXTRACTION_DATES = ['2020-10-28', '2020-11-25', '2020-12-23', '2021-01-27']
+
+STREETS = ['Carrer de Mallorca', 'Carrer de Balmes', 'Avinguda Diagonal', 'Carrer de Sants', 'Gran de Gràcia',
+           'Carrer de Muntaner', 'Passeig de Sant Joan', 'Carrer de Provença', 'Rambla del Poblenou']
+
+REAL_ESTATES = ['Finques Barcelona', 'Habitat Urbà', 'Gestió Immobiliària BCN', 'Lloguers Eixample', 'Particular']
+
+CHUNK_ROWS = 1000000
+
+
+def barris_districtes():
+    codes = np.searchsorted(LAST_BARRI, np.arange(1, len(NEIGHBOURHOODS) + 1)) + 1
+    return pd.DataFrame({'codi_districte': codes,
+                         'nom_districte': [DISTRICTES[code - 1] for code in codes],
+                         'codi_barri': np.arange(1, len(NEIGHBOURHOODS) + 1),
+                         'nom_barri': NEIGHBOURHOODS})
+
+
+def listed_name(name):
+    # Neighbourhood as spelled by the housing site: capitalized, with tighter hyphens
+    return (name[0].upper() + name[1:]).replace(' - ', '- ')
+
+
+def district_spelling(name, rng):
+    # District as spelled by the open data files: sometimes with spaces around the hyphen
+    return name.replace('-', ' - ') if '-' in name and rng.random() < 0.5 else name
+
+
+def district_tables(rng):
+    # Crime counts, and surface and population, of every district
+    crime = pd.DataFrame({CRIME_TITLES[0]: [district_spelling(name, rng) for name in DISTRICTES]})
+    for title in CRIME_TITLES[1:]:
+        crime[title] = rng.integers(0, 20000, len(DISTRICTES))
+    districts = pd.DataFrame({'Districte': [district_spelling(name, rng) for name in DISTRICTES],
+                              'Superfície': rng.uniform(4, 25, len(DISTRICTES)).round(2),
+                              'Població': rng.integers(80000, 270000, len(DISTRICTES))})
+    return crime, districts
+
+
+def housing_chunk(rng, start, n, neighbourhood_price):
+    neighbourhood = rng.integers(0, len(NEIGHBOURHOODS), n)
+    listed = np.array([listed_name(name) for name in NEIGHBOURHOODS], dtype=object)[neighbourhood]
+    rooms = rng.integers(1, 6, n)
+    sq_meters = (30 + 22 * rooms + rng.gamma(2, 10, n)).round()
+    price = (neighbourhood_price[neighbourhood] * sq_meters * rng.lognormal(0, 0.15, n)).round(-1)
+    conservation = rng.choice(CONSERVATION_CODES, n, p=[0.05, 0.1, 0.3, 0.4, 0.1, 0.05])
+    streets = rng.choice(STREETS, n)
+    ids = np.arange(start, start + n)
+    df = pd.DataFrame({
+        'ID': ids,
+        'address': [f'{street}, {name}' for street, name in zip(streets, listed)],
+        'bathrooms': np.minimum(rooms, rng.integers(1, 4, n)),
+        'building_subtype': rng.choice(BUILDING_SUBTYPES, n, p=[0.7, 0.06, 0.06, 0.04, 0.03, 0.04, 0.02, 0.02, 0.02, 0.01]),
+        'building_type': rng.choice(['Flat', 'Home'], n, p=[0.95, 0.05]),
+        'conservation_state': conservation,
+        'extraction_date': rng.choice(EXTRACTION_DATES, n),
+        'discount': np.where(rng.random(n) < 0.1, rng.integers(10, 300, n), 0),
+        'floor_elevator': (rng.random(n) < 0.75).astype(int),
+        'is_new_construction': conservation == 0,
+        'link': [f'/es/alquiler/vivienda/barcelona-capital/{i}/d' for i in ids],
+        'price': price,
+        'real_estate': rng.choice(REAL_ESTATES, n),
+        'real_estate_id': rng.integers(10000, 99999999, n).astype(str),
+        'rooms': rooms,
+        'sq_meters': sq_meters,
+        'neighbourhood': listed,
+        'neighbourhood_mean_price': (neighbourhood_price[neighbourhood] * 80).round(),
+    })
+    # Missing and implausible values, removed or imputed by the trusted zone stage
+    df.loc[rng.random(n) < 0.02, 'sq_meters'] = np.nan
+    df.loc[rng.random(n) < 0.005, 'sq_meters'] = 10
+    df.loc[rng.random(n) < 0.001, 'price'] = np.nan
+    df.loc[rng.random(n) < 0.001, 'price'] = 50000
+    df.loc[rng.random(n) < 0.001, 'neighbourhood'] = np.nan
+    return df
+
+
+def write_inputs(directory, rows, seed=42, chunk_rows=CHUNK_ROWS):
+    # Write the four input files for the given number of listings, returned in the order final_script.py asks for them
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = [os.path.join(directory, f'housing_{rows}.csv'), os.path.join(directory, 'barris_districtes.csv'),
+             os.path.join(directory, 'districtes.xlsx'), os.path.join(directory, 'crime.xlsx')]
+
+    neighbourhood_price = rng.uniform(10, 25, len(NEIGHBOURHOODS))
+    for start in range(0, rows, chunk_rows):
+        chunk = housing_chunk(rng, start, min(chunk_rows, rows - start), neighbourhood_price)
+        chunk[HOUSING_COLUMNS].to_csv(paths[0], mode='w' if start == 0 else 'a', header=start == 0, index=False)
+    barris_districtes().to_csv(paths[1], index=False)
+    crime, districts = district_tables(rng)
+    districts.to_excel(paths[2], index=False)
+    crime.to_excel(paths[3], index=False)
+    return paths
+
+
+def write_flats(path, rows, seed=42):
+    # Valid flats to score with prediction.py --batch
+    rng = np.random.default_rng(seed)
+    rooms = rng.integers(1, 6, rows)
+    flats = pd.DataFrame({'bathrooms': np.minimum(rooms, rng.integers(1, 4, rows)),
+                          'building_subtype': rng.choice(BUILDING_SUBTYPES, rows),
+                          'conservation_state': rng.choice(CONSERVATION_STATES, rows),
+                          'floor_elevator': rng.random(rows) < 0.75,
+                          'rooms': rooms,
+                          'sq_meters': (30 + 22 * rooms + rng.gamma(2, 10, rows)).round().astype(int),
+                          'neighbourhood': rng.choice(NEIGHBOURHOODS, rows)})
+    flats[INPUT_COLUMNS].to_csv(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic input files of final_script.py.")
+    parser.add_argument('rows', type=int, help="number of listings of the housing file")
+    parser.add_argument('--directory', default='bench_data')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    for path in write_inputs(args.directory, args.rows, args.seed):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
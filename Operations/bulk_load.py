@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Bulk loading of dataframes into PostgreSQL through COPY FROM STDIN
+
+import io
+import time
+import psycopg2
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from db import server_side_cursor, column_names
+
+# Rows rendered per chunk and bytes handed to COPY per read
+CHUNK_SIZE = 50000
+COPY_BUFFER_SIZE = 1 << 20
+
+
+def integral_floats_as_int(chunk):
+    # Integer columns with missing values are upcast to float by pandas, and
+    # COPY will not cast a '2.0' text into an INTEGER column, so float columns
+    # holding only whole numbers are written as nullable integers
+    cols = {}
+    for col in chunk.columns[[dtype.kind == 'f' for dtype in chunk.dtypes]]:
+        values = chunk[col].dropna()
+        if len(values) and (values % 1 == 0).all() and (values.abs() < 2**53).all():
+            cols[col] = 'Int64'
+    return chunk.astype(cols) if cols else chunk
+
+
+class DataFrameCSVStream:
+    # File-like object that renders a dataframe as CSV one fixed-size chunk at a time,
+    # so COPY reads straight from the column buffers without building row tuples
+
+    def __init__(self, df, chunk_size=CHUNK_SIZE):
+        self.df = df
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.buffer = io.StringIO()
+
+    def next_chunk(self):
+        chunk = self.df.iloc[self.position:self.position + self.chunk_size]
+        self.position += self.chunk_size
+        return integral_floats_as_int(chunk).to_csv(header=False, index=False)
+
+    def read(self, size=-1):
+        data = self.buffer.read(size)
+        while not data and self.position < len(self.df):
+            self.buffer = io.StringIO(self.next_chunk())
+            data = self.buffer.read(size)
+        return data
+
+
+def sql_columns(cols):
+    # Column names as spelled in the CREATE TABLE statements (upper case, unquoted), so that PostgreSQL folds
+    # them the same way: it does not lower the case of non-ASCII letters, e.g. ROB_FORÇA becomes rob_forÇa
+    return [col.upper() for col in cols]
+
+
+def copy_rows(cursor, df, table, chunk_size=CHUNK_SIZE):
+    cols = ','.join(sql_columns(df.columns))
+    query = "COPY %s(%s) FROM STDIN WITH (FORMAT csv)" % (table, cols)
+    cursor.copy_expert(query, DataFrameCSVStream(df, chunk_size), size=COPY_BUFFER_SIZE)
+
+
+def run_load(conn, df, table, load):
+    # Run a load callback in a single transaction, rolling back the whole table and re-raising on error
+    # (so a failed load also fails the stage running it, which is then never checkpointed)
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    try:
+        rows = load(cursor)
+        conn.commit()
+    except (Exception, psycopg2.DatabaseError) as error:
+        print("Error loading %s: %s" % (table, error))
+        conn.rollback()
+        cursor.close()
+        raise
+    elapsed = time.perf_counter() - start
+    # Loads without dataframe return the number of rows they inserted
+    rows = len(df) if df is not None else rows
+    print("The dataframe was correctly inserted into %s: %d rows in %.2fs (%.0f rows/s)"
+          % (table, rows, elapsed, rows / max(elapsed, 1e-9)))
+    cursor.close()
+
+
+def copy_dataframe(conn, df, table, chunk_size=CHUNK_SIZE):
+    return run_load(conn, df, table, lambda cursor: copy_rows(cursor, df, table, chunk_size))
+
+
+def overwrite_dataframe(conn, df, table, chunk_size=CHUNK_SIZE):
+    # Full rebuild of a table: emptied and bulk loaded in the same transaction, so that running the load
+    # again replaces the rows of the previous run instead of failing on their keys
+    def load(cursor):
+        cursor.execute("TRUNCATE %s;" % table)
+        copy_rows(cursor, df, table, chunk_size)
+    return run_load(conn, df, table, load)
+
+
+def replace_dataframe(conn, df, table, chunk_size=CHUNK_SIZE):
+    # Idempotent load for small tables without a key: swap the whole content atomically
+    def load(cursor):
+        cursor.execute("DELETE FROM %s;" % table)
+        copy_rows(cursor, df, table, chunk_size)
+    return run_load(conn, df, table, load)
+
+
+def stage_name(table):
+    return 'stage_' + table.replace('.', '_')
+
+
+def merge_stage(cursor, stage, table, cols, key, prune):
+    # Write the new or changed keys of the staged rows, and with prune delete the keys missing from them
+    cols = sql_columns(cols)
+    updates = [col for col in cols if col != key.upper()]
+    cursor.execute(
+            "INSERT INTO {table} AS t ({cols}) SELECT {cols} FROM {stage} "
+            "ON CONFLICT ({key}) DO UPDATE SET {sets} "
+            "WHERE ({old}) IS DISTINCT FROM ({new});".format(
+                table=table, cols=','.join(cols), stage=stage, key=key,
+                sets=','.join("%s = EXCLUDED.%s" % (col, col) for col in updates),
+                old=','.join('t.' + col for col in updates),
+                new=','.join('EXCLUDED.' + col for col in updates)))
+    changed = cursor.rowcount
+    deleted = 0
+    if prune:
+        cursor.execute("DELETE FROM %s t WHERE NOT EXISTS (SELECT 1 FROM %s s WHERE s.%s = t.%s);"
+                       % (table, stage, key, key))
+        deleted = cursor.rowcount
+    print("%s: %d new or changed rows, %d deleted rows" % (table, changed, deleted))
+
+
+def upsert_dataframe(conn, df, table, key='id', prune=False, chunk_size=CHUNK_SIZE):
+    # Idempotent load keyed on a primary key: rows are staged in a temporary table and
+    # only new or changed keys are written. With prune, keys missing from the dataframe
+    # are deleted, so the table ends up equal to the dataframe.
+    stage = stage_name(table)
+
+    def load(cursor):
+        cursor.execute("CREATE TEMP TABLE %s (LIKE %s INCLUDING DEFAULTS) ON COMMIT DROP;" % (stage, table))
+        copy_rows(cursor, df, stage, chunk_size)
+        merge_stage(cursor, stage, table, list(df.columns), key, prune)
+    return run_load(conn, df, table, load)
+
+
+def load_query(conn, query, params, table, cols, incremental=False, key=None, prune=False):
+    # Server-side counterpart of the dataframe loads: the rows of a SELECT are inserted without leaving
+    # the database into the emptied table, or in incremental mode by replacing a table without key or
+    # upserting on its key
+    insert = "INSERT INTO %s (%s) %s" % (table, ','.join(sql_columns(cols)), query)
+
+    def load(cursor):
+        if not incremental:
+            cursor.execute("TRUNCATE %s;" % table)
+            cursor.execute(insert, params)
+            return cursor.rowcount
+        if key is None:
+            cursor.execute("DELETE FROM %s;" % table)
+            cursor.execute(insert, params)
+            return cursor.rowcount
+        stage = stage_name(table)
+        cursor.execute("CREATE TEMP TABLE %s ON COMMIT DROP AS %s" % (stage, query), params)
+        rows = cursor.rowcount
+        merge_stage(cursor, stage, table, cols, key, prune)
+        return rows
+    return run_load(conn, None, table, load)
+
+
+################################## Background persistence of zone tables ##################################
+
+class BackgroundWriter:
+    # Runs zone loads one after another on a dedicated connection in a background thread,
+    # so the pipeline keeps working on the in-memory dataframe while tables are written
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = []
+
+    def submit(self, job, *args, **kwargs):
+        self.pending.append(self.executor.submit(job, self.conn, *args, **kwargs))
+
+    def wait(self):
+        # Block until every submitted load is committed, re-raising any failure
+        pending, self.pending = self.pending, []
+        return [future.result() for future in pending]
+
+    def close(self, close_connection=True):
+        self.wait()
+        self.executor.shutdown()
+        if close_connection:
+            self.conn.close()
+
+
+def as_persisted(df):
+    # Copy of the dataframe as it would be read back from its zone table:
+    # lower case column names and plain object columns instead of categories and strings
+    df = df.copy()
+    df.columns = df.columns.str.lower()
+    for col in df.columns:
+        if isinstance(df[col].dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            df[col] = df[col].astype(object)
+    return df
+
+
+################################## Streaming reads of source files ##################################
+
+def read_csv_chunks(path, dtypes, chunk_size=CHUNK_SIZE):
+    # Read a CSV file chunk by chunk with lower case column names, giving the columns listed
+    # in dtypes (by lower case name) their compact dtype, so only one chunk is held in memory
+    header = pd.read_csv(path, nrows=0).columns
+    dtype = {col: dtypes[col.lower()] for col in header if col.lower() in dtypes}
+    for chunk in pd.read_csv(path, dtype=dtype, chunksize=chunk_size):
+        chunk.columns = chunk.columns.str.lower()
+        yield chunk
+
+
+def read_query_chunks(conn, query, params=None, dtypes=None, chunk_size=CHUNK_SIZE):
+    # Rows of a query as dataframes of chunk_size rows fetched from a server-side cursor, typed as
+    # pd.read_sql_query would type them, with the columns listed in dtypes given their compact dtype
+    # and every column name lowered as in memory (see db.column_names).
+    # Only the tuples of one chunk are ever held, instead of the whole result. Ends the transaction of conn.
+    cursor = server_side_cursor(conn, chunk_size)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            chunk = pd.DataFrame.from_records(rows, columns=column_names(cursor),
+                                              coerce_float=True)
+            del rows
+            yield chunk.astype({col: dtype for col, dtype in (dtypes or {}).items() if col in chunk.columns})
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def read_query(conn, query, params=None, dtypes=None, chunk_size=CHUNK_SIZE):
+    # Whole result of a query read chunk by chunk. The columns of every chunk are copied apart, so a
+    # chunk is freed as soon as it is split, and each column is concatenated and its chunks freed in
+    # turn: the peak is the result plus one column, instead of the result twice. Columns of a chunk
+    # holding only NULLs and categories differing between chunks are concatenated as objects, so types
+    # are inferred and dtypes set again.
+    dtypes = dtypes or {}
+    parts = None
+    for chunk in read_query_chunks(conn, query, params, dtypes, chunk_size):
+        if parts is None:
+            parts = {col: [] for col in chunk.columns}
+        for col in chunk.columns:
+            parts[col].append(chunk[col].copy())
+        del chunk
+    if parts is None:
+        df = pd.read_sql_query(query, conn, params=params)
+        df.columns = df.columns.str.lower()
+        return df
+    columns = {}
+    for col in list(parts):
+        column = pd.concat(parts.pop(col), ignore_index=True).infer_objects()
+        columns[col] = column.astype(dtypes[col]) if col in dtypes else column
+    return pd.DataFrame(columns, copy=False)
+
+
+################################## High-water marks per source file ##################################
+
+def create_watermarks_table(conn, schema):
+    cursor = conn.cursor()
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {schema}.load_watermarks (
+        SOURCE_FILE VARCHAR(255),
+        TABLE_NAME VARCHAR(255),
+        HIGH_WATER_MARK TIMESTAMP,
+        LOADED_AT TIMESTAMP DEFAULT now(),
+        PRIMARY KEY (SOURCE_FILE, TABLE_NAME)
+    );""")
+    conn.commit()
+    cursor.close()
+
+
+def get_high_water_mark(conn, schema, source_file, table):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT high_water_mark FROM {schema}.load_watermarks WHERE source_file = %s AND table_name = %s;",
+                   (source_file, table))
+    row = cursor.fetchone()
+    cursor.close()
+    return row[0] if row else None
+
+
+def set_high_water_mark(conn, schema, source_file, table, mark):
+    cursor = conn.cursor()
+    cursor.execute(f"""INSERT INTO {schema}.load_watermarks (source_file, table_name, high_water_mark)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (source_file, table_name)
+        DO UPDATE SET high_water_mark = GREATEST({schema}.load_watermarks.high_water_mark, EXCLUDED.high_water_mark),
+                      loaded_at = now();""", (source_file, table, mark))
+    conn.commit()
+    cursor.close()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Declarative row filtering rules of the trusted zone cleaning
+#
+# A rule is a tuple (column, kind, value):
+#   ('price', 'iqr', 5)     removes values outside [Q1 - 5 * IQR, Q3 + 5 * IQR]
+#   ('price', 'max', 15000) removes values above 15000
+#   ('price', 'min', 0)     removes values below 0
+# Missing values are never removed. Rules apply in order, as if each one filtered the rows kept by the
+# previous ones: the quartiles of an IQR rule are those of the rows that passed the earlier rules.
+
+import numpy as np
+
+KINDS = ('iqr', 'max', 'min')
+
+
+def rule_mask(values, kind, value, keep):
+    # Rows of values removed by a rule, given the rows kept by the previous rules
+    with np.errstate(invalid='ignore'):
+        if kind == 'max':
+            return values > value
+        if kind == 'min':
+            return values < value
+        kept = values[keep]
+        if np.isnan(kept).all():
+            return np.zeros(len(values), dtype=bool)
+        q1, q3 = np.nanquantile(kept, [0.25, 0.75])
+        iqr = q3 - q1
+        return (values < q1 - value * iqr) | (values > q3 + value * iqr)
+
+
+def keep_mask(df, rules):
+    # Rows of df kept by the rules, computed on a single float array of the columns they test
+    for _, kind, _ in rules:
+        assert kind in KINDS, f"Unknown cleaning rule kind {kind}"
+    cols = list(dict.fromkeys(col for col, _, _ in rules))
+    base = df[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    keep = np.ones(len(df), dtype=bool)
+    for col, kind, value in rules:
+        keep &= ~rule_mask(base[:, cols.index(col)], kind, value, keep)
+    return keep
+
+
+def apply_rules(df, rules, verbose=False):
+    # Rows of df kept by the rules, copied once
+    keep = keep_mask(df, rules)
+    if verbose:
+        print(f"Cleaning rules removed {len(df) - keep.sum()} of {len(df)} rows")
+    return df[keep]
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# PostgreSQL configuration, connections and connection pools shared by the pipeline and the prediction scripts
+#
+# Settings are read, by increasing priority, from the defaults below, from the [postgres] section of the
+# INI file named by DB_CONFIG (./db.ini if it exists, see db.ini.example), and from the environment variables
+# of libpq (PGHOST, PGPORT, PGDATABASE, PGUSER, PGPASSWORD, PGSSLMODE) plus DB_STATEMENT_TIMEOUT in
+# milliseconds. No server or credentials are built in: host, database and user must be given by one of them,
+# e.g. PGHOST=localhost PGDATABASE=adsdb PGUSER=postgres PGSSLMODE=disable for a local stand-in.
+#
+# Every connection counts the queries run on it and their time, reported by query_report().
+
+import os
+import time
+import weakref
+import itertools
+import configparser
+from contextlib import contextmanager
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+DEFAULTS = {
+    'host': '',
+    'port': '5432',
+    'dbname': '',
+    'user': '',
+    'password': '',
+    'sslmode': 'prefer',
+    'statement_timeout': '',
+}
+
+# Settings without default
+REQUIRED = ['host', 'dbname', 'user']
+
+ENVIRONMENT = {
+    'host': 'PGHOST',
+    'port': 'PGPORT',
+    'dbname': 'PGDATABASE',
+    'user': 'PGUSER',
+    'password': 'PGPASSWORD',
+    'sslmode': 'PGSSLMODE',
+    'statement_timeout': 'DB_STATEMENT_TIMEOUT',
+}
+
+CONFIG_FILE = 'db.ini'
+
+# Rows fetched per round trip by server-side cursors
+CURSOR_ITERSIZE = 10000
+
+# Every connection opened by this process, for the query report
+connections = weakref.WeakSet()
+cursor_names = itertools.count()
+
+
+def load_config(path=None):
+    config = dict(DEFAULTS)
+    path = path or os.environ.get('DB_CONFIG', CONFIG_FILE)
+    if os.path.exists(path):
+        parser = configparser.ConfigParser()
+        parser.read(path)
+        if parser.has_section('postgres'):
+            config.update((key, value) for key, value in parser.items('postgres') if key in DEFAULTS)
+    config.update((key, os.environ[variable]) for key, variable in ENVIRONMENT.items() if variable in os.environ)
+    missing = [key for key in REQUIRED if not config[key]]
+    if missing:
+        raise RuntimeError("Database settings missing: %s. Set %s or the [postgres] section of %s."
+                           % (', '.join(missing), ', '.join(ENVIRONMENT[key] for key in missing), path))
+    return config
+
+
+def database_dsn(config=None):
+    config = load_config() if config is None else config
+    params = {key: config[key] for key in ('host', 'port', 'dbname', 'user', 'password', 'sslmode') if config.get(key)}
+    if config.get('statement_timeout'):
+        params['options'] = '-c statement_timeout=%d' % int(config['statement_timeout'])
+    return psycopg2.extensions.make_dsn(**params)
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    # Cursor adding the time of every query it runs to its connection
+
+    def timed(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            self.connection.record(time.perf_counter() - start)
+
+    def execute(self, query, vars=None):
+        return self.timed(super().execute, query, vars)
+
+    def executemany(self, query, vars_list):
+        return self.timed(super().executemany, query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        return self.timed(super().copy_expert, sql, file, size)
+
+
+class TimedConnection(psycopg2.extensions.connection):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queries = 0
+        self.query_time = 0.0
+        connections.add(self)
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', TimedCursor)
+        return super().cursor(*args, **kwargs)
+
+    def record(self, elapsed):
+        self.queries += 1
+        self.query_time += elapsed
+
+
+def connect(dsn=None):
+    return psycopg2.connect(dsn or database_dsn(), connection_factory=TimedConnection)
+
+
+def create_pool(maxconn, dsn=None, minconn=1):
+    # Pool of timed connections shared by the threads of a script
+    return ThreadedConnectionPool(minconn, maxconn, dsn or database_dsn(), connection_factory=TimedConnection)
+
+
+@contextmanager
+def borrow(pool):
+    # Connection borrowed from the pool for the duration of the block, rolled back on error
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def server_side_cursor(conn, itersize=CURSOR_ITERSIZE):
+    # Named cursor: the result stays on the server and is fetched itersize rows at a time while iterating
+    cursor = conn.cursor('cursor_%d' % next(cursor_names))
+    cursor.itersize = itersize
+    return cursor
+
+
+def column_names(cursor):
+    # Columns of the last result as the pipeline spells them. PostgreSQL folds the unquoted names of the
+    # CREATE TABLE statements without lowering non-ASCII letters (ROB_FORÇA becomes rob_forÇa), while the
+    # dataframes kept in memory are lowered by str.lower() (rob_força), so names read back are lowered again.
+    return [column[0].lower() for column in cursor.description]
+
+
+def query_stats():
+    # Queries and query time of every open connection of this process, longest query time first
+    return [{'backend_pid': conn.info.backend_pid, 'queries': conn.queries, 'query_time': conn.query_time}
+            for conn in sorted(connections, key=lambda conn: -conn.query_time) if not conn.closed]
+
+
+def query_report():
+    return ["connection %d: %d queries in %.2fs" % (stats['backend_pid'], stats['queries'], stats['query_time'])
+            for stats in query_stats()]
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compact representation of housing_view for modelling
+#
+# housing_view repeats the surface, population and crime counts of its district on every listing. They are
+# kept once per district in a small table, and listings only hold category codes and their own variables
+# in the narrowest integer dtype holding them. The design matrix is built from the codes as a CSR matrix,
+# with the same columns in the same order as the one-hot encoding of the wide frame by pd.get_dummies.
+
+import numpy as np
+import pandas as pd
+
+# One-hot encoded columns with the prefix of their dummies, in the order of the dummies in the design matrix
+CATEGORICAL = {'building_subtype': 'bs', 'conservation_state': 'cs', 'districte': 'd', 'neighbourhood': 'n'}
+
+DISTRICT_KEY = 'districte'
+
+
+def compact_view(housing, district_columns):
+    # Listings with categories and downcast integers, and the table of the district columns by district
+    districts = housing[[DISTRICT_KEY] + district_columns].drop_duplicates(DISTRICT_KEY).reset_index(drop=True)
+    listings = housing.drop(columns=district_columns)
+    for col in listings.columns:
+        if col in CATEGORICAL:
+            if not isinstance(listings[col].dtype, pd.CategoricalDtype):
+                listings[col] = listings[col].astype('category')
+        elif listings[col].dtype.kind in 'iu':
+            listings[col] = pd.to_numeric(listings[col], downcast='integer')
+    return listings, districts
+
+
+def design_matrix(listings, districts, district_columns, target='price'):
+    # CSR design matrix of the listings and the names of its columns: the numeric variables of the listings,
+    # the district columns of their district, then the dummies of the categorical variables.
+    # Every row has the same layout (one value per numeric and district column, one per categorical
+    # variable), so the CSR arrays are filled column by column without any intermediate sparse matrix.
+    from scipy import sparse
+    numeric = [col for col in listings.columns if col not in CATEGORICAL and col != target]
+    district_values = (districts.set_index(DISTRICT_KEY)
+                       .reindex(listings[DISTRICT_KEY].cat.categories)[district_columns].to_numpy(dtype=np.float64))
+    district_codes = listings[DISTRICT_KEY].cat.codes.to_numpy()
+    assert (district_codes >= 0).all(), "Listings without district"
+
+    n = len(listings)
+    width = len(numeric) + len(district_columns) + len(CATEGORICAL)
+    data = np.empty((n, width))
+    indices = np.empty((n, width), dtype=np.int32)
+    names = numeric + list(district_columns)
+    for j, col in enumerate(numeric):
+        data[:, j] = listings[col].to_numpy(dtype=np.float64)
+    for j in range(len(district_columns)):
+        data[:, len(numeric) + j] = district_values[district_codes, j]
+    indices[:, :len(names)] = np.arange(len(names), dtype=np.int32)
+
+    # One dummy set per row and categorical variable (an explicit zero in the first dummy without value)
+    for j, (col, prefix) in enumerate(CATEGORICAL.items(), start=len(names)):
+        # Codes are int8 up to 127 levels: widened first, or the column offset added to them would wrap around
+        codes = listings[col].cat.codes.to_numpy().astype(np.int32)
+        data[:, j] = codes >= 0
+        indices[:, j] = len(names) + np.maximum(codes, 0)
+        names += [f'{prefix}_{level}' for level in listings[col].cat.categories]
+
+    indptr = np.arange(0, n * width + 1, width, dtype=np.int64 if n * width >= 2**31 else np.int32)
+    return sparse.csr_matrix((data.ravel(), indices.ravel(), indptr), shape=(n, len(names))), names
+
+
+def matrix_nbytes(matrix):
+    return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+
+def with_categories(df, vocabulary):
+    # Categorical columns with fixed levels, so chunks encoded separately get the same design columns
+    return df.assign(**{col: pd.Categorical(df[col], categories=levels) for col, levels in vocabulary.items()})
+
+
+def holdout_mask(ids, share=0.2):
+    # Rows held out for validation, chosen by a hash of their ID: the same listings in every chunk order
+    hashed = (np.asarray(ids, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(40)
+    return hashed % np.uint64(1000) < np.uint64(round(share * 1000))
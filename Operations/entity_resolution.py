@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Entity resolution of raw neighbourhood and district names against the barris-districtes table
+
+import hashlib
+from difflib import SequenceMatcher
+import numpy as np
+import psycopg2
+import psycopg2.errors
+import psycopg2.extras as extras
+
+# Number of raw names whose bounds are computed at once
+BLOCK_SIZE = 256
+
+
+def similar(a, b):
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def char_counts(names, alphabet):
+    # Number of occurrences of every character of the alphabet in each name
+    index = {c: i for i, c in enumerate(alphabet)}
+    counts = np.zeros((len(names), len(alphabet)), dtype=np.int32)
+    for row, name in enumerate(names):
+        for c in name:
+            counts[row, index[c]] += 1
+    return counts
+
+
+def ratio_bounds(counts_1, counts_2):
+    # Upper bound of SequenceMatcher.ratio() for every pair of names (the quick_ratio):
+    # twice the number of shared characters over the total length
+    common = np.minimum(counts_1[:, None, :], counts_2[None, :, :]).sum(axis=2)
+    lengths = counts_1.sum(axis=1)[:, None] + counts_2.sum(axis=1)[None, :]
+    return np.where(lengths > 0, 2.0 * common / np.maximum(lengths, 1), 1.0)
+
+
+def score_matches(names_1, names_2):
+    # Best match in names_2 and its ratio for every name in names_1, with the same result as comparing
+    # every pair with similar() and keeping the first best one ('None' if nothing matches).
+    # Candidates are visited by decreasing upper bound, so the exact ratio is only computed
+    # for the few candidates that can still beat (or tie with an earlier) best match.
+    names_1 = list(names_1)
+    names_2 = list(names_2)
+    alphabet = sorted(set(''.join(names_1)) | set(''.join(names_2)))
+    counts_2 = char_counts(names_2, alphabet)
+
+    matching = {}
+    for start in range(0, len(names_1), BLOCK_SIZE):
+        block = names_1[start:start + BLOCK_SIZE]
+        bounds = ratio_bounds(char_counts(block, alphabet), counts_2)
+        orders = np.argsort(-bounds, axis=1, kind='stable')
+        for name, bound, order in zip(block, bounds, orders):
+            best = 0
+            best_j = -1
+            for j in order:
+                if bound[j] <= 0 or bound[j] < best or (bound[j] == best and j > best_j):
+                    break
+                distance = similar(name, names_2[j])
+                if distance > best or (distance == best and j < best_j):
+                    best = distance
+                    best_j = j
+            matching[name] = (names_2[best_j] if best_j >= 0 else 'None', best)
+    return matching
+
+
+def best_matches(names_1, names_2):
+    return {name: match for name, (match, _) in score_matches(names_1, names_2).items()}
+
+
+class AliasCache:
+    # Persistent table of raw name -> canonical name matches with their ratio as confidence.
+    # Entries are tied to a hash of the canonical names they were matched against, so a
+    # cached match is only reused while the barris-districtes reference is unchanged.
+
+    def __init__(self, conn, table='trusted_zone.entity_aliases'):
+        self.conn = conn
+        self.table = table
+
+    def create_table(self):
+        cursor = self.conn.cursor()
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS {self.table} (
+            TARGET_COLUMN VARCHAR(30),
+            REFERENCE_HASH VARCHAR(40),
+            RAW_NAME VARCHAR(255),
+            CANONICAL_NAME VARCHAR(50),
+            CONFIDENCE FLOAT,
+            UPDATED_AT TIMESTAMP DEFAULT now(),
+            PRIMARY KEY (TARGET_COLUMN, REFERENCE_HASH, RAW_NAME)
+        );""")
+        self.conn.commit()
+        cursor.close()
+
+    @staticmethod
+    def reference_hash(names_2):
+        return hashlib.sha1('\n'.join(sorted(names_2)).encode('utf-8')).hexdigest()
+
+    def lookup(self, target, names_2, names_1):
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT raw_name, canonical_name FROM {self.table} "
+                       "WHERE target_column = %s AND reference_hash = %s AND raw_name = ANY(%s);",
+                       (target, self.reference_hash(names_2), list(names_1)))
+        known = dict(cursor.fetchall())
+        cursor.close()
+        return known
+
+    def store(self, target, names_2, scored):
+        if not scored:
+            return
+        reference = self.reference_hash(names_2)
+        rows = [(target, reference, raw, match, float(ratio)) for raw, (match, ratio) in scored.items()]
+        cursor = self.conn.cursor()
+        extras.execute_values(cursor, f"INSERT INTO {self.table} "
+                              "(target_column, reference_hash, raw_name, canonical_name, confidence) VALUES %s "
+                              "ON CONFLICT DO NOTHING;", rows)
+        self.conn.commit()
+        cursor.close()
+
+    def resolve(self, target, raw_name):
+        # Most recent canonical name seen for a raw name, whatever the reference it was matched against
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(f"SELECT canonical_name FROM {self.table} WHERE target_column = %s AND raw_name = %s "
+                           "AND canonical_name <> 'None' ORDER BY updated_at DESC LIMIT 1;", (target, raw_name))
+            row = cursor.fetchone()
+        except psycopg2.errors.UndefinedTable:
+            # The pipeline has not built the alias table yet
+            self.conn.rollback()
+            row = None
+        cursor.close()
+        return row[0] if row else None
+
+
+def resolve_names(names_1, names_2, target, cache=None):
+    # Canonical name in names_2 of every name in names_1 ('None' if nothing matches). With a cache,
+    # every name of names_1 is in the alias table afterwards, matched against this reference.
+    if cache is None:
+        return best_matches(names_1, names_2)
+
+    # Only fuzzy match the names that were never matched against this reference
+    known = cache.lookup(target, names_2, names_1)
+    unseen = [name for name in names_1 if name not in known]
+    scored = score_matches(unseen, names_2)
+    cache.store(target, names_2, scored)
+    print(f"Entity resolution cache for {target}: {len(names_1) - len(unseen)} hits, {len(unseen)} misses")
+    return {name: known[name] if name in known else scored[name][0] for name in names_1}
+
+
+def entity(df1, df2, col1, col2, cache=None):
+    names_1 = df1[col1].unique()
+    names_2 = df2[col2].unique()
+    matching = resolve_names(names_1, names_2, col2, cache)
+
+    # Rewrite the column with a single vectorized lookup (canonical names always match themselves,
+    # so this is the same as replacing one key at a time)
+    df1[col1] = df1[col1].map(matching)
+    return df1, matching
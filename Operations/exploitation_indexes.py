@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Indexes of the exploitation zone tables for the prediction lookups and the dashboard filters
+#
+# barris_view is looked up by neighbourhood, one row per neighbourhood. housing_view is filtered by
+# districte or neighbourhood and a price range, so both are indexed with price as second column (the
+# equality column first), and price alone for the price range filters over the whole city.
+
+import time
+
+# (name, table, columns, unique)
+INDEXES = [
+    ('barris_view_neighbourhood_key', 'exploitation_zone.barris_view', 'neighbourhood', True),
+    ('housing_view_districte_price_idx', 'exploitation_zone.housing_view', 'districte, price', False),
+    ('housing_view_neighbourhood_price_idx', 'exploitation_zone.housing_view', 'neighbourhood, price', False),
+    ('housing_view_price_idx', 'exploitation_zone.housing_view', 'price', False),
+]
+
+
+def create_indexes(conn, indexes=INDEXES):
+    # Create the missing indexes and refresh the planner statistics of their tables, which were just loaded
+    tables = list(dict.fromkeys(table for _, table, _, _ in indexes))
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    for name, table, columns, unique in indexes:
+        cursor.execute("CREATE %sINDEX IF NOT EXISTS %s ON %s (%s);"
+                       % ('UNIQUE ' if unique else '', name, table, columns))
+    for table in tables:
+        cursor.execute("ANALYZE %s;" % table)
+    conn.commit()
+    cursor.close()
+    print("Indexes of %s ready in %.2fs" % (', '.join(tables), time.perf_counter() - start))
+
+
+def drop_indexes(cursor, indexes=INDEXES):
+    # Drop the indexes in the transaction of the cursor (to compare query plans before rolling it back)
+    for name, table, _, _ in indexes:
+        cursor.execute("DROP INDEX IF EXISTS %s.%s;" % (table.split('.')[0], name))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Precomputed encoder from flats to the dense feature rows expected by the model
+
+import os
+import numpy as np
+
+# Inputs copied as they are into the feature row
+NUMERIC_INPUTS = ['bathrooms', 'floor_elevator', 'rooms', 'sq_meters']
+
+# Prefixes of the building subtype, conservation state, district and neighbourhood dummies
+DUMMY_PREFIXES = ('bs_', 'cs_', 'd_', 'n_')
+
+
+def attribute_features(feature_order):
+    # Features of a model taken from barris_view: neither inputs nor dummies
+    return [feature for feature in feature_order
+            if not feature.startswith(DUMMY_PREFIXES) and feature not in NUMERIC_INPUTS]
+
+
+def barris_view_columns(feature_order):
+    # Columns of barris_view the encoder of a model reads
+    return ['districte', 'neighbourhood'] + attribute_features(feature_order)
+
+
+def encoder_path(pkl_filename):
+    # The encoder is saved alongside the model it was built for
+    return os.path.splitext(pkl_filename)[0] + '_encoder.npz'
+
+
+def level_codes(values, levels):
+    import pandas as pd
+    codes = pd.Categorical(values, categories=levels).codes
+    assert (codes >= 0).all(), "Unknown level of a categorical variable"
+    return codes
+
+
+class FeatureEncoder:
+    # Every categorical level is mapped to the index of its dummy column, and every neighbourhood to a
+    # precomputed row holding its barris_view attributes and its district and neighbourhood dummies.
+    # Building a feature row is then a copy of the neighbourhood row plus a few array fills.
+    # One extra sink column absorbs levels the model has no dummy for, so fills never need a branch.
+
+    def __init__(self, feature_order, neighbourhoods, neighbourhood_matrix, numeric_index,
+                 building_subtypes, building_subtype_index, conservation_states, conservation_state_index):
+        self.feature_order = list(feature_order)
+        self.n_features = len(self.feature_order)
+        self.neighbourhoods = list(neighbourhoods)
+        self.neighbourhood_rows = {name: row for row, name in enumerate(self.neighbourhoods)}
+        self.neighbourhood_matrix = np.asarray(neighbourhood_matrix, dtype=np.float64)
+        self.numeric_index = np.asarray(numeric_index)
+        self.building_subtypes = list(building_subtypes)
+        self.building_subtype_index = np.asarray(building_subtype_index)
+        self.conservation_states = list(conservation_states)
+        self.conservation_state_index = np.asarray(conservation_state_index)
+        self.building_subtype_lookup = dict(zip(self.building_subtypes, self.building_subtype_index))
+        self.conservation_state_lookup = dict(zip(self.conservation_states, self.conservation_state_index))
+
+    @classmethod
+    def build(cls, feature_order, barris_view, building_subtypes, conservation_states):
+        feature_order = list(feature_order)
+        barris_view = barris_view.drop_duplicates('neighbourhood')
+        # Every feature that is not a dummy must be an input or a barris_view attribute: a missing (or
+        # differently spelled) attribute would otherwise be left at zero in every feature row
+        missing = [feature for feature in attribute_features(feature_order) if feature not in barris_view.columns]
+        if missing:
+            raise ValueError(f"Features of the model missing from barris_view: {', '.join(missing)}")
+        index = {feature: i for i, feature in enumerate(feature_order)}
+        sink = len(feature_order)
+
+        def level_index(prefix, levels):
+            return [index.get(prefix + str(level), sink) for level in levels]
+
+        attributes = [col for col in barris_view.columns if col not in ('districte', 'neighbourhood')]
+        matrix = np.zeros((len(barris_view), sink + 1))
+        # Attributes the model does not use (e.g. crime variables) also go to the sink column
+        matrix[:, [index.get(col, sink) for col in attributes]] = barris_view[attributes].to_numpy(dtype=np.float64)
+        rows = np.arange(len(barris_view))
+        matrix[rows, level_index('d_', barris_view['districte'])] = 1
+        matrix[rows, level_index('n_', barris_view['neighbourhood'])] = 1
+
+        return cls(feature_order, barris_view['neighbourhood'], matrix,
+                   [index[col] for col in NUMERIC_INPUTS],
+                   building_subtypes, level_index('bs_', building_subtypes),
+                   conservation_states, level_index('cs_', conservation_states))
+
+    def save(self, path):
+        np.savez(path, feature_order=np.array(self.feature_order), neighbourhoods=np.array(self.neighbourhoods),
+                 neighbourhood_matrix=self.neighbourhood_matrix, numeric_index=self.numeric_index,
+                 building_subtypes=np.array(self.building_subtypes), building_subtype_index=self.building_subtype_index,
+                 conservation_states=np.array(self.conservation_states), conservation_state_index=self.conservation_state_index)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['feature_order'].tolist(), data['neighbourhoods'].tolist(), data['neighbourhood_matrix'],
+                       data['numeric_index'], data['building_subtypes'].tolist(), data['building_subtype_index'],
+                       data['conservation_states'].tolist(), data['conservation_state_index'])
+
+    def knows(self, neighbourhoods):
+        import pandas as pd
+        return pd.Series(neighbourhoods).isin(self.neighbourhoods).to_numpy()
+
+    def encode_one(self, flat, out=None):
+        # Feature row of a single validated flat (dict), written into out if given
+        if out is None:
+            out = np.empty(self.n_features + 1)
+        out[:] = self.neighbourhood_matrix[self.neighbourhood_rows[flat['neighbourhood']]]
+        out[self.numeric_index] = [flat[col] for col in NUMERIC_INPUTS]
+        out[self.building_subtype_lookup[flat['building_subtype']]] = 1
+        out[self.conservation_state_lookup[flat['conservation_state']]] = 1
+        return out[:self.n_features].reshape(1, -1)
+
+    def encode(self, flats, out=None):
+        # Feature matrix of a dataframe of validated flats, written into the first rows of out if given
+        n = len(flats)
+        if out is None:
+            out = np.empty((n, self.n_features + 1))
+        out = out[:n]
+        np.take(self.neighbourhood_matrix, level_codes(flats['neighbourhood'], self.neighbourhoods),
+                axis=0, out=out, mode='clip')
+        out[:, self.numeric_index] = flats[NUMERIC_INPUTS].to_numpy(dtype=np.float64)
+        rows = np.arange(n)
+        out[rows, self.building_subtype_index[level_codes(flats['building_subtype'], self.building_subtypes)]] = 1
+        out[rows, self.conservation_state_index[level_codes(flats['conservation_state'], self.conservation_states)]] = 1
+        return out[:, :self.n_features]
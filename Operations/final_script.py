@@ -3,21 +3,79 @@
 
 # Import libraries and packages
 import os
-import psycopg2
-import psycopg2.extras as extras
+import argparse
 import pandas as pd
 import numpy as np
 import pickle
-
-# Set connection with postgres database
-host = 'postgresfib.fib.upc.edu'
-dbname = 'ADSDBjordi.cluet'
-user = 'jordi.cluet'
-pwd = 'DB151199'
-port = 6433
-sslmode = 'require'
-
-conn = psycopg2.connect("host='{}' port={} dbname='{}' user={} password={}".format(host, port, dbname, user, pwd))
+from functools import partial
+from bulk_load import copy_dataframe, overwrite_dataframe, replace_dataframe, upsert_dataframe, load_query
+from bulk_load import BackgroundWriter, as_persisted
+from entity_resolution import entity, resolve_names, AliasCache
+from predictor import build_encoder
+from scoring_table import export as export_scoring_table, scoring_table_path
+from bulk_load import create_watermarks_table, get_high_water_mark, set_high_water_mark
+from bulk_load import read_csv_chunks, read_query, read_query_chunks, CHUNK_SIZE
+from stage_runner import StageRunner
+from db import database_dsn
+from cleaning import apply_rules
+from imputation import knn_impute
+from exploitation_indexes import create_indexes
+from reference_data import stamp_build
+from parquet_mirror import ParquetMirror, table_schema, table_columns
+from design_matrix import compact_view, design_matrix, with_categories, holdout_mask, CATEGORICAL
+from linear_fit import LeastSquaresRegression, fit_chunks
+from model_selection import select_model, write_leaderboard, leaderboard_path
+
+# Command line options
+parser = argparse.ArgumentParser(description="Load the housing data zones and train the rental price model.")
+parser.add_argument('--incremental', action='store_true',
+                    help="upsert only new or changed rows keyed on the housing ID instead of inserting everything "
+                         "(only the formatted zone load is incremental: the trusted zone step re-cleans the whole "
+                         "formatted table, as its outlier bounds and imputed values depend on every row)")
+parser.add_argument('--housing-table',
+                    help="name of the housing tables, by default that of the housing file (give successive extracts "
+                         "the same one to load them incrementally into the same tables)")
+parser.add_argument('--audit', action='store_true',
+                    help="re-read every zone table from the database before the next stage instead of handing it over in memory")
+parser.add_argument('--chunk-size', type=int,
+                    help="stream the housing file into the formatted zone this many rows at a time with compact dtypes "
+                         "(only that step is bounded: the trusted zone step still reads the formatted table back whole)")
+parser.add_argument('--imputation', choices=['exact', 'tree'], default='exact',
+                    help="sq_meters imputation: same values as KNNImputer, or KD-tree neighbours for large extracts")
+parser.add_argument('--imputation-workers', type=int, default=1,
+                    help="threads of the sq_meters imputation (-1 for every CPU)")
+parser.add_argument('--pushdown', action='store_true',
+                    help="build the exploitation zone views with joins inside the database instead of in memory")
+parser.add_argument('--mirror', metavar='DIR',
+                    help="also write every zone table as a Parquet dataset under this directory (needs pyarrow)")
+parser.add_argument('--design', choices=['dense', 'sparse'], default='dense',
+                    help="model design matrix: one-hot dataframe, or compact listings with a CSR matrix for large extracts")
+parser.add_argument('--out-of-core', action='store_true',
+                    help="train on housing_view streamed in chunks (of --chunk-size rows) from the Parquet mirror or the database")
+parser.add_argument('--training-workers', type=int, default=1,
+                    help="threads accumulating the chunks of out-of-core training")
+parser.add_argument('--select-model', action='store_true',
+                    help="choose the estimator and feature set by k-fold cross-validation and save a leaderboard")
+parser.add_argument('--folds', type=int, default=5, help="cross-validation folds of --select-model")
+parser.add_argument('--jobs', type=int, default=-1, help="worker processes of --select-model (-1 for every CPU)")
+parser.add_argument('--timings', metavar='FILE',
+                    help="write the stage timings, peak memory and query times of the run to this JSON file")
+parser.add_argument('--cache-dir', default='.pipeline_cache',
+                    help="directory of the stage checkpoints reused by the next runs when their inputs are unchanged")
+parser.add_argument('--no-cache', action='store_true',
+                    help="run every stage, e.g. after the zone tables were modified outside of this script")
+args = parser.parse_args()
+
+# Set connection with postgres database (settings from the environment or db.ini, see db.py)
+dsn = database_dsn()
+
+# Independent stages run concurrently, each one on a connection borrowed from the runner pool, and
+# stages whose inputs did not change since the last run reuse their checkpoint (the run options are
+# part of every checkpoint key)
+runner = StageRunner(dsn, cache_dir=None if args.no_cache else args.cache_dir,
+                     salt=repr(sorted((name, value) for name, value in vars(args).items()
+                                      if name not in ('cache_dir', 'no_cache', 'timings'))))
+conn = runner.pool.getconn()
 cursor = conn.cursor()
 
 
@@ -29,7 +87,7 @@ dist_surf_pop_file_path = input("Please write the path to the 'districtes' surfa
 crime_file_path = input("Please write the path to the district criminality file:\n")
 
 # Get file names
-housing_name = os.path.basename(housing_file_path).rsplit('.')[0]
+housing_name = args.housing_table or os.path.basename(housing_file_path).rsplit('.')[0]
 barris_dist_name = os.path.basename(barris_dist_file_path).rsplit('.')[0]
 dist_surf_pop_name = os.path.basename(dist_surf_pop_file_path).rsplit('.')[0]
 crime_name = os.path.basename(crime_file_path).rsplit('.')[0]
@@ -47,27 +105,79 @@ create_trusted_zone = """CREATE SCHEMA IF NOT EXISTS trusted_zone;"""
 cursor.execute(create_trusted_zone)
 conn.commit()
 
+# Keep track of the last extraction loaded from each source file
+if args.incremental:
+    create_watermarks_table(conn, 'formatted_zone')
+
+
+################################## Functions to load a dataframe into a zone table ##################################
+
+# Every loaded table is also written to the Parquet mirror if there is one (housing_view partitioned by district)
+mirror = ParquetMirror(args.mirror, partitions={'exploitation_zone.housing_view': ['districte']}) if args.mirror else None
+
+
+def load_table(conn, df, table, key=None, prune=False, append=False):
+    # Default mode: bulk insert replacing the rows of any previous run (or, to append, added to them)
+    if not args.incremental:
+        return copy_dataframe(conn, df, table) if append else overwrite_dataframe(conn, df, table)
+    # Incremental mode: upsert keyed tables and atomically replace small tables without key
+    if key is None:
+        return replace_dataframe(conn, df, table)
+    return upsert_dataframe(conn, df, table, key, prune=prune)
+
+
+def mirror_table(conn, sql_create, table):
+    # The whole table streamed from the database into its mirror
+    mirror.write_chunks(table, sql_create, read_query_chunks(conn, f"SELECT * from {table};"))
+
+
+def create_and_load(conn, sql_create, table, df, key=None, prune=False, on_loaded=None, append=False,
+                    mirrored=True):
+    # mirrored=False leaves the mirror to the caller (e.g. once all the chunks of a table are upserted)
+    cursor = conn.cursor()
+    cursor.execute(sql_create)
+    conn.commit()
+    cursor.close()
+    load_table(conn, df, table, key, prune, append)
+    if mirror is not None and mirrored:
+        # Same changes as the load: merged by key only where it upserts
+        upsert = args.incremental and key is not None and not prune
+        mirror.write(table, sql_create, df, key if upsert else None, append and not args.incremental)
+    if on_loaded is not None:
+        on_loaded(conn, df)
+
+
+def persist(sql_create, table, df, key=None, prune=False, on_loaded=None, part=None):
+    # Create the table and load the dataframe (or the part of a dict of dataframes) on a pooled connection
+    if part is not None:
+        df = df[part]
+    with runner.connection() as conn:
+        return create_and_load(conn, sql_create, table, df, key, prune, on_loaded)
 
-################################## Function to insert rows into table ##################################
 
-def execute_values(conn, df, table):
-  
-    tuples = [tuple(x) for x in df.to_numpy()]
-  
-    cols = ','.join(list(df.columns))
-    # SQL query to execute
-    query = "INSERT INTO %s(%s) VALUES %%s" % (table, cols)
+def persist_stage(name, sql_create, table, after, key=None, prune=False, on_loaded=None, part=None):
+    # Stage loading the dataframe returned by another stage; that dataframe must not be modified afterwards.
+    # Never checkpointed: its effect is the table, which may have been dropped or emptied since the last run.
+    load = partial(persist, sql_create, table, key=key, prune=prune, on_loaded=on_loaded, part=part)
+    return runner.add(name, load, after=[after], checkpoint=False)
+
+
+def create_and_load_query(conn, sql_create, table, query, params, cols, key=None, prune=False):
+    # Same as create_and_load, with the rows of a query run inside the database instead of a dataframe
     cursor = conn.cursor()
-    try:
-        extras.execute_values(cursor, query, tuples)
-        conn.commit()
-    except (Exception, psycopg2.DatabaseError) as error:
-        print("Error: %s" % error)
-        conn.rollback()
-        cursor.close()
-        return 1
-    print("The dataframe was correctly inserted")
+    cursor.execute(sql_create)
+    conn.commit()
     cursor.close()
+    load_query(conn, query, params, table, cols, incremental=args.incremental, key=key, prune=prune)
+    if mirror is not None:
+        # The rows were never in memory: the whole table is streamed into its mirror
+        mirror_table(conn, sql_create, table)
+
+
+def read_back(table, dtypes=None):
+    # Whole table streamed from a server-side cursor, so its rows are never all held as tuples
+    with runner.connection() as conn:
+        return read_query(conn, f"SELECT * from {table};", dtypes=dtypes)
 
 
 '''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
@@ -76,11 +186,31 @@ def execute_values(conn, df, table):
 
 ################################ Load housing table into formatted zone ################################
 
-# Read dataframe from CSV file
-df = pd.read_csv(housing_file_path)
+# In incremental mode only keep rows extracted after the last load into the housing table, whichever file
+# they came from (e.g. a new extract every month)
+if args.incremental:
+    housing_source = f'formatted_zone.{housing_name}'
+    high_water_mark = get_high_water_mark(conn, 'formatted_zone', housing_source, housing_name)
+
+
+def new_rows(df):
+    # Rows extracted after the high-water mark, with their extraction dates (also read as categories)
+    extraction_date = pd.to_datetime(df['extraction_date'].astype(object))
+    if high_water_mark is not None:
+        new = -(extraction_date <= pd.Timestamp(high_water_mark))
+        df, extraction_date = df[new], extraction_date[new]
+    return df, extraction_date
+
+
+def move_high_water_mark(conn, df):
+    # Move the high-water mark forward once the new rows are committed
+    mark = pd.to_datetime(df['extraction_date']).max()
+    if not pd.isna(mark):
+        set_high_water_mark(conn, 'formatted_zone', housing_source, housing_name, mark)
+
 
 # Create new table in PostgreSQL database
-sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{housing_name} (
+sqlFormattedHousing = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{housing_name} (
     ID INTEGER PRIMARY KEY,
     ADDRESS VARCHAR(80),
     BATHROOMS INTEGER,
@@ -100,134 +230,180 @@ sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{housing_name} (
     NEIGHBOURHOOD VARCHAR(45),
     NEIGHBOURHOOD_MEAN_PRICE FLOAT
 );"""
-cursor.execute(sqlCreateTable)
-conn.commit()
 
-execute_values(conn, df, f'formatted_zone.{housing_name}')
+# Compact dtypes of the housing file columns in streaming mode (the others are read as strings)
+housing_dtypes = {
+    'id': 'int64',
+    'bathrooms': 'Int8',
+    'building_subtype': 'category',
+    'building_type': 'category',
+    'conservation_state': 'Int8',
+    'extraction_date': 'category',
+    'discount': 'Int32',
+    'floor_elevator': 'Int8',
+    'is_new_construction': 'boolean',
+    'price': 'float32',
+    'real_estate': 'category',
+    'rooms': 'Int8',
+    'sq_meters': 'float32',
+    'neighbourhood': 'category',
+    'neighbourhood_mean_price': 'float32',
+}
+
+
+def read_housing():
+    if args.chunk_size is None:
+        # Read dataframe from CSV file
+        df = pd.read_csv(housing_file_path)
+        df.columns = df.columns.str.lower()
+        if args.incremental:
+            df, _ = new_rows(df)
+            print(f"{len(df)} new rows since last load of {housing_source}")
+        return df
+
+    # Streaming mode: each chunk is loaded in the background while the next one is read, and
+    # at most one chunk waits for the writer, so the memory of this step stays bounded whatever the file size.
+    # The trusted zone step is not streamed: its outlier bounds and KNN imputation need every row at once.
+    writer = BackgroundWriter(runner.pool.getconn())
+    rows, mark = 0, None
+    for df in read_csv_chunks(housing_file_path, housing_dtypes, args.chunk_size):
+        if args.incremental:
+            df, extraction_date = new_rows(df)
+            if extraction_date.notna().any():
+                mark = extraction_date.max() if mark is None else max(mark, extraction_date.max())
+        writer.wait()
+        # The first chunk replaces the rows of a previous run, the next ones are added to it (to the table and
+        # its mirror). Upserted chunks are mirrored at once at the end, rather than each merged into the mirror.
+        writer.submit(create_and_load, sqlFormattedHousing, f'formatted_zone.{housing_name}', df, key='id',
+                      append=rows > 0, mirrored=not args.incremental)
+        rows += len(df)
+    writer.wait()
+    print(f"{rows} rows streamed into formatted_zone.{housing_name}")
+    if args.incremental and mirror is not None:
+        mirror_table(writer.conn, sqlFormattedHousing, f'formatted_zone.{housing_name}')
+
+    # Move the high-water mark forward only if every chunk was committed (a failed chunk raised in wait)
+    if mark is not None:
+        set_high_water_mark(writer.conn, 'formatted_zone', housing_source, housing_name, mark)
+    writer.close(close_connection=False)
+    runner.pool.putconn(writer.conn)
+
+
+# Read the file and insert its rows into the formatted zone table (already done chunk by chunk in streaming mode).
+# Only the whole file read in default mode is checkpointed: new rows depend on the high-water mark in the database.
+runner.add('ingest housing', read_housing, files=[housing_file_path],
+           checkpoint=not args.incremental and args.chunk_size is None)
+if args.chunk_size is None:
+    persist_stage('format housing', sqlFormattedHousing, f'formatted_zone.{housing_name}', 'ingest housing', key='id',
+                  on_loaded=move_high_water_mark if args.incremental else None)
 
 
 ##################################### Format housing table for trusted zone #####################################
 
-#  Select whole table as dataframe
-sql = f"SELECT * from formatted_zone.{housing_name};"
-df = pd.read_sql_query(sql, conn)
-
-# Remove useless columns
-df = df.drop(['extraction_date', 'link'], axis = 1)  # useless columns
-
-# Correct some data types
-df['id'] = df['id'].astype("object")
-df['address'] = df['address'].astype("string")
-df['building_subtype'] = df['building_subtype'].astype("category")
-df['building_type'] = df['building_type'].astype("category")
-df['conservation_state'] = df['conservation_state'].astype("category")
-df['floor_elevator'] = df['floor_elevator'].astype("bool")
-df['real_estate'] = df['real_estate'].astype("category")
-df['real_estate_id'] = df['real_estate_id'].astype("object")
-df['neighbourhood'] = df['neighbourhood'].astype("category")
-
-# Remove duplicates
-df = df[-df.iloc[:, 1:].duplicated()]
-df = df.reset_index(drop=True)
-
-# Check levels of categorical variables
-
-# building_type
-df = df.drop(['building_type'], axis = 1)
-
-# conservation_state
-df['conservation_state'] = df['conservation_state'].replace({
-    0: 'New construction', 
-    1: 'Nearly new', 
-    2: 'Very good', 
-    3: 'Good', 
-    4: 'To renovate', 
-    8: 'Renovated'
-  })
-df['conservation_state'] = df['conservation_state'].astype("category")
-
-# is_new_construction
-df = df.drop(['is_new_construction'], axis = 1)
-
-# Define function to get outliers
-def get_outliers(var, factor):
-    Q1 = df[var].quantile(0.25)
-    Q3 = df[var].quantile(0.75)
-    IQR = Q3 - Q1
-    outliers = (df[var] < Q1-factor*IQR) | (df[var] > Q3+factor*IQR)
-    return outliers
-
-# Analysis, missing values and outliers of numerical variables
-
-# bathrooms
-outliers = get_outliers('bathrooms', 3)
-df = df[-outliers]
-
-# discount
-outliers = get_outliers('discount', 5)
-df = df[-outliers]
-
-# price
-extreme_outliers = df['price'] > 15000
-df = df[-extreme_outliers]
-outliers = get_outliers('price', 5)
-df = df[-outliers]
-
-# rooms
-outliers = get_outliers('rooms', 3)
-df = df[-outliers]
-
-# sq_meters
-outliers = get_outliers('sq_meters', 5)
-df = df[-outliers]
-
-df = df.reset_index(drop=True)
-little = df['sq_meters'] <= 15
-df.loc[little, 'sq_meters'] = np.nan
-
-# neighbourhood_mean_price
-aux = df.iloc[:,-2:].drop_duplicates().dropna()
-aux = aux.sort_values(by=['neighbourhood_mean_price'], ascending=False)
-aux = aux.reset_index(drop=True)
-
-# Missing values
-df = df.reset_index(drop=True)
-
-# Re-encode missing values
-df = df.replace('NaN', np.nan, regex=True)
-
-# Correct missings in neighbourhood
-indexes = df['neighbourhood'].isna()
-df['neighbourhood'] = df['neighbourhood'].astype("string")
-df.loc[indexes, "neighbourhood"] = df.loc[indexes, "address"]
-df['neighbourhood'] = df['neighbourhood'].astype("category")
-
-# Remove 4 rows with missing price (since it is the target)
-df = df[-df['price'].isna()]
-
-# Impute missings in sq_meters using KNN method
-df = df.reset_index(drop=True)
-
-from sklearn.impute import KNNImputer
-imputer = KNNImputer(n_neighbors=5, weights="uniform")
-
-newData = df.select_dtypes('number').iloc[:,1:]
-newData = pd.DataFrame(imputer.fit_transform(newData), columns=newData.columns)
-
-df['sq_meters'] = newData['sq_meters'].copy()
-
-# Remove outliers on price_per_sqm
-df['price_per_sqm'] = df['price'] / df['sq_meters']
-extreme_outliers = df['price_per_sqm'] > 60
-
-df = df[-extreme_outliers]
-df = df.reset_index(drop=True)
+# Outliers of the numerical variables of the housing table, removed in this order
+housing_outlier_rules = [
+    ('bathrooms', 'iqr', 3),
+    ('discount', 'iqr', 5),
+    ('price', 'max', 15000),  # extreme outliers
+    ('price', 'iqr', 5),
+    ('rooms', 'iqr', 3),
+    ('sq_meters', 'iqr', 5),
+]
+
+
+def trust_housing(df, *loaded, outlier_rules):
+    # Hand the dataframe over in memory, or select whole table back from the formatted zone on the
+    # audit path, in incremental mode (where only the new rows were read from the file) and in streaming mode
+    if reread_formatted_housing:
+        df = read_back(f'formatted_zone.{housing_name}')
+    else:
+        df = as_persisted(df)
+
+    # Remove useless columns
+    df = df.drop(['extraction_date', 'link'], axis = 1)  # useless columns
+
+    # Correct some data types
+    df['id'] = df['id'].astype("object")
+    df['address'] = df['address'].astype("string")
+    df['building_subtype'] = df['building_subtype'].astype("category")
+    df['building_type'] = df['building_type'].astype("category")
+    df['conservation_state'] = df['conservation_state'].astype("category")
+    df['floor_elevator'] = df['floor_elevator'].astype("bool")
+    df['real_estate'] = df['real_estate'].astype("category")
+    df['real_estate_id'] = df['real_estate_id'].astype("object")
+    df['neighbourhood'] = df['neighbourhood'].astype("category")
+
+    # Remove duplicates
+    df = df[-df.iloc[:, 1:].duplicated()]
+    df = df.reset_index(drop=True)
+
+    # Check levels of categorical variables
+
+    # building_type
+    df = df.drop(['building_type'], axis = 1)
+
+    # conservation_state
+    df['conservation_state'] = df['conservation_state'].astype(object).replace({
+        0: 'New construction', 
+        1: 'Nearly new', 
+        2: 'Very good', 
+        3: 'Good', 
+        4: 'To renovate', 
+        8: 'Renovated'
+      })
+    df['conservation_state'] = df['conservation_state'].astype("category")
+
+    # is_new_construction
+    df = df.drop(['is_new_construction'], axis = 1)
+
+    # Analysis, missing values and outliers of numerical variables, all removed with a single copy
+    with runner.step('trust housing', 'clean'):
+        df = apply_rules(df, outlier_rules)
+
+    df = df.reset_index(drop=True)
+    little = df['sq_meters'] <= 15
+    df.loc[little, 'sq_meters'] = np.nan
+
+    # neighbourhood_mean_price
+    aux = df.iloc[:,-2:].drop_duplicates().dropna()
+    aux = aux.sort_values(by=['neighbourhood_mean_price'], ascending=False)
+    aux = aux.reset_index(drop=True)
+
+    # Missing values
+    df = df.reset_index(drop=True)
+
+    # Re-encode missing values
+    df = df.replace('NaN', np.nan, regex=True)
+
+    # Correct missings in neighbourhood
+    indexes = df['neighbourhood'].isna()
+    df['neighbourhood'] = df['neighbourhood'].astype("string")
+    df.loc[indexes, "neighbourhood"] = df.loc[indexes, "address"]
+    df['neighbourhood'] = df['neighbourhood'].astype("category")
+
+    # Remove 4 rows with missing price (since it is the target)
+    df = df[-df['price'].isna()]
+
+    # Impute missings in sq_meters using KNN method, computing distances for the rows to impute only
+    df = df.reset_index(drop=True)
+
+    newData = df.select_dtypes('number').iloc[:,1:]
+    with runner.step('trust housing', 'knn impute'):
+        df['sq_meters'] = knn_impute(newData, 'sq_meters', n_neighbors=5, method=args.imputation, workers=args.imputation_workers)
+
+    # Remove outliers on price_per_sqm
+    df['price_per_sqm'] = df['price'] / df['sq_meters']
+    extreme_outliers = df['price_per_sqm'] > 60
+
+    df = df[-extreme_outliers]
+    df = df.reset_index(drop=True)
+    return df
 
 
 ################################ Load new housing table into trusted zone ################################
 
-# Create new table in PostgreSQL database
-sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS trusted_zone.{housing_name} (
+# Create new table in PostgreSQL database (a missing neighbourhood is replaced by the address, hence its width)
+sqlTrustedHousing = f"""CREATE TABLE IF NOT EXISTS trusted_zone.{housing_name} (
     ID INTEGER PRIMARY KEY,
     ADDRESS VARCHAR(80),
     BATHROOMS INTEGER,
@@ -240,21 +416,31 @@ sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS trusted_zone.{housing_name} (
     REAL_ESTATE_ID VARCHAR(20),
     ROOMS INTEGER,
     SQ_METERS FLOAT,
-    NEIGHBOURHOOD VARCHAR(45),
+    NEIGHBOURHOOD VARCHAR(80),
     NEIGHBOURHOOD_MEAN_PRICE FLOAT,
     PRICE_PER_SQM FLOAT
 );"""
-cursor.execute(sqlCreateTable)
+
+# Tables created by earlier runs keep the narrower NEIGHBOURHOOD column of their time (filled from the address)
+cursor.execute(f"ALTER TABLE IF EXISTS trusted_zone.{housing_name} ALTER COLUMN NEIGHBOURHOOD TYPE VARCHAR(80);")
 conn.commit()
 
-# Insert rows into table
-execute_values(conn, df, f'trusted_zone.{housing_name}')
+# Clean the housing table and insert its rows into the trusted zone table. The table read back from
+# the formatted zone is not an input of the checkpoint key, so it is only checkpointed when handed over in memory.
+# In streaming mode the table is already loaded by the ingestion stage, which has no separate load stage.
+reread_formatted_housing = args.audit or args.incremental or args.chunk_size is not None
+formatted_housing_loaded = ['format housing'] if (args.audit or args.incremental) and args.chunk_size is None else []
+runner.add('trust housing', partial(trust_housing, outlier_rules=housing_outlier_rules),
+           after=['ingest housing'] + formatted_housing_loaded,
+           checkpoint=not reread_formatted_housing)
+persist_stage('load trusted housing', sqlTrustedHousing, f'trusted_zone.{housing_name}', 'trust housing',
+              key='id', prune=True)
 
 
 ################################ Load barris-districtes table into formatted zone ################################
 
 # Read dataframe from CSV file
-df = pd.read_csv(barris_dist_file_path)
+runner.add('ingest barris', partial(pd.read_csv, barris_dist_file_path), files=[barris_dist_file_path])
 
 # Create new table in PostgreSQL database
 sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{barris_dist_name} (
@@ -262,11 +448,9 @@ sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{barris_dist_name
     NOM_DISTRICTE VARCHAR(50),
     CODI_BARRI INTEGER,
     NOM_BARRI VARCHAR(50));"""
-cursor.execute(sqlCreateTable)
-conn.commit()
 
-# Insert rows into table
-execute_values(conn, df, f'formatted_zone.{barris_dist_name}')
+# Insert rows into table in the background
+persist_stage('format barris', sqlCreateTable, f'formatted_zone.{barris_dist_name}', 'ingest barris')
 
 
 ################################ Load barris-districtes table into trusted zone ################################
@@ -278,20 +462,26 @@ sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS trusted_zone.{barris_dist_name}
     NOM_DISTRICTE VARCHAR(50),
     CODI_BARRI INTEGER,
     NOM_BARRI VARCHAR(50));"""
-cursor.execute(sqlCreateTable)
-conn.commit()
 
-# Insert rows into table
-execute_values(conn, df, f'trusted_zone.{barris_dist_name}')
+# Insert rows into table in the background
+persist_stage('trust barris', sqlCreateTable, f'trusted_zone.{barris_dist_name}', 'ingest barris')
 
 
 ################################ Load crime table into formatted zone ################################
 
-# Read dataframe from CSV file
-df = pd.read_excel(crime_file_path)
+crime_columns = ['Districte', 'Furt', 'Estafes', 'Danys', 'Rob_viol_intim', 'Rob_en_vehicle', 'Rob_força', 'Lesions', 'Aprop_indeg', 'Amenaces', 'Rob_de_vehicle', 'Ocupacions', 'Salut_pub', 'Abusos_sex', 'Entrada_domicili', 'Agressio_sex', 'Conviv_veinal', 'Vigilancia_poli', 'Molesties_espai_pub', 'Contra_prop_priv', 'Incendis', 'Estupefaents', 'Agressions', 'Proves_alcohol','Proves_droga']
+
+
+def read_crime():
+    # Read dataframe from Excel file
+    df = pd.read_excel(crime_file_path)
 
-# Rename columns
-df.columns = ['Districte', 'Furt', 'Estafes', 'Danys', 'Rob_viol_intim', 'Rob_en_vehicle', 'Rob_força', 'Lesions', 'Aprop_indeg', 'Amenaces', 'Rob_de_vehicle', 'Ocupacions', 'Salut_pub', 'Abusos_sex', 'Entrada_domicili', 'Agressio_sex', 'Conviv_veinal', 'Vigilancia_poli', 'Molesties_espai_pub', 'Contra_prop_priv', 'Incendis', 'Estupefaents', 'Agressions', 'Proves_alcohol','Proves_droga']
+    # Rename columns
+    df.columns = crime_columns
+    return df
+
+
+runner.add('ingest crime', read_crime, files=[crime_file_path])
 
 # Create new table in PostgreSQL database
 sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{crime_name} (
@@ -321,11 +511,9 @@ sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{crime_name} (
     PROVES_ALCOHOL INTEGER,
     PROVES_DROGA INTEGER
 );"""
-cursor.execute(sqlCreateTable)
-conn.commit()
 
-# Insert rows into table
-execute_values(conn, df, f'formatted_zone.{crime_name}')
+# Insert rows into table in the background
+persist_stage('format crime', sqlCreateTable, f'formatted_zone.{crime_name}', 'ingest crime')
 
 
 ################################ Load crime table into trusted zone ################################
@@ -359,20 +547,23 @@ sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS trusted_zone.{crime_name} (
     PROVES_ALCOHOL INTEGER,
     PROVES_DROGA INTEGER
 );"""
-cursor.execute(sqlCreateTable)
-conn.commit()
 
-# Insert rows into table
-execute_values(conn, df, f'trusted_zone.{crime_name}')
+# Insert rows into table in the background
+persist_stage('trust crime', sqlCreateTable, f'trusted_zone.{crime_name}', 'ingest crime')
 
 
 ################### Load district population and surface table into formatted zone ###################
 
-# Read dataframe from CSV file
-df = pd.read_excel(dist_surf_pop_file_path)
+def read_districts():
+    # Read dataframe from Excel file
+    df = pd.read_excel(dist_surf_pop_file_path)
+
+    # Rename columns
+    df.columns = ['Districte', 'Superficie', 'Poblacio']
+    return df
 
-# Rename columns
-df.columns = ['Districte', 'Superficie', 'Poblacio']
+
+runner.add('ingest districts', read_districts, files=[dist_surf_pop_file_path])
 
 # Create new table in PostgreSQL database
 sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{dist_surf_pop_name} (
@@ -380,11 +571,9 @@ sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS formatted_zone.{dist_surf_pop_na
     SUPERFICIE FLOAT,
     POBLACIO INTEGER
 );"""
-cursor.execute(sqlCreateTable)
-conn.commit()
 
-# Insert rows into table
-execute_values(conn, df, f'formatted_zone.{dist_surf_pop_name}')
+# Insert rows into table in the background
+persist_stage('format districts', sqlCreateTable, f'formatted_zone.{dist_surf_pop_name}', 'ingest districts')
 
 
 ################### Load district population and surface table into trusted zone ###################
@@ -396,69 +585,117 @@ sqlCreateTable = f"""CREATE TABLE IF NOT EXISTS trusted_zone.{dist_surf_pop_name
     SUPERFICIE FLOAT,
     POBLACIO INTEGER
 );"""
-cursor.execute(sqlCreateTable)
-conn.commit()
 
-execute_values(conn, df, f'trusted_zone.{dist_surf_pop_name}')
+# Insert rows into table in the background
+persist_stage('trust districts', sqlCreateTable, f'trusted_zone.{dist_surf_pop_name}', 'ingest districts')
 
 
 ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 ''''''''''''''''''''''''''''''' DATA INTEGRATION '''''''''''''''''''''''''''''''''''''
 ''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
-# Read all tables from trusted zone
-sql = f"SELECT * from trusted_zone.{housing_name};"
-housing = pd.read_sql_query(sql, conn)
-
-sql = f"SELECT * from trusted_zone.{crime_name};"
-crime = pd.read_sql_query(sql, conn)
-
-sql = f"SELECT * from trusted_zone.{barris_dist_name};"
-barris = pd.read_sql_query(sql, conn)
-
-sql = f"SELECT * from trusted_zone.{dist_surf_pop_name};"
-districts = pd.read_sql_query(sql, conn)
-
-
-# Methods for entity resolution
-
-from difflib import SequenceMatcher
-
-def similar(a, b):
-    return SequenceMatcher(None, a, b).ratio()
-
-def entity(df1,df2,col1,col2):
-    names_1 = df1[col1].unique()
-    names_2 = df2[col2].unique()
-
-    matching = {}
-    for name in names_1:
-        best = 0
-        best_name = 'None'
-        for name1 in names_2:
-            distance = similar(name,name1)
-            if distance > best:
-                best = distance
-                best_name = name1
-        matching[name] = best_name
-
-    for key in matching:
-        df1.loc[df1[col1] == key, col1] = matching[key]
-    return df1, matching
-
-# Entity resolution
-housing, matching = entity(housing,barris,'neighbourhood','nom_barri')
-crime, matching2 = entity(crime,barris,'districte','nom_districte')
-districts, matching3 = entity(districts,barris,'districte','nom_districte')
-
-# Integrate datasets
-barris = barris.rename(columns={"nom_barri": "neighbourhood",'nom_districte':'districte'})
-housing = pd.merge(housing,barris,on='neighbourhood')
-housing = pd.merge(housing,districts,on='districte')
-housing = pd.merge(housing,crime,on='districte')
-
-# Remove useless columns for analysis
-housing.drop(['codi_barri', 'codi_districte', 'address', 'real_estate', 'real_estate_id', 'neighbourhood_mean_price'], axis=1, inplace=True)
+def integrate(housing, barris, crime, districts, *loaded):
+    # Read all tables back from trusted zone on the audit path (otherwise they are handed over in memory)
+    if args.audit:
+        housing = read_back(f'trusted_zone.{housing_name}')
+        crime = read_back(f'trusted_zone.{crime_name}')
+        barris = read_back(f'trusted_zone.{barris_dist_name}')
+        districts = read_back(f'trusted_zone.{dist_surf_pop_name}')
+    else:
+        housing, barris, crime, districts = (as_persisted(df) for df in (housing, barris, crime, districts))
+
+    # Entity resolution, reusing the matches of previous runs stored in the alias table
+    with runner.connection() as conn, runner.step('integrate', 'entity resolution'):
+        alias_cache = AliasCache(conn)
+        alias_cache.create_table()
+        housing, matching = entity(housing,barris,'neighbourhood','nom_barri',cache=alias_cache)
+        crime, matching2 = entity(crime,barris,'districte','nom_districte',cache=alias_cache)
+        districts, matching3 = entity(districts,barris,'districte','nom_districte',cache=alias_cache)
+
+    # Integrate datasets
+    barris = barris.rename(columns={"nom_barri": "neighbourhood",'nom_districte':'districte'})
+    with runner.step('integrate', 'merge'):
+        housing = pd.merge(housing,barris,on='neighbourhood')
+        housing = pd.merge(housing,districts,on='districte')
+        housing = pd.merge(housing,crime,on='districte')
+
+    # Remove useless columns for analysis
+    housing.drop(['codi_barri', 'codi_districte', 'address', 'real_estate', 'real_estate_id', 'neighbourhood_mean_price'], axis=1, inplace=True)
+
+    # Full neighbourhood data for the prediction script: merge barris, districtes and crime tables
+    barris_dist = pd.merge(barris, districts, on='districte')
+    barris_dist_crime = pd.merge(barris_dist, crime, on='districte')
+
+    # Drop unuseful columns
+    barris_dist_crime.drop(['codi_barri', 'codi_districte'], axis=1, inplace=True)
+    return {'housing_view': housing, 'barris_view': barris_dist_crime}
+
+
+def distinct_names(conn, table, col):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT DISTINCT {col} FROM {table} WHERE {col} IS NOT NULL;")
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return names
+
+
+def integrate_in_database(*loaded):
+    # Pushdown mode: entity resolution of the distinct raw names only, whose matches are all stored in the
+    # alias table, then both views are built by joins on that table inside the database, so the trusted
+    # tables never pass through this process
+    with runner.connection() as conn:
+        alias_cache = AliasCache(conn)
+        alias_cache.create_table()
+        barris_names = distinct_names(conn, f'trusted_zone.{barris_dist_name}', 'nom_barri')
+        districte_names = distinct_names(conn, f'trusted_zone.{barris_dist_name}', 'nom_districte')
+        resolve_names(distinct_names(conn, f'trusted_zone.{housing_name}', 'neighbourhood'), barris_names,
+                      'nom_barri', alias_cache)
+        resolve_names(distinct_names(conn, f'trusted_zone.{crime_name}', 'districte'), districte_names,
+                      'nom_districte', alias_cache)
+        resolve_names(distinct_names(conn, f'trusted_zone.{dist_surf_pop_name}', 'districte'), districte_names,
+                      'nom_districte', alias_cache)
+        params = {'barris_reference': AliasCache.reference_hash(barris_names),
+                  'districtes_reference': AliasCache.reference_hash(districte_names)}
+
+        # Crime and district tables with their canonical district names
+        crime = ', '.join('c.' + col.upper() for col in crime_columns[1:])
+        canonical = f"""WITH districts AS (
+            SELECT a.canonical_name AS districte, d.superficie, d.poblacio
+            FROM trusted_zone.{dist_surf_pop_name} d
+            JOIN {alias_cache.table} a ON a.target_column = 'nom_districte'
+                AND a.reference_hash = %(districtes_reference)s AND a.raw_name = d.districte
+        ), crime AS (
+            SELECT a.canonical_name AS districte, {crime}
+            FROM trusted_zone.{crime_name} c
+            JOIN {alias_cache.table} a ON a.target_column = 'nom_districte'
+                AND a.reference_hash = %(districtes_reference)s AND a.raw_name = c.districte
+        )"""
+
+        housing_view = f"""{canonical}
+        SELECT h.id, h.bathrooms, h.building_subtype, h.conservation_state, h.discount, h.floor_elevator,
+               h.price, h.rooms, h.sq_meters, b.nom_barri AS neighbourhood, h.price_per_sqm,
+               b.nom_districte AS districte, d.superficie, d.poblacio, {crime}
+        FROM trusted_zone.{housing_name} h
+        JOIN {alias_cache.table} a ON a.target_column = 'nom_barri'
+            AND a.reference_hash = %(barris_reference)s AND a.raw_name = h.neighbourhood
+        JOIN trusted_zone.{barris_dist_name} b ON b.nom_barri = a.canonical_name
+        JOIN districts d ON d.districte = b.nom_districte
+        JOIN crime c ON c.districte = b.nom_districte;"""
+        housing_view_columns = ['ID', 'BATHROOMS', 'BUILDING_SUBTYPE', 'CONSERVATION_STATE', 'DISCOUNT',
+                                'FLOOR_ELEVATOR', 'PRICE', 'ROOMS', 'SQ_METERS', 'NEIGHBOURHOOD', 'PRICE_PER_SQM',
+                                'DISTRICTE', 'SUPERFICIE', 'POBLACIO'] + [col.upper() for col in crime_columns[1:]]
+        create_and_load_query(conn, sqlHousingView, 'exploitation_zone.housing_view', housing_view, params,
+                              housing_view_columns, key='id', prune=True)
+
+        barris_view = f"""{canonical}
+        SELECT b.nom_districte AS districte, b.nom_barri AS neighbourhood, d.superficie, d.poblacio, {crime}
+        FROM trusted_zone.{barris_dist_name} b
+        JOIN districts d ON d.districte = b.nom_districte
+        JOIN crime c ON c.districte = b.nom_districte;"""
+        barris_view_columns = ['DISTRICTE', 'NEIGHBOURHOOD', 'SUPERFICIE', 'POBLACIO'] + \
+                              [col.upper() for col in crime_columns[1:]]
+        create_and_load_query(conn, sqlBarrisView, 'exploitation_zone.barris_view', barris_view, params,
+                              barris_view_columns)
 
 
 ####################### Load integrated table into exploitation zone #######################
@@ -469,7 +706,7 @@ cursor.execute(create_exploitation_zone)
 conn.commit()
 
 # Create new table in PostgreSQL database
-sqlCreateTable = """CREATE TABLE IF NOT EXISTS exploitation_zone.housing_view (
+sqlHousingView = """CREATE TABLE IF NOT EXISTS exploitation_zone.housing_view (
     ID INTEGER PRIMARY KEY,
     BATHROOMS INTEGER,
     BUILDING_SUBTYPE VARCHAR(30),
@@ -509,24 +746,12 @@ sqlCreateTable = """CREATE TABLE IF NOT EXISTS exploitation_zone.housing_view (
     PROVES_ALCOHOL INTEGER,
     PROVES_DROGA INTEGER
 );"""
-cursor.execute(sqlCreateTable)
-conn.commit()
-
-# Insert rows into table
-execute_values(conn, housing, 'exploitation_zone.housing_view')
 
 
 ############## Save dataframe with full neighbourhood data for prediction script ##############
 
-# Merge barris, districtes and crime tables
-barris_dist = pd.merge(barris, districts, on='districte')
-barris_dist_crime = pd.merge(barris_dist, crime, on='districte')
-
-# Drop unuseful columns
-barris_dist_crime.drop(['codi_barri', 'codi_districte'], axis=1, inplace=True)
-
 # Create new table in PostgreSQL database
-sqlCreateTable = """CREATE TABLE IF NOT EXISTS exploitation_zone.barris_view (
+sqlBarrisView = """CREATE TABLE IF NOT EXISTS exploitation_zone.barris_view (
     DISTRICTE VARCHAR(50),
     NEIGHBOURHOOD VARCHAR(45),
     SUPERFICIE FLOAT,
@@ -556,48 +781,188 @@ sqlCreateTable = """CREATE TABLE IF NOT EXISTS exploitation_zone.barris_view (
     PROVES_ALCOHOL INTEGER,
     PROVES_DROGA INTEGER
 );"""
-cursor.execute(sqlCreateTable)
-conn.commit()
-
-# Insert rows into table
-execute_values(conn, barris_dist_crime, 'exploitation_zone.barris_view')
-
-
-'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
-'''''''''''''''''''''''''''''''''' MODELLING ''''''''''''''''''''''''''''''''''''''''''
-'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
-# Select integrated table from exploitation zone
-sql = "SELECT * from exploitation_zone.housing_view;"
-df = pd.read_sql_query(sql, conn)
+# Integration starts once the four sources are read, formatted and loaded. In pushdown mode it loads both
+# views itself from the trusted tables, otherwise they are integrated in memory and inserted in the background
+# (the tables read back from the database are not inputs of the checkpoint key, so integration is then always run)
+trusted = ['load trusted housing', 'trust barris', 'trust crime', 'trust districts']
+if args.pushdown:
+    runner.add('integrate', integrate_in_database, after=trusted, checkpoint=False)
+else:
+    runner.add('integrate', integrate,
+               after=['trust housing', 'ingest barris', 'ingest crime', 'ingest districts'] + trusted,
+               checkpoint=not args.audit)
+    persist_stage('exploit housing_view', sqlHousingView, 'exploitation_zone.housing_view', 'integrate',
+                  key='id', prune=True, part='housing_view')
+    persist_stage('exploit barris_view', sqlBarrisView, 'exploitation_zone.barris_view', 'integrate',
+                  part='barris_view')
 
-# Feature engineering
 
-# Remove some variables that are not useful for our modelling
-df.drop(['id', 'price_per_sqm', 'discount'], axis=1, inplace=True)
+def index_exploitation(*loaded):
+    with runner.connection() as conn:
+        create_indexes(conn)
+        stamp_build(conn)
 
-#  One-hot enconding of some variables
-ohe_bs = pd.get_dummies(df.building_subtype, prefix='bs')
-ohe_cs = pd.get_dummies(df.conservation_state, prefix='cs')
-ohe_d = pd.get_dummies(df.districte, prefix='d')
-ohe_n = pd.get_dummies(df.neighbourhood, prefix='n')
-df = pd.concat([df, ohe_bs, ohe_cs, ohe_d, ohe_n], axis=1)
-df.drop(['building_subtype', 'conservation_state', 'districte', 'neighbourhood'], axis=1, inplace=True)
 
-# Dataframe with crime variables, with district, with neighbourhood (i.e. with everything)
-df_neigh = df
+# Index the loaded views for the prediction lookups and the dashboard filters, analyze them and stamp the
+# rebuild, which empties the neighbourhood caches of the prediction scripts. Never checkpointed, as statistics
+# must be refreshed after every load (existing indexes are kept as they are).
+runner.add('index exploitation', index_exploitation,
+           after=['integrate'] if args.pushdown else ['exploit housing_view', 'exploit barris_view'],
+           checkpoint=False)
 
-# Divide between train and validation sets
-from sklearn.model_selection import train_test_split
-X = df_neigh.drop('price', axis=1)
-y = df_neigh['price']
-X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
 
-# Linear regression model
-from sklearn.linear_model import LinearRegression
-reg = LinearRegression().fit(X_train, y_train)
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
+'''''''''''''''''''''''''''''''''' MODELLING ''''''''''''''''''''''''''''''''''''''''''
+'''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''''
 
-# Save model in pickle file
+# Model and exported files
 pkl_filename = "./model.pkl"
-with open(pkl_filename, 'wb') as file:
-    pickle.dump(reg, file)
+
+# Categorical columns of housing_view read back from the database, one-hot encoded below
+housing_view_dtypes = {'building_subtype': 'category', 'conservation_state': 'category',
+                       'districte': 'category', 'neighbourhood': 'category'}
+
+# Columns of housing_view not used by the model
+unused_columns = ['id', 'price_per_sqm', 'discount']
+
+# Columns of housing_view with the same value for every listing of a district
+district_columns = ['superficie', 'poblacio'] + [col.lower() for col in crime_columns[1:]]
+
+
+def modelling_frame(integrated):
+    # Select integrated tables from exploitation zone on the audit path and in pushdown mode (where they
+    # were never in memory), otherwise use them from memory
+    if args.pushdown and mirror is not None:
+        # Local read of the modelling columns only
+        df = mirror.read('exploitation_zone.housing_view',
+                         columns=[col for col in table_schema(sqlHousingView).names if col not in unused_columns])
+    elif args.audit or args.pushdown:
+        df = read_back('exploitation_zone.housing_view', dtypes=housing_view_dtypes)
+    else:
+        df = as_persisted(integrated['housing_view'])
+
+    # Feature engineering
+
+    # Remove some variables that are not useful for our modelling
+    df.drop(unused_columns, axis=1, inplace=True, errors='ignore')
+    return df
+
+
+def train_in_memory(integrated):
+    df = modelling_frame(integrated)
+
+    if args.design == 'sparse':
+        # District columns kept once per district and listings with category codes, from which the
+        # one-hot design matrix is built as a CSR matrix (with the columns of the dense encoding below)
+        listings, districts = compact_view(df, [col for col in df.columns if col.lower() in district_columns])
+        del df
+        X, feature_order = design_matrix(listings, districts, list(districts.columns[1:]))
+        y = listings['price'].to_numpy()
+        del listings
+
+        # Divide between train and validation sets
+        from sklearn.model_selection import train_test_split
+        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+
+        # Linear regression model, fitted from the normal equations (same fitted values as LinearRegression)
+        reg = LeastSquaresRegression().fit(X_train, y_train)
+    else:
+        #  One-hot enconding of some variables
+        ohe_bs = pd.get_dummies(df.building_subtype, prefix='bs')
+        ohe_cs = pd.get_dummies(df.conservation_state, prefix='cs')
+        ohe_d = pd.get_dummies(df.districte, prefix='d')
+        ohe_n = pd.get_dummies(df.neighbourhood, prefix='n')
+        df = pd.concat([df, ohe_bs, ohe_cs, ohe_d, ohe_n], axis=1)
+        df.drop(['building_subtype', 'conservation_state', 'districte', 'neighbourhood'], axis=1, inplace=True)
+
+        # Dataframe with crime variables, with district, with neighbourhood (i.e. with everything)
+        df_neigh = df
+
+        # Divide between train and validation sets
+        from sklearn.model_selection import train_test_split
+        X = df_neigh.drop('price', axis=1)
+        y = df_neigh['price']
+        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+
+        # Linear regression model
+        from sklearn.linear_model import LinearRegression
+        reg = LinearRegression().fit(X_train, y_train)
+        feature_order = list(X.columns)
+    return reg, feature_order
+
+
+def train_out_of_core():
+    # Stream the modelling columns of housing_view (with the IDs choosing the validation rows) from the Parquet
+    # mirror or the database, encode every chunk into a CSR matrix with the levels of the whole table, and
+    # accumulate the normal equations of the chunks on worker threads, so memory is bounded by the chunk size
+    table = 'exploitation_zone.housing_view'
+    columns = [col for col in table_columns(sqlHousingView) if col == 'id' or col not in unused_columns]
+    chunk_size = args.chunk_size or CHUNK_SIZE
+
+    def encode(chunk):
+        chunk = with_categories(chunk[~holdout_mask(chunk['id'])].drop(columns=['id']), vocabulary)
+        listings, districts = compact_view(chunk, [col for col in chunk.columns if col.lower() in district_columns])
+        X, feature_order = design_matrix(listings, districts, list(districts.columns[1:]))
+        return X, listings['price'].to_numpy(), feature_order
+
+    with runner.connection() as conn:
+        if mirror is not None:
+            vocabulary = {col: sorted(mirror.values(table, col)) for col in CATEGORICAL}
+            chunks = mirror.batches(table, columns, chunk_size)
+        else:
+            vocabulary = {col: sorted(distinct_names(conn, table, col)) for col in CATEGORICAL}
+            # Upper case names, folded by PostgreSQL as in the CREATE TABLE statement
+            chunks = read_query_chunks(conn, f"SELECT {', '.join(col.upper() for col in columns)} FROM {table};",
+                                       chunk_size=chunk_size)
+        return fit_chunks(chunks, encode, workers=args.training_workers)
+
+
+def train_selected(integrated):
+    # Cross-validate every candidate estimator and feature set on the CSR design matrix of all the
+    # listings, then refit the best one on all of them
+    df = modelling_frame(integrated)
+    listings, districts = compact_view(df, [col for col in df.columns if col.lower() in district_columns])
+    del df
+    X, names = design_matrix(listings, districts, list(districts.columns[1:]))
+    y = listings['price'].to_numpy()
+    del listings
+    leaderboard, reg, feature_order = select_model(X, y, names, district_columns[2:], folds=args.folds,
+                                                   n_jobs=args.jobs)
+    write_leaderboard(leaderboard, leaderboard_path(pkl_filename))
+    return reg, feature_order
+
+
+def train(integrated, *loaded):
+    if args.pushdown:
+        barris_view = (read_back('exploitation_zone.barris_view') if mirror is None
+                       else mirror.read('exploitation_zone.barris_view'))
+    else:
+        barris_view = integrated['barris_view']
+
+    if args.select_model:
+        reg, feature_order = train_selected(integrated)
+    elif args.out_of_core:
+        reg, feature_order = train_out_of_core()
+    else:
+        reg, feature_order = train_in_memory(integrated)
+
+    # Save model in pickle file, with its feature order as prediction.py reads it
+    with open(pkl_filename, 'wb') as file:
+        pickle.dump([reg, feature_order], file)
+
+    # Export alongside the model its feature encoder, coefficients and checked closed-form scoring table,
+    # so predictions need neither scikit-learn nor barris_view
+    encoder = build_encoder(feature_order, barris_view)
+    export_scoring_table(reg, encoder, pkl_filename)
+
+
+# Train the model once the integrated table is ready, unless it was already trained on the same data
+reread_housing_view = args.audit or args.pushdown or args.out_of_core
+runner.add('train', train,
+           after=['integrate'] + (['exploit housing_view'] if reread_housing_view and not args.pushdown else []),
+           outputs=[pkl_filename, scoring_table_path(pkl_filename)]
+           + ([leaderboard_path(pkl_filename)] if args.select_model else []), checkpoint=not reread_housing_view)
+
+# Wait for every zone table to be persisted and print the timings of the stages
+runner.close(timings_path=args.timings)
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Inputs of the rental price prediction, kept free of heavy imports so that scoring starts fast
+
+# Characteristics of a flat and available levels of the categorical ones
+INPUT_COLUMNS = ['bathrooms', 'building_subtype', 'conservation_state', 'floor_elevator', 'rooms', 'sq_meters', 'neighbourhood']
+BUILDING_SUBTYPES = ['Flat', 'Apartment', 'Attic', 'Duplex', 'Loft', 'Study', 'House_Chalet', 'GroundFloorWithGarden', 'SemidetachedHouse', 'SemiDetached']
+CONSERVATION_STATES = ['New construction', 'Nearly new', 'Very good', 'Good', 'Renovated', 'To renovate']
+NEIGHBOURHOODS = ['el Raval', 'el Barri Gòtic', 'la Barceloneta', 'Sant Pere, Santa Caterina i la Ribera', 'el Fort Pienc', 'la Sagrada Família', "la Dreta de l'Eixample", "l'Antiga Esquerra de l'Eixample", "la Nova Esquerra de l'Eixample", 'Sant Antoni', 'el Poble Sec', 'la Marina del Prat Vermell', 'la Marina de Port', 'la Font de la Guatlla', 'Hostafrancs', 'la Bordeta', 'Sants - Badal', 'Sants', 'les Corts', 'la Maternitat i Sant Ramon', 'Pedralbes', 'Vallvidrera, el Tibidabo i les Planes', 'Sarrià', 'les Tres Torres', 'Sant Gervasi - la Bonanova', 'Sant Gervasi - Galvany', 'el Putxet i el Farró', 'Vallcarca i els Penitents', 'el Coll', 'la Salut', 'la Vila de Gràcia', "el Camp d'en Grassot i Gràcia Nova", 'el Baix Guinardó', 'Can Baró', 'el Guinardó', "la Font d'en Fargues", 'el Carmel', 'la Teixonera', 'Sant Genís dels Agudells', 'Montbau', "la Vall d'Hebron", 'la Clota', 'Horta', 'Vilapicina i la Torre Llobeta', 'Porta', 'el Turó de la Peira', 'Can Peguera', 'la Guineueta', 'Canyelles', 'les Roquetes', 'Verdun', 'la Prosperitat', 'la Trinitat Nova', 'Torre Baró', 'Ciutat Meridiana', 'Vallbona', 'la Trinitat Vella', 'Baró de Viver', 'el Bon Pastor', 'Sant Andreu', 'la Sagrera', 'el Congrés i els Indians', 'Navas', "el Camp de l'Arpa del Clot", 'el Clot', 'el Parc i la Llacuna del Poblenou', 'la Vila Olímpica del Poblenou', 'el Poblenou', 'Diagonal Mar i el Front Marítim del Poblenou', 'el Besòs i el Maresme', 'Provençals del Poblenou', 'Sant Martí de Provençals', 'la Verneda i la Pau']
+DISTRICTES = ['Ciutat Vella', 'Eixample', 'Sants-Montjuïc', 'Les Corts', 'Sarrià-Sant Gervasi', 'Gràcia', 'Horta-Guinardó', 'Nou Barris', 'Sant Andreu', 'Sant Martí']
+
+
+def validate(flat):
+    # Same checks as the interactive prompts, raising ValueError with the first failing one
+    checks = [
+        (flat.get('bathrooms') in range(0, 21), "Number of bathrooms is not valid."),
+        (flat.get('building_subtype') in BUILDING_SUBTYPES, "Building subtype is not valid."),
+        (flat.get('conservation_state') in CONSERVATION_STATES, "Conservation state is not valid."),
+        (flat.get('floor_elevator') in [True, False], "Elevator is not valid."),
+        (flat.get('rooms') in range(0, 21), "Number of rooms is not valid."),
+        (flat.get('sq_meters') in range(0, 10001), "Squared meters are not valid."),
+        (flat.get('neighbourhood') in NEIGHBOURHOODS, "Neighbourhood is not valid."),
+    ]
+    for valid, message in checks:
+        if not valid:
+            raise ValueError(message)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# k nearest neighbours imputation of a single column, computing distances for the rows to impute only
+#
+# exact: nan-euclidean distances from every row to impute to every donor (row where the column is known),
+#        reproducing sklearn KNNImputer(weights='uniform') on that column, in O(missing x donors)
+# tree:  KD-trees of the donors grouped by missing variables, in O(missing x log donors). The neighbours
+#        are at the same distances as in KNNImputer, but a different choice between equidistant donors
+#        may give slightly different values.
+
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes of the distance matrix of the rows to impute at once in exact mode (per worker)
+WORKING_MEMORY = 256 << 20
+
+METHODS = ('exact', 'tree')
+
+
+def donor_mean(values, donors_idx, distances):
+    # Uniform average of the donors with a defined distance, as np.ma.average in KNNImputer
+    weights = ~np.isnan(distances)
+    return (values.take(donors_idx) * weights).sum(axis=1) / weights.sum(axis=1)
+
+
+def impute_exact_chunk(receivers, X, donors, values, n_neighbors, fallback):
+    from sklearn.metrics.pairwise import nan_euclidean_distances
+    # Distances to every row, then to the donors: computed against the same matrix as KNNImputer, the
+    # rounding errors are the same, and so is the choice between equidistant donors
+    distances = nan_euclidean_distances(receivers, X)[:, donors]
+    # Rows without any variable in common with every donor get the mean of the column
+    all_nan = np.isnan(distances).all(axis=1)
+    imputed = np.full(len(receivers), fallback)
+    distances = distances[~all_nan]
+    donors_idx = np.argpartition(distances, n_neighbors - 1, axis=1)[:, :n_neighbors]
+    donors_dist = np.take_along_axis(distances, donors_idx, axis=1)
+    imputed[~all_nan] = donor_mean(values, donors_idx, donors_dist)
+    return imputed
+
+
+def impute_exact(X, target, n_neighbors, workers):
+    missing = np.isnan(X[:, target])
+    donors = np.flatnonzero(~missing)
+    values = X[donors, target]
+    receivers = X[missing]
+    n_neighbors = min(n_neighbors, len(donors))
+    chunk_size = max(1, WORKING_MEMORY // (8 * len(X)))
+    chunks = [receivers[start:start + chunk_size] for start in range(0, len(receivers), chunk_size)]
+    # Distance matrices and partitions release the GIL, so chunks run in parallel on threads
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        imputed = list(executor.map(lambda chunk: impute_exact_chunk(chunk, X, donors, values, n_neighbors, values.mean()),
+                                    chunks))
+    return np.concatenate(imputed) if imputed else np.empty(0)
+
+
+def impute_tree(X, target, n_neighbors, workers):
+    from scipy.spatial import cKDTree
+    missing = np.isnan(X[:, target])
+    receivers, donors = X[missing], X[~missing]
+    values = donors[:, target]
+    imputed = np.full(len(receivers), values.mean())
+
+    # The nan-euclidean distance between a row to impute and a donor is the euclidean distance over the
+    # variables both know, scaled by the share of variables they both know. Donors are grouped by the
+    # variables they know and the rows to impute by the variables they know, so that within a pair of
+    # groups it is a plain euclidean distance, found with a KD-tree of the donor group.
+    donor_present = ~np.isnan(donors)
+    donor_present[:, target] = False
+    donor_patterns, donor_pattern_of = np.unique(donor_present, axis=0, return_inverse=True)
+    donor_groups = [np.flatnonzero(donor_pattern_of.ravel() == q) for q in range(len(donor_patterns))]
+    patterns, pattern_of = np.unique(~np.isnan(receivers), axis=0, return_inverse=True)
+    trees = {}
+    for p, pattern in enumerate(patterns):
+        rows = np.flatnonzero(pattern_of.ravel() == p)
+        distances, neighbours = [], []
+        for q, donor_pattern in enumerate(donor_patterns):
+            common = pattern & donor_pattern
+            if not common.any():
+                # No variable in common: undefined distance, never a neighbour
+                continue
+            group = donor_groups[q]
+            key = (q, common.tobytes())
+            if key not in trees:
+                trees[key] = cKDTree(donors[group][:, common])
+            k = min(n_neighbors, len(group))
+            dist, idx = trees[key].query(receivers[rows][:, common], k=k, workers=workers)
+            distances.append(dist.reshape(len(rows), k) * np.sqrt(X.shape[1] / common.sum()))
+            neighbours.append(group[idx.reshape(len(rows), k)])
+        if not distances:
+            continue
+        distances, neighbours = np.hstack(distances), np.hstack(neighbours)
+        nearest = np.argsort(distances, axis=1, kind='stable')[:, :n_neighbors]
+        imputed[rows] = values[np.take_along_axis(neighbours, nearest, axis=1)].mean(axis=1)
+    return imputed
+
+
+def knn_impute(df, target, n_neighbors=5, method='exact', workers=1):
+    # Column target of df with its missing values imputed from the n_neighbors nearest rows, at the
+    # nan-euclidean distance over every column of df (which must all be numeric). workers=-1 uses every CPU.
+    assert method in METHODS, f"Unknown imputation method {method}"
+    workers = os.cpu_count() if workers < 0 else workers
+    X = df.to_numpy(dtype=np.float64, na_value=np.nan)
+    target = list(df.columns).index(target)
+    result = X[:, target].copy()
+    missing = np.isnan(result)
+    if missing.any() and not missing.all():
+        impute = impute_exact if method == 'exact' else impute_tree
+        result[missing] = impute(X, target, n_neighbors, workers)
+    return result
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Least squares linear regression from the normal equations, for dense or sparse design matrices
+#
+# The fit only needs the Gram matrix X'X, X'y and the column sums, which are small (features x features)
+# whatever the number of rows. The centered system is scaled to unit diagonal and solved by lstsq, giving
+# the fitted values of LinearRegression also when dummies are collinear (e.g. districts and neighbourhoods).
+
+import numpy as np
+
+# Singular values of the scaled Gram matrix below this share of the largest one are treated as zero
+RCOND = 1e-10
+
+# Rows of a sparse design matrix made dense at once for the Gram matrix products
+BLOCK_ROWS = 20000
+
+
+class GramStatistics:
+    # Sums over the rows of a regression problem, which can be accumulated chunk by chunk and merged
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.sum_x = np.zeros(n_features)
+        self.sum_y = 0.0
+        self.xtx = np.zeros((n_features, n_features))
+        self.xty = np.zeros(n_features)
+
+    def update(self, X, y):
+        # Sparse matrices are made dense a block of rows at a time: dense BLAS products are several times
+        # faster than sparse ones for these few dozen values per row, and release the GIL
+        y = np.asarray(y, dtype=np.float64)
+        if hasattr(X, 'toarray'):
+            for start in range(0, X.shape[0], BLOCK_ROWS):
+                self.update(X[start:start + BLOCK_ROWS].toarray(), y[start:start + BLOCK_ROWS])
+            return self
+        self.n += X.shape[0]
+        self.sum_x += X.sum(axis=0)
+        self.sum_y += y.sum()
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        return self
+
+    def merge(self, other):
+        self.n += other.n
+        self.sum_x += other.sum_x
+        self.sum_y += other.sum_y
+        self.xtx += other.xtx
+        self.xty += other.xty
+        return self
+
+    def solve(self, rcond=RCOND):
+        # Coefficients and intercept of the least squares fit with intercept
+        from scipy.linalg import lstsq
+        mean_x = self.sum_x / self.n
+        mean_y = self.sum_y / self.n
+        gram = self.xtx - self.n * np.outer(mean_x, mean_x)
+        moments = self.xty - self.n * mean_x * mean_y
+        scale = np.sqrt(np.clip(np.diag(gram), 0, None))
+        scale[scale == 0] = 1
+        coef = lstsq(gram / np.outer(scale, scale), moments / scale, cond=rcond)[0] / scale
+        return coef, mean_y - mean_x @ coef
+
+
+class LeastSquaresRegression:
+    # Same interface as the LinearRegression it replaces for the scoring table and the prediction scripts
+
+    def fit(self, X, y):
+        return self.set_statistics(GramStatistics(X.shape[1]).update(X, y))
+
+    def set_statistics(self, statistics):
+        self.coef_, self.intercept_ = statistics.solve()
+        self.n_features_in_ = len(self.coef_)
+        return self
+
+    def predict(self, X):
+        return np.asarray(X @ self.coef_).ravel() + self.intercept_
+
+
+def fit_chunks(chunks, encode, workers=1):
+    # Least squares fit over chunks of rows, each encoded into (X, y, feature names) and accumulated on
+    # worker threads. At most two chunks per worker are held at once, so memory is bounded by the chunk size.
+    from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+    total, names = None, None
+
+    def accumulate(chunk):
+        X, y, chunk_names = encode(chunk)
+        return GramStatistics(X.shape[1]).update(X, y), chunk_names
+
+    def collect(done):
+        nonlocal total, names
+        for future in done:
+            statistics, chunk_names = future.result()
+            assert names is None or chunk_names == names, "Chunks encoded with different features"
+            names = chunk_names
+            total = statistics if total is None else total.merge(statistics)
+
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunks:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(executor.submit(accumulate, chunk))
+        collect(pending)
+    assert total is not None, "No rows to fit"
+    return LeastSquaresRegression().set_statistics(total), names
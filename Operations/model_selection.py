@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Model selection over a grid of linear estimators and feature sets by k-fold cross-validation
+#
+# The design matrix of every listing is built once with all the features. Feature sets are column subsets
+# of it (with or without the crime variables, with the district and/or neighbourhood dummies). Every fold of
+# every feature set is a task of a parallel worker process, which slices its train/validation matrices from
+# the shared design matrix (memory-mapped by joblib) and evaluates all the estimators on them, so the slices
+# of a task are freed when it ends and the parent process never holds more than the design matrix.
+# Estimators are limited to linear models, whose coefficients the scoring table and feature encoder need.
+
+import os
+import time
+import numpy as np
+
+# Feature sets by name: (crime variables, district dummies, neighbourhood dummies)
+FEATURE_SETS = {
+    'all': (True, True, True),
+    'district': (True, True, False),
+    'neighbourhood': (True, False, True),
+    'all_no_crime': (False, True, True),
+    'district_no_crime': (False, True, False),
+    'neighbourhood_no_crime': (False, False, True),
+}
+
+FOLDS = 5
+
+
+def candidate_estimators():
+    # Estimators by name (fitted on sparse design matrices)
+    from sklearn.linear_model import Ridge
+    from linear_fit import LeastSquaresRegression
+    candidates = {'least_squares': LeastSquaresRegression()}
+    for alpha in (0.1, 1.0, 10.0, 100.0):
+        candidates[f'ridge_{alpha:g}'] = Ridge(alpha=alpha)
+    return candidates
+
+
+def leaderboard_path(pkl_filename):
+    # The leaderboard is saved alongside the model selected from it
+    return os.path.splitext(pkl_filename)[0] + '_leaderboard.csv'
+
+
+def feature_columns(names, crime_columns, crime=True, districts=True, neighbourhoods=True):
+    # Indices of the design matrix columns of a feature set
+    crime_columns = {col.lower() for col in crime_columns}
+    return np.array([j for j, name in enumerate(names)
+                     if (crime or name.lower() not in crime_columns)
+                     and (districts or not name.startswith('d_'))
+                     and (neighbourhoods or not name.startswith('n_'))])
+
+
+def fold_indices(n, folds=FOLDS, seed=42):
+    # Validation rows of every fold, from one shuffle of the rows
+    from sklearn.model_selection import KFold
+    return [validation for _, validation in KFold(folds, shuffle=True, random_state=seed).split(np.empty((n, 1)))]
+
+
+def evaluate(estimator, X_train, y_train, X_val, y_val):
+    # Validation errors and timings of a fresh copy of the estimator fitted on one fold
+    from sklearn.base import clone
+    model = clone(estimator, safe=False)
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    predicted = np.asarray(model.predict(X_val)).ravel()
+    predict_time = time.perf_counter() - start
+    residuals = y_val - predicted
+    return {'rmse': float(np.sqrt(np.mean(residuals ** 2))),
+            'mae': float(np.mean(np.abs(residuals))),
+            'r2': float(1 - np.sum(residuals ** 2) / np.sum((y_val - y_val.mean()) ** 2)),
+            'fit_time': fit_time,
+            'predict_time': predict_time}
+
+
+def evaluate_fold(estimators, X, y, columns, validation):
+    # Scores of every estimator on one fold of a feature set, with the fold matrices sliced in the worker
+    X = X[:, columns]
+    train = np.ones(X.shape[0], dtype=bool)
+    train[validation] = False
+    X_train, y_train, X_val, y_val = X[train], y[train], X[validation], y[validation]
+    return {name: evaluate(estimator, X_train, y_train, X_val, y_val) for name, estimator in estimators.items()}
+
+
+def cross_validate(X, y, names, crime_columns, estimators=None, feature_sets=None, folds=FOLDS, n_jobs=-1, seed=42):
+    # Leaderboard of every estimator and feature set, best mean validation RMSE first
+    import pandas as pd
+    from joblib import Parallel, delayed
+    estimators = estimators or candidate_estimators()
+    feature_sets = feature_sets or list(FEATURE_SETS)
+    X = X.tocsr()
+    y = np.asarray(y, dtype=np.float64)
+    columns = {feature_set: feature_columns(names, crime_columns, *FEATURE_SETS[feature_set])
+               for feature_set in feature_sets}
+    validations = fold_indices(X.shape[0], folds, seed)
+
+    tasks = [(feature_set, fold) for feature_set in feature_sets for fold in range(folds)]
+    results = Parallel(n_jobs=n_jobs)(delayed(evaluate_fold)(estimators, X, y, columns[feature_set], validations[fold])
+                                      for feature_set, fold in tasks)
+
+    scores = pd.DataFrame([{'estimator': name, 'features': feature_set, 'fold': fold, **result[name]}
+                           for (feature_set, fold), result in zip(tasks, results) for name in estimators])
+    leaderboard = scores.groupby(['estimator', 'features'], sort=False).agg(
+        rmse=('rmse', 'mean'), rmse_std=('rmse', 'std'), mae=('mae', 'mean'), r2=('r2', 'mean'),
+        fit_time=('fit_time', 'mean'), predict_time=('predict_time', 'mean')).reset_index()
+    leaderboard['n_features'] = [len(columns[feature_set]) for feature_set in leaderboard['features']]
+    return leaderboard.sort_values('rmse', ignore_index=True)
+
+
+def select_model(X, y, names, crime_columns, estimators=None, feature_sets=None, folds=FOLDS, n_jobs=-1, seed=42):
+    # Leaderboard, and the best candidate refitted on every row with the names of its features
+    from sklearn.base import clone
+    estimators = estimators or candidate_estimators()
+    leaderboard = cross_validate(X, y, names, crime_columns, estimators, feature_sets, folds, n_jobs, seed)
+    best = leaderboard.iloc[0]
+    columns = feature_columns(names, crime_columns, *FEATURE_SETS[best['features']])
+    model = clone(estimators[best['estimator']], safe=False).fit(X.tocsr()[:, columns], y)
+    return leaderboard, model, [names[j] for j in columns]
+
+
+def write_leaderboard(leaderboard, path):
+    leaderboard.to_csv(path, index=False, float_format='%.6g')
+    best = leaderboard.iloc[0]
+    print(f"Leaderboard saved to {path}: best {best['estimator']} on {best['features']} features "
+          f"(validation RMSE {best['rmse']:.2f}, R2 {best['r2']:.4f})")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Columnar Parquet mirror of the zone tables, for column-pruned local reads
+#
+# Every table is mirrored under <root>/<schema>/<table> as a zstd-compressed Parquet dataset, optionally
+# hive-partitioned, with the schema of its CREATE TABLE definition. The mirror changes like its database
+# table: upserted rows replace the mirrored rows of their keys, appended rows are new files of the dataset,
+# and a load overwriting the table replaces the whole dataset.
+# Text columns are dictionary encoded and read back as categories.
+# (pyarrow is only imported by the functions that need it)
+
+import os
+import re
+import shutil
+import itertools
+
+# Arrow types of the SQL types used by the zone tables
+SQL_TYPES = {
+    'INTEGER': lambda pa: pa.int32(),
+    'FLOAT': lambda pa: pa.float64(),
+    'VARCHAR': lambda pa: pa.dictionary(pa.int32(), pa.string()),
+    'BOOLEAN': lambda pa: pa.bool_(),
+    'DATE': lambda pa: pa.date32(),
+    'TIMESTAMP': lambda pa: pa.timestamp('us'),
+}
+
+COLUMN_DEFINITION = re.compile(r'^\s*(\w+)\s+(%s)\b' % '|'.join(SQL_TYPES), re.MULTILINE | re.IGNORECASE)
+
+COMPRESSION = 'zstd'
+
+written_parts = itertools.count()
+
+
+def table_columns(sql_create):
+    # Lower case column names of a CREATE TABLE statement, as in the loaded dataframes
+    return [name.lower() for name, _ in COLUMN_DEFINITION.findall(sql_create)]
+
+
+def table_schema(sql_create):
+    # Arrow schema of a CREATE TABLE statement
+    import pyarrow as pa
+    return pa.schema([(name.lower(), SQL_TYPES[sql_type.upper()](pa))
+                      for name, sql_type in COLUMN_DEFINITION.findall(sql_create)])
+
+
+def mirror_path(root, table):
+    return os.path.join(root, *table.split('.'))
+
+
+def column_array(series, arrow_type):
+    import pyarrow as pa
+    import pandas as pd
+    if pa.types.is_dictionary(arrow_type):
+        return pa.array(series.astype('string'), from_pandas=True).cast(pa.string()).dictionary_encode()
+    if pa.types.is_date(arrow_type) or pa.types.is_timestamp(arrow_type):
+        series = pd.to_datetime(series)
+    return pa.array(series, from_pandas=True).cast(arrow_type)
+
+
+def arrow_table(df, schema):
+    # Columns of the dataframe (matched by lower case name) converted to the types of the schema
+    import pyarrow as pa
+    columns = {col.lower(): col for col in df.columns}
+    return pa.Table.from_arrays([column_array(df[columns[field.name]], field.type) for field in schema], schema=schema)
+
+
+def replace_dataset(path, tables, partition_cols=None):
+    # Write the arrow tables as the new content of the dataset, swapped in once complete
+    import pyarrow.parquet as pq
+    staging = path + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for table in tables:
+        pq.write_to_dataset(table, staging, partition_cols=partition_cols, compression=COMPRESSION,
+                            basename_template='part-%d-{i}.parquet' % next(written_parts))
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(staging, path)
+
+
+def add_part(path, table, partition_cols=None):
+    # Write the arrow table as new files of the dataset, next to its current ones
+    import pyarrow.parquet as pq
+    pq.write_to_dataset(table, path, partition_cols=partition_cols, compression=COMPRESSION,
+                        basename_template='part-%d-{i}.parquet' % next(written_parts))
+
+
+def read_mirror(root, table, columns=None, filters=None):
+    # Mirrored table as a dataframe, with only the given columns and the rows matching the filters
+    # (e.g. [('districte', '=', 'Gràcia')]), read from memory-mapped files
+    import pyarrow.parquet as pq
+    return pq.read_table(mirror_path(root, table), columns=columns, filters=filters, memory_map=True).to_pandas()
+
+
+def read_mirror_batches(root, table, columns=None, batch_size=50000):
+    # Mirrored table as dataframes of at most batch_size rows, read one at a time
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(mirror_path(root, table), format='parquet', partitioning='hive')
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+def mirror_values(root, table, column):
+    # Distinct values of a column of the mirrored table
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(mirror_path(root, table), format='parquet', partitioning='hive')
+    values = dataset.to_table(columns=[column]).column(column)
+    if hasattr(values.type, 'value_type'):
+        values = values.cast(values.type.value_type)
+    return [value for value in values.unique().to_pylist() if value is not None]
+
+
+class ParquetMirror:
+
+    def __init__(self, root, partitions=None):
+        # partitions: columns partitioning the mirror of some tables, by table name
+        self.root = root
+        self.partitions = partitions or {}
+
+    def write(self, table, sql_create, df, key=None, append=False):
+        # Mirror the dataframe just loaded into the table: merged by key into the mirrored rows if the load
+        # upserted them, added as a new part of the dataset if it appended them, and replacing it otherwise
+        import pandas as pd
+        path = mirror_path(self.root, table)
+        schema = table_schema(sql_create)
+        if append and os.path.exists(path):
+            return add_part(path, arrow_table(df, schema), self.partitions.get(table))
+        if key is not None and os.path.exists(path):
+            df = df.rename(columns=str.lower)
+            previous = read_mirror(self.root, table)
+            previous = previous[~previous[key].isin(df[key])]
+            df = pd.concat([previous, df[schema.names]], ignore_index=True)
+        replace_dataset(path, [arrow_table(df, schema)], self.partitions.get(table))
+
+    def write_chunks(self, table, sql_create, chunks):
+        # Mirror a whole table given as dataframe chunks (e.g. streamed from the database)
+        schema = table_schema(sql_create)
+        replace_dataset(mirror_path(self.root, table), (arrow_table(chunk, schema) for chunk in chunks),
+                        self.partitions.get(table))
+
+    def read(self, table, columns=None, filters=None):
+        return read_mirror(self.root, table, columns, filters)
+
+    def batches(self, table, columns=None, batch_size=50000):
+        return read_mirror_batches(self.root, table, columns, batch_size)
+
+    def values(self, table, column):
+        return mirror_values(self.root, table, column)
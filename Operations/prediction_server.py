@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Long-running HTTP/JSON prediction service
+#
+#   POST /predict  {"bathrooms": 1, "building_subtype": "Flat", ...} or a list of such flats
+#   GET  /health   model and reference data status
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from predictor import Predictor, validate
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    # Keep-alive connections, so clients do not pay a TCP handshake per prediction
+    protocol_version = 'HTTP/1.1'
+    predictor = None
+    verbose = False
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/health':
+            return self.send_json(404, {'error': 'Not found'})
+        barris_view, barris_loaded_at, build_stamp = self.predictor.barris_view
+        self.send_json(200, {
+            'model': self.predictor.pkl_filename,
+            'model_mtime': self.predictor.model[2],
+            'neighbourhoods': len(barris_view),
+            'barris_view_age': round(time.time() - barris_loaded_at, 1),
+            'build_stamp': build_stamp,
+            'lookup': self.predictor.lookup.stats(),
+        })
+
+    def do_POST(self):
+        if self.path != '/predict':
+            return self.send_json(404, {'error': 'Not found'})
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            flats = payload if isinstance(payload, list) else [payload]
+            if not flats:
+                raise ValueError("No flats to predict.")
+            for flat in flats:
+                validate(flat)
+            prices = [round(float(price), 2) for price in self.predictor.predict(flats)]
+        except (ValueError, AttributeError, KeyError, TypeError) as error:
+            # Invalid flats, or flats the model cannot score (e.g. a neighbourhood missing from barris_view)
+            return self.send_json(400, {'error': str(error)})
+        self.send_json(200, {'prices': prices} if isinstance(payload, list) else {'price': prices[0]})
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def refresh_loop(predictor, poll_interval):
+    # Check for a new model file or stale reference data in the background
+    while True:
+        time.sleep(poll_interval)
+        try:
+            predictor.refresh()
+        except Exception as error:
+            print("Error: %s" % error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve rental price predictions over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--model', default='final_model.pkl', help="pickle file with [model, feature_order]")
+    parser.add_argument('--refresh-interval', type=float, default=3600, help="seconds before barris_view is reloaded")
+    parser.add_argument('--poll-interval', type=float, default=5, help="seconds between model file and staleness checks")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args()
+
+    PredictionHandler.predictor = Predictor(args.model, refresh_interval=args.refresh_interval)
+    PredictionHandler.verbose = args.verbose
+    threading.Thread(target=refresh_loop, args=(PredictionHandler.predictor, args.poll_interval), daemon=True).start()
+
+    server = ThreadingHTTPServer((args.host, args.port), PredictionHandler)
+    print(f"Serving predictions on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+        PredictionHandler.predictor.close()
+
+
+if __name__ == '__main__':
+    main()
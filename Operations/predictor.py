@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Rental price prediction shared by the interactive script and the prediction server
+
+import os
+import time
+import pickle
+import warnings
+import numpy as np
+import pandas as pd
+from db import connect
+from bulk_load import copy_dataframe, sql_columns
+from feature_encoder import FeatureEncoder, encoder_path, barris_view_columns
+from scoring_table import ScoringTable
+from reference_data import NeighbourhoodLookup
+from flat_inputs import INPUT_COLUMNS, BUILDING_SUBTYPES, CONSERVATION_STATES, NEIGHBOURHOODS, validate
+
+
+def load_model(pkl_filename):
+    with open(pkl_filename, 'rb') as file:
+        [pickle_model, feature_order] = pickle.load(file)
+    return pickle_model, feature_order
+
+
+def load_barris_view(conn, feature_order):
+    # Only the columns the encoder of the model reads
+    sql = f"SELECT {', '.join(sql_columns(barris_view_columns(feature_order)))} from exploitation_zone.barris_view;"
+    barris_view = pd.read_sql_query(sql, conn)
+    # Same spelling of the column names as in memory (see db.column_names)
+    barris_view.columns = barris_view.columns.str.lower()
+    return barris_view
+
+
+def build_encoder(feature_order, barris_view):
+    return FeatureEncoder.build(feature_order, barris_view, BUILDING_SUBTYPES, CONSERVATION_STATES)
+
+
+def saved_encoder(pkl_filename, feature_order):
+    # Encoder saved alongside the model, None if there is none for this model
+    path = encoder_path(pkl_filename)
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(pkl_filename):
+        encoder = FeatureEncoder.load(path)
+        if encoder.feature_order == list(feature_order):
+            return encoder
+    return None
+
+
+def load_encoder(pkl_filename, feature_order, conn):
+    # Encoder saved alongside the model, or built from the current barris_view if there is none for this model
+    encoder = saved_encoder(pkl_filename, feature_order)
+    if encoder is None:
+        encoder = build_encoder(feature_order, load_barris_view(conn, feature_order))
+    return encoder
+
+
+def predict_matrix(pickle_model, X):
+    # X columns already follow feature_order, so the feature names check of a model fitted on a dataframe is moot
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return pickle_model.predict(X)
+
+
+def validate_frame(df):
+    # Vectorized version of validate(): first failing check message of each row, None for valid rows
+    def whole_between(col, low, high):
+        values = pd.to_numeric(df[col], errors='coerce')
+        return values.between(low, high) & (values % 1 == 0)
+    checks = [
+        (whole_between('bathrooms', 0, 20), "Number of bathrooms is not valid."),
+        (df['building_subtype'].isin(BUILDING_SUBTYPES), "Building subtype is not valid."),
+        (df['conservation_state'].isin(CONSERVATION_STATES), "Conservation state is not valid."),
+        (df['floor_elevator'].isin([True, False]), "Elevator is not valid."),
+        (whole_between('rooms', 0, 20), "Number of rooms is not valid."),
+        (whole_between('sq_meters', 0, 10000), "Squared meters are not valid."),
+        (df['neighbourhood'].isin(NEIGHBOURHOODS), "Neighbourhood is not valid."),
+    ]
+    errors = pd.Series(None, index=df.index, dtype=object)
+    for valid, message in reversed(checks):
+        errors[-valid] = message
+    return errors
+
+
+################################## Batch scoring ##################################
+
+def read_flats(path):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path, columns=INPUT_COLUMNS)
+    return pd.read_csv(path, usecols=INPUT_COLUMNS)
+
+
+def predict_batch(pickle_model, encoder, flats, chunk_size=100000):
+    # Validate every row at once and predict the valid rows in chunks encoded into a single reused buffer.
+    # Returns the valid rows with their predicted price and the error message of every rejected row.
+    flats = flats.reset_index(drop=True)
+    errors = validate_frame(flats)
+    # Valid neighbourhoods missing from the barris_view the encoder was built from cannot be scored either
+    errors[errors.isna().to_numpy() & ~encoder.knows(flats['neighbourhood'])] = "Neighbourhood not in barris_view."
+    valid = flats[errors.isna().to_numpy()]
+
+    buffer = np.empty((min(chunk_size, len(valid)), encoder.n_features + 1))
+    prices = np.empty(len(valid))
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid.iloc[start:start + chunk_size]
+        prices[start:start + len(chunk)] = predict_matrix(pickle_model, encoder.encode(chunk, buffer))
+
+    scored = valid.assign(predicted_price=prices)
+    scored.insert(0, 'input_row', valid.index)
+    return scored, errors.dropna()
+
+
+def write_predictions(scored, output=None, table=None, conn=None):
+    if output is not None:
+        if output.endswith('.parquet'):
+            scored.to_parquet(output, index=False)
+        else:
+            scored.to_csv(output, index=False)
+        print(f"Predictions written to {output}")
+    if table is not None:
+        cursor = conn.cursor()
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+            INPUT_ROW INTEGER,
+            BATHROOMS INTEGER,
+            BUILDING_SUBTYPE VARCHAR(30),
+            CONSERVATION_STATE VARCHAR(20),
+            FLOOR_ELEVATOR BOOLEAN,
+            ROOMS INTEGER,
+            SQ_METERS FLOAT,
+            NEIGHBOURHOOD VARCHAR(45),
+            PREDICTED_PRICE FLOAT
+        );""")
+        conn.commit()
+        cursor.close()
+        copy_dataframe(conn, scored, table)
+
+
+class Predictor:
+    # Model and barris_view held in memory between predictions, the barris_view rows fetched through the
+    # neighbourhood lookup. refresh() reloads the model when its file changes, and barris_view when the
+    # exploitation zone was rebuilt or when it is older than refresh_interval seconds.
+
+    def __init__(self, pkl_filename, refresh_interval=3600, lookup=None):
+        self.pkl_filename = pkl_filename
+        self.refresh_interval = refresh_interval
+        self.lookup = lookup if lookup is not None else NeighbourhoodLookup.from_config(max_connections=1,
+                                                                                        ttl=refresh_interval)
+        self.barris_view = None
+        self.reload_model()
+        self.reload_barris_view()
+
+    def reload_model(self):
+        model_mtime = os.path.getmtime(self.pkl_filename)
+        self.model = load_model(self.pkl_filename) + (model_mtime,)
+        print(f"Model loaded from {self.pkl_filename}")
+        # The lookup only fetches the barris_view columns of the model: a model reading other ones reloads them
+        if self.lookup.select(barris_view_columns(self.model[1])) and self.barris_view is not None:
+            self.reload_barris_view()
+        else:
+            self.rebuild_encoder()
+
+    def reload_barris_view(self):
+        # Rows of every neighbourhood, cached by the lookup until their ttl or the next rebuild of the zone
+        barris_view = self.lookup.frame(NEIGHBOURHOODS)
+        self.barris_view = (barris_view, time.time(), self.lookup.stamp)
+        print(f"barris_view loaded ({len(barris_view)} neighbourhoods)")
+        self.rebuild_encoder()
+
+    def rebuild_encoder(self):
+        if self.barris_view is None:
+            return
+        pickle_model, feature_order, _ = self.model
+        encoder = build_encoder(feature_order, self.barris_view[0])
+        # Linear models are scored with their closed-form table instead of predict()
+        table = None
+        if hasattr(pickle_model, 'coef_') and hasattr(pickle_model, 'intercept_'):
+            table = ScoringTable.from_model(pickle_model, encoder)
+            table.check(pickle_model, encoder)
+        # Swap everything at once, so concurrent predictions see either the old or the new scorer
+        self.scorer = (pickle_model, encoder, table)
+
+    def refresh(self):
+        if os.path.getmtime(self.pkl_filename) != self.model[2]:
+            self.reload_model()
+        self.lookup.check_stamp()
+        if self.lookup.stamp != self.barris_view[2] or time.time() - self.barris_view[1] >= self.refresh_interval:
+            self.reload_barris_view()
+
+    def predict(self, flats):
+        # Prices of validated flats (dicts), ValueError if a neighbourhood is missing from barris_view
+        pickle_model, encoder, table = self.scorer
+        unknown = sorted({flat['neighbourhood'] for flat in flats} - set(encoder.neighbourhood_rows))
+        if unknown:
+            raise ValueError(f"Neighbourhood not in barris_view: {', '.join(unknown)}.")
+        if table is not None:
+            if len(flats) == 1:
+                return [table.score(flats[0])]
+            return table.score_frame(pd.DataFrame(flats, columns=INPUT_COLUMNS))
+        if len(flats) == 1:
+            X = encoder.encode_one(flats[0])
+        else:
+            X = encoder.encode(pd.DataFrame(flats, columns=INPUT_COLUMNS))
+        return predict_matrix(pickle_model, X)
+
+    def close(self):
+        self.lookup.close()
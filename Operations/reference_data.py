@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Point lookups of the barris_view row of a neighbourhood, cached in process
+#
+# Rows are fetched with a statement prepared once on each pooled connection and kept in an LRU cache
+# for ttl seconds. The pipeline stamps every rebuild of the exploitation zone, and the cache is emptied
+# as soon as the stamp changes (checked at most every stamp_interval seconds).
+
+import time
+import zlib
+import threading
+from collections import OrderedDict
+import psycopg2
+import psycopg2.errors
+from db import create_pool, borrow, column_names
+from bulk_load import sql_columns
+
+BUILD_STAMPS_TABLE = 'exploitation_zone.build_stamps'
+
+
+def stamp_build(conn, table=BUILD_STAMPS_TABLE):
+    # Record a rebuild of the exploitation zone, once its tables are loaded
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table} (ID SERIAL PRIMARY KEY, BUILT_AT TIMESTAMP DEFAULT now());")
+    cursor.execute(f"INSERT INTO {table} DEFAULT VALUES;")
+    conn.commit()
+    cursor.close()
+
+
+def build_stamp(conn, table=BUILD_STAMPS_TABLE):
+    # Last rebuild of the exploitation zone, None if it was never stamped
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT max(id) FROM {table};")
+        stamp = cursor.fetchone()[0]
+    except psycopg2.errors.UndefinedTable:
+        stamp = None
+    conn.rollback()
+    cursor.close()
+    return stamp
+
+
+def statement_name(table, columns=None):
+    # One prepared statement per table and column list, as they outlive the lookups on each pooled connection
+    name = table.replace('.', '_') + '_row'
+    return name if columns is None else name + '_%08x' % zlib.crc32(','.join(columns).encode())
+
+
+class NeighbourhoodLookup:
+    # barris_view rows by neighbourhood, as dicts of the given columns (None for an unknown neighbourhood)
+
+    def __init__(self, pool, capacity=256, ttl=3600, stamp_interval=10, table='exploitation_zone.barris_view',
+                 columns=None):
+        self.pool = pool
+        self.capacity = capacity
+        self.ttl = ttl
+        self.stamp_interval = stamp_interval
+        self.table = table
+        self.columns = None if columns is None else list(columns)
+        self.statement = statement_name(table, self.columns)
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.stamp = None
+        self.stamp_checked_at = None
+        self.hits = self.misses = self.invalidations = 0
+        self.fetch_time = self.max_fetch_time = 0.0
+
+    @classmethod
+    def from_config(cls, max_connections=4, dsn=None, **kwargs):
+        return cls(create_pool(max_connections, dsn), **kwargs)
+
+    def select(self, columns):
+        # Fetch these columns (every column if None) from now on, and forget rows cached with other ones.
+        # True if the columns changed.
+        columns = None if columns is None else list(columns)
+        with self.lock:
+            if columns == self.columns:
+                return False
+            self.columns, self.statement = columns, statement_name(self.table, columns)
+            self.cache.clear()
+            return True
+
+    def fetch(self, neighbourhood):
+        with borrow(self.pool) as conn:
+            cursor = conn.cursor()
+            start = time.perf_counter()
+            statement, selected = self.statement, self.columns
+            try:
+                cursor.execute(f"EXECUTE {statement} (%s);", (neighbourhood,))
+            except psycopg2.errors.InvalidSqlStatementName:
+                # First lookup on this connection (prepared statements outlive the rolled back transaction)
+                conn.rollback()
+                selected = '*' if selected is None else ', '.join(sql_columns(selected))
+                cursor.execute(f"PREPARE {statement} (text) AS "
+                               f"SELECT {selected} FROM {self.table} WHERE neighbourhood = $1;")
+                cursor.execute(f"EXECUTE {statement} (%s);", (neighbourhood,))
+            row = cursor.fetchone()
+            columns = column_names(cursor)
+            elapsed = time.perf_counter() - start
+            conn.rollback()
+            cursor.close()
+        with self.lock:
+            self.fetch_time += elapsed
+            self.max_fetch_time = max(self.max_fetch_time, elapsed)
+        return dict(zip(columns, row)) if row is not None else None
+
+    def check_stamp(self):
+        # Empty the cache if the exploitation zone was rebuilt since the last check
+        now = time.monotonic()
+        if self.stamp_checked_at is not None and now - self.stamp_checked_at < self.stamp_interval:
+            return
+        self.stamp_checked_at = now
+        with borrow(self.pool) as conn:
+            stamp = build_stamp(conn)
+        with self.lock:
+            if stamp != self.stamp:
+                if self.cache:
+                    self.invalidations += 1
+                self.cache.clear()
+                self.stamp = stamp
+
+    def get(self, neighbourhood):
+        self.check_stamp()
+        with self.lock:
+            entry = self.cache.get(neighbourhood)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.cache.move_to_end(neighbourhood)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        row = self.fetch(neighbourhood)
+        with self.lock:
+            self.cache[neighbourhood] = (row, time.monotonic())
+            self.cache.move_to_end(neighbourhood)
+            while len(self.cache) > self.capacity:
+                self.cache.popitem(last=False)
+        return row
+
+    def frame(self, neighbourhoods):
+        # barris_view restricted to the known neighbourhoods among neighbourhoods
+        import pandas as pd
+        rows = [row for row in (self.get(name) for name in dict.fromkeys(neighbourhoods)) if row is not None]
+        return pd.DataFrame(rows)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else None,
+                    'mean_fetch_ms': 1000 * self.fetch_time / self.misses if self.misses else None,
+                    'max_fetch_ms': 1000 * self.max_fetch_time,
+                    'cached': len(self.cache),
+                    'invalidations': self.invalidations}
+
+    def close(self):
+        self.pool.closeall()
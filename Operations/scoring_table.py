@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Closed-form scoring table of the linear regression model
+#
+# price = intercept + neighbourhood partial sum + building subtype coefficient
+#         + conservation state coefficient + sum of numeric input coefficients * inputs
+#
+# where the neighbourhood partial sum already holds the crime, surface and population terms and the
+# district and neighbourhood dummies. Scoring a flat is a few lookups and additions in plain Python.
+
+import os
+import json
+import argparse
+
+
+def scoring_table_path(pkl_filename):
+    # The scoring table is saved alongside the model it was exported from
+    return os.path.splitext(pkl_filename)[0] + '_scoring.json'
+
+
+def coefficients_paths(pkl_filename):
+    # Coefficients (NumPy) and feature order (JSON) of the model, readable without scikit-learn
+    base = os.path.splitext(pkl_filename)[0]
+    return base + '_coef.npz', base + '_features.json'
+
+
+def up_to_date(path, pkl_filename):
+    # Exported file at least as recent as the model it comes from (or shipped without the model)
+    if not os.path.exists(path):
+        return False
+    return not os.path.exists(pkl_filename) or os.path.getmtime(path) >= os.path.getmtime(pkl_filename)
+
+
+def save_coefficients(coef, intercept, feature_order, pkl_filename):
+    import numpy as np
+    coef_path, features_path = coefficients_paths(pkl_filename)
+    np.savez(coef_path, coef=np.asarray(coef, dtype=np.float64).ravel(), intercept=np.ravel(intercept).astype(np.float64))
+    with open(features_path, 'w', encoding='utf-8') as file:
+        json.dump(list(feature_order), file, ensure_ascii=False)
+
+
+def load_coefficients(pkl_filename):
+    import numpy as np
+    coef_path, features_path = coefficients_paths(pkl_filename)
+    with np.load(coef_path, allow_pickle=False) as data:
+        coef, intercept = data['coef'], data['intercept'][0]
+    with open(features_path, encoding='utf-8') as file:
+        feature_order = json.load(file)
+    return coef, intercept, feature_order
+
+
+class ScoringTable:
+
+    def __init__(self, intercept, numeric_coef, building_subtype_coef, conservation_state_coef, neighbourhood_partial):
+        self.intercept = intercept
+        self.numeric_coef = numeric_coef
+        self.building_subtype_coef = building_subtype_coef
+        self.conservation_state_coef = conservation_state_coef
+        self.neighbourhood_partial = neighbourhood_partial
+
+    @classmethod
+    def from_coefficients(cls, coef, intercept, encoder):
+        import numpy as np
+        from feature_encoder import NUMERIC_INPUTS
+        # Coefficient of the encoder sink column is zero: levels without dummy add nothing
+        coef = np.append(np.asarray(coef, dtype=np.float64).ravel(), 0.0)
+        partial = encoder.neighbourhood_matrix @ coef
+        return cls(float(np.ravel(intercept)[0]),
+                   dict(zip(NUMERIC_INPUTS, coef[encoder.numeric_index].tolist())),
+                   dict(zip(encoder.building_subtypes, coef[encoder.building_subtype_index].tolist())),
+                   dict(zip(encoder.conservation_states, coef[encoder.conservation_state_index].tolist())),
+                   dict(zip(encoder.neighbourhoods, partial.tolist())))
+
+    @classmethod
+    def from_model(cls, pickle_model, encoder):
+        return cls.from_coefficients(pickle_model.coef_, pickle_model.intercept_, encoder)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.__dict__, file, ensure_ascii=False, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as file:
+            return cls(**json.load(file))
+
+    def score(self, flat):
+        price = self.intercept + self.neighbourhood_partial[flat['neighbourhood']]
+        price += self.building_subtype_coef[flat['building_subtype']]
+        price += self.conservation_state_coef[flat['conservation_state']]
+        for col, coef in self.numeric_coef.items():
+            price += coef * flat[col]
+        return price
+
+    def score_frame(self, flats):
+        # Vectorized score of a dataframe of validated flats
+        import numpy as np
+        cols = list(self.numeric_coef)
+        price = self.intercept + flats[cols].to_numpy(dtype=np.float64) @ np.array([self.numeric_coef[col] for col in cols])
+        price += flats['neighbourhood'].map(self.neighbourhood_partial).to_numpy(dtype=np.float64)
+        price += flats['building_subtype'].map(self.building_subtype_coef).to_numpy(dtype=np.float64)
+        price += flats['conservation_state'].map(self.conservation_state_coef).to_numpy(dtype=np.float64)
+        return price
+
+    def check(self, pickle_model, encoder, sample=(0, 1, 2, 3, 10, 75, 150)):
+        # Numerical equivalence with the model: every neighbourhood, subtype and state, with a few numeric inputs
+        import itertools
+        import pandas as pd
+        from predictor import predict_matrix
+        flats = pd.DataFrame([
+            {'bathrooms': sample[i % len(sample)], 'building_subtype': building_subtype,
+             'conservation_state': conservation_state, 'floor_elevator': bool(i % 2),
+             'rooms': sample[(i + 1) % len(sample)], 'sq_meters': sample[(i + 2) % len(sample)],
+             'neighbourhood': neighbourhood}
+            for i, (neighbourhood, building_subtype, conservation_state) in enumerate(itertools.product(
+                encoder.neighbourhoods, encoder.building_subtypes, encoder.conservation_states))])
+        expected = predict_matrix(pickle_model, encoder.encode(flats))
+        error = abs(self.score_frame(flats) - expected).max()
+        single_error = abs(self.score(flats.iloc[-1].to_dict()) - expected[-1])
+        # Raised rather than asserted, so the check still guards the export under python -O
+        if max(error, single_error) > 1e-6 * max(1.0, abs(expected).max()):
+            raise ValueError(f"Scoring table differs from the model by {max(error, single_error)}")
+        return error
+
+
+def export(pickle_model, encoder, pkl_filename):
+    # Build, check and save the scoring table of a linear model, with its coefficients and feature encoder
+    from feature_encoder import encoder_path
+    table = ScoringTable.from_model(pickle_model, encoder)
+    error = table.check(pickle_model, encoder)
+    table.save(scoring_table_path(pkl_filename))
+    save_coefficients(pickle_model.coef_, pickle_model.intercept_, encoder.feature_order, pkl_filename)
+    encoder.save(encoder_path(pkl_filename))
+    print(f"Scoring table saved to {scoring_table_path(pkl_filename)} (max abs difference with the model {error:.2e})")
+    return table
+
+
+def load_fast_scorer(pkl_filename):
+    # Cheapest scoring table available without unpickling the model: the exported table (plain Python),
+    # or one rebuilt from the exported coefficients and feature encoder (NumPy only). None if neither is usable.
+    table_path = scoring_table_path(pkl_filename)
+    if up_to_date(table_path, pkl_filename):
+        return ScoringTable.load(table_path)
+    from feature_encoder import FeatureEncoder, encoder_path
+    if all(up_to_date(path, pkl_filename) for path in coefficients_paths(pkl_filename) + (encoder_path(pkl_filename),)):
+        coef, intercept, feature_order = load_coefficients(pkl_filename)
+        encoder = FeatureEncoder.load(encoder_path(pkl_filename))
+        if encoder.feature_order == feature_order:
+            return ScoringTable.from_coefficients(coef, intercept, encoder)
+    return None
+
+
+def main():
+    from predictor import connect, load_model, load_encoder
+    parser = argparse.ArgumentParser(description="Export the scoring table of the linear price model.")
+    parser.add_argument('--model', default='final_model.pkl', help="pickle file with [model, feature_order]")
+    args = parser.parse_args()
+
+    pickle_model, feature_order = load_model(args.model)
+    conn = connect()
+    export(pickle_model, load_encoder(args.model, feature_order, conn), args.model)
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
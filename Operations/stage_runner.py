@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Concurrent runner of the pipeline stages, following the dependencies declared between them,
+# with content-hashed checkpoints so that re-runs only recompute the stages whose inputs changed
+
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import inspect
+import threading
+from functools import partial
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from db import create_pool, borrow, query_report, query_stats
+
+# Stages run at the same time
+MAX_WORKERS = 4
+
+# Bytes of an input file hashed at once
+HASH_BLOCK_SIZE = 1 << 20
+
+# Directory of the pipeline modules, whose code is part of the checkpoint keys of the stages using them
+PROJECT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def peak_rss():
+    # Peak resident memory of this process so far in MB (None where getrusage is not available)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / 1024
+
+
+def content_hash(result):
+    # Hash of a stage result: a dataframe, a dict of dataframes, or any other picklable value
+    import pandas as pd
+    digest = hashlib.sha256()
+    frames = result if isinstance(result, dict) else {'': result}
+    for name, frame in frames.items():
+        digest.update(name.encode())
+        if isinstance(frame, pd.DataFrame):
+            digest.update(repr([(str(col), str(dtype)) for col, dtype in frame.dtypes.items()]).encode())
+            digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+        else:
+            digest.update(pickle.dumps(frame))
+    return digest.hexdigest()
+
+
+def source(value):
+    try:
+        return inspect.getsource(value)
+    except (OSError, TypeError):
+        return getattr(value, '__qualname__', repr(value))
+
+
+def project_module(value):
+    # Pipeline module defining a function or class (or the module itself), None for libraries
+    module = value if inspect.ismodule(value) else inspect.getmodule(value)
+    path = getattr(module, '__file__', None)
+    if path is not None and os.path.dirname(os.path.abspath(path)) == PROJECT_DIRECTORY:
+        return module
+    return None
+
+
+def referenced_names(code):
+    # Global names used by a function, including in its nested functions, lambdas and comprehensions
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= referenced_names(const)
+    return names
+
+
+def module_hashes(module, hashes):
+    # File hashes of a pipeline module and of the pipeline modules it imports from, transitively
+    if module.__name__ in hashes:
+        return
+    hashes[module.__name__] = file_hash(module.__file__)
+    for value in list(vars(module).values()):
+        if inspect.ismodule(value) or inspect.isfunction(value) or inspect.isclass(value):
+            dependency = project_module(value)
+            if dependency is not None:
+                module_hashes(dependency, hashes)
+
+
+def code_dependencies(function):
+    # Sources of the functions and classes of its own module that a stage function uses, followed through the
+    # functions they use in turn, and file hashes of the other pipeline modules used by any of them
+    sources, hashes = {}, {}
+    pending = [function]
+    while pending:
+        current = pending.pop()
+        code = getattr(current, '__code__', None)
+        if code is None:
+            continue
+        for name in sorted(referenced_names(code)):
+            value = current.__globals__.get(name)
+            if not (inspect.ismodule(value) or inspect.isfunction(value) or inspect.isclass(value)):
+                continue
+            if not inspect.ismodule(value) and value.__module__ == function.__module__:
+                if value.__qualname__ not in sources:
+                    sources[value.__qualname__] = source(value)
+                    pending.extend([value] if inspect.isfunction(value) else
+                                   [method for method in vars(value).values() if inspect.isfunction(method)])
+            elif project_module(value) is not None:
+                module_hashes(project_module(value), hashes)
+    sources.pop(getattr(function, '__qualname__', None), None)
+    return [sources[name] for name in sorted(sources)] + [f'{name} {hashes[name]}' for name in sorted(hashes)]
+
+
+def code_identity(function):
+    # Source of a stage function, with the arguments bound by a partial and the code it calls, so that editing
+    # a stage or anything it uses (in its own module or in another pipeline module) invalidates its checkpoints
+    if isinstance(function, partial):
+        bound = [code_identity(arg) if callable(arg) else repr(arg) for arg in function.args]
+        bound += [f'{name}={code_identity(arg) if callable(arg) else repr(arg)}'
+                  for name, arg in sorted(function.keywords.items())]
+        return f"{code_identity(function.func)}({', '.join(bound)})"
+    if project_module(function) is None:
+        return source(function)
+    return '\n'.join([source(function)] + code_dependencies(function))
+
+
+class StageRunner:
+    # Every stage is a function called with the results of the stages it runs after. Stages start
+    # as soon as a worker is free and must be added after the stages they depend on: workers take
+    # stages in the order they were added, so the oldest unfinished stage can always make progress.
+    # Stages borrow database connections from a pool sized for one connection per worker, plus
+    # extra ones for the main thread and for loads running alongside a stage.
+    #
+    # With a cache directory, the result of every checkpointed stage is saved under a key hashing its
+    # code, its input files, the content of the results it depends on and the salt of the run. A stage
+    # whose key has a checkpoint (and whose declared output files exist) is skipped and its saved result
+    # reused. Stages reading database state that is not among their inputs must not be checkpointed.
+
+    def __init__(self, dsn, max_workers=MAX_WORKERS, extra_connections=2, cache_dir=None, salt=''):
+        self.pool = create_pool(max_workers + extra_connections, dsn)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.cache_dir = cache_dir
+        self.salt = salt
+        self.stages = {}
+        self.hashes = {}
+        self.timings = {}
+        self.steps = {}
+        self.peaks = {}
+        self.skipped = []
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def connection(self):
+        # Connection borrowed from the pool for the duration of the block, rolled back on error
+        return borrow(self.pool)
+
+    def stage_key(self, name, function, after, files):
+        key = {'stage': name, 'code': code_identity(function), 'salt': self.salt,
+               'after': [self.hashes[stage] for stage in after],
+               'files': [file_hash(path) for path in files]}
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def checkpoint_path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name.replace(' ', '_').replace('.', '_')}-{key[:16]}.pkl")
+
+    def add(self, name, function, after=(), files=(), outputs=(), checkpoint=True):
+        # files: input files of the stage, outputs: files the stage writes, checkpoint: whether its result can be reused
+        dependencies = [self.stages[stage] for stage in after]
+
+        def run():
+            inputs = [dependency.result() for dependency in dependencies]
+            path = None
+            if self.cache_dir is not None and checkpoint:
+                path = self.checkpoint_path(name, self.stage_key(name, function, after, files))
+                if os.path.exists(path) and all(os.path.exists(output) for output in outputs):
+                    with open(path, 'rb') as file:
+                        result_hash, result = pickle.load(file)
+                    with self.lock:
+                        self.hashes[name] = result_hash
+                        self.skipped.append(name)
+                    print(f"Stage '{name}' unchanged, result reused from {path}")
+                    return result
+
+            start = time.perf_counter()
+            result = function(*inputs)
+            end = time.perf_counter()
+
+            if self.cache_dir is not None:
+                result_hash = content_hash(result)
+                if path is not None:
+                    # Written under another name first, so an interrupted run never leaves a partial checkpoint
+                    with open(path + '.tmp', 'wb') as file:
+                        pickle.dump((result_hash, result), file, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(path + '.tmp', path)
+                with self.lock:
+                    self.hashes[name] = result_hash
+            with self.lock:
+                self.timings[name] = (start - self.start, end - start)
+                self.peaks[name] = peak_rss()
+            print(f"Stage '{name}' done in {end - start:.2f}s")
+            return result
+
+        assert name not in self.stages, f"Stage '{name}' already added"
+        self.stages[name] = self.executor.submit(run)
+        return name
+
+    @contextmanager
+    def step(self, stage, name):
+        # Time a step of a stage, reported under the stage
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                self.steps[f'{stage} / {name}'] = (start - self.start, end - start)
+
+    def result(self, name):
+        return self.stages[name].result()
+
+    def wait(self, names=None):
+        # Block until the given stages (every stage added so far by default) are done, re-raising any failure
+        return [self.result(name) for name in (list(self.stages) if names is None else names)]
+
+    def report(self):
+        total = time.perf_counter() - self.start
+        print(f"{'Stage':<40} {'start':>8} {'time':>8}")
+        for name, (start, elapsed) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            print(f"{name:<40} {start:>7.2f}s {elapsed:>7.2f}s")
+            for step, (step_start, step_elapsed) in self.steps.items():
+                if step.startswith(name + ' / '):
+                    print(f"  {step[len(name) + 3:]:<38} {step_start:>7.2f}s {step_elapsed:>7.2f}s")
+        busy = sum(elapsed for _, elapsed in self.timings.values())
+        print(f"{len(self.timings)} stages in {total:.2f}s ({busy:.2f}s of stage time)")
+        if self.skipped:
+            print(f"{len(self.skipped)} unchanged stages skipped: {', '.join(self.skipped)}")
+        for line in query_report():
+            print(line)
+
+    def write_timings(self, path):
+        # Stage and step timings, peak memory and query times of the run as JSON, e.g. for benchmarks
+        timings = {'total': time.perf_counter() - self.start,
+                   'peak_rss_mb': peak_rss(),
+                   'stages': {name: {'start': start, 'time': elapsed, 'peak_rss_mb': self.peaks.get(name)}
+                              for name, (start, elapsed) in self.timings.items()},
+                   'steps': {name: {'start': start, 'time': elapsed} for name, (start, elapsed) in self.steps.items()},
+                   'skipped': self.skipped,
+                   'connections': query_stats()}
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(timings, file, ensure_ascii=False, indent=1)
+
+    def close(self, timings_path=None):
+        self.wait()
+        self.executor.shutdown()
+        self.report()
+        if timings_path is not None:
+            self.write_timings(timings_path)
+        self.pool.closeall()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Shared fixtures: the Operations modules on the import path, a throwaway local PostgreSQL cluster,
+# and a linear price model fitted on random flats
+
+import os
+import sys
+import pickle
+import shutil
+import socket
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Operations'))
+from flat_inputs import BUILDING_SUBTYPES, CONSERVATION_STATES, NEIGHBOURHOODS, DISTRICTES
+
+LIBPQ_VARIABLES = ['PGHOST', 'PGPORT', 'PGDATABASE', 'PGUSER', 'PGPASSWORD', 'PGSSLMODE', 'DB_STATEMENT_TIMEOUT',
+                   'DB_CONFIG']
+
+# barris_view attributes of the test model
+ATTRIBUTES = ['superficie', 'poblacio', 'furt', 'rob_força']
+
+
+def barris_frame(seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'districte': [DISTRICTES[i % len(DISTRICTES)] for i in range(len(NEIGHBOURHOODS))],
+                         'neighbourhood': NEIGHBOURHOODS,
+                         'superficie': rng.uniform(0.5, 10, len(NEIGHBOURHOODS)).round(2),
+                         'poblacio': rng.integers(5000, 60000, len(NEIGHBOURHOODS)),
+                         'furt': rng.integers(100, 9000, len(NEIGHBOURHOODS)),
+                         'rob_força': rng.integers(10, 900, len(NEIGHBOURHOODS))})
+
+
+def random_flats(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'bathrooms': rng.integers(1, 4, n),
+                         'building_subtype': rng.choice(BUILDING_SUBTYPES, n),
+                         'conservation_state': rng.choice(CONSERVATION_STATES, n),
+                         'floor_elevator': rng.random(n) < 0.75,
+                         'rooms': rng.integers(1, 6, n),
+                         'sq_meters': rng.integers(30, 200, n),
+                         'neighbourhood': rng.choice(NEIGHBOURHOODS, n)})
+
+
+def model_features():
+    # Feature order of the test model: inputs, barris_view attributes and dummies without their first level
+    return (['bathrooms', 'floor_elevator', 'rooms', 'sq_meters'] + ATTRIBUTES
+            + [f'bs_{level}' for level in BUILDING_SUBTYPES[1:]]
+            + [f'cs_{level}' for level in CONSERVATION_STATES[1:]]
+            + [f'd_{level}' for level in DISTRICTES[1:]] + [f'n_{level}' for level in NEIGHBOURHOODS[1:]])
+
+
+@pytest.fixture
+def model_file(tmp_path):
+    # Linear model fitted on the encoded random flats, saved as final_script.py does
+    LinearRegression = pytest.importorskip('sklearn.linear_model').LinearRegression
+    from predictor import build_encoder
+    feature_order = model_features()
+    encoder = build_encoder(feature_order, barris_frame())
+    X = encoder.encode(random_flats(2000))
+    y = X @ np.random.default_rng(1).normal(0, 10, X.shape[1]) + 500
+    path = tmp_path / 'model.pkl'
+    with open(path, 'wb') as file:
+        pickle.dump([LinearRegression().fit(X, y), feature_order], file)
+    return str(path)
+
+
+@pytest.fixture
+def clean_environment(monkeypatch, tmp_path):
+    # No database settings from the environment or from a db.ini of the working directory
+    for variable in LIBPQ_VARIABLES:
+        monkeypatch.delenv(variable, raising=False)
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture(scope='session')
+def postgres_cluster():
+    # Temporary cluster listening on a Unix socket only, skipped without the server binaries (or as root,
+    # which initdb refuses). Yields the libpq variables of its database.
+    pytest.importorskip('psycopg2')
+    if shutil.which('initdb') is None or shutil.which('pg_ctl') is None:
+        pytest.skip("PostgreSQL server binaries not on the PATH")
+    if hasattr(os, 'geteuid') and os.geteuid() == 0:
+        pytest.skip("initdb cannot run as root")
+    directory = tempfile.mkdtemp(prefix='test_pg_')
+    data = os.path.join(directory, 'data')
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        port = str(sock.getsockname()[1])
+    subprocess.run(['initdb', '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-locale'],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run(['pg_ctl', '-D', data, '-l', os.path.join(directory, 'server.log'), '-w', 'start',
+                    '-o', f"-p {port} -k {directory} -c listen_addresses='' -c fsync=off"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        subprocess.run(['createdb', '-h', directory, '-p', port, '-U', 'postgres', 'test'], check=True)
+        yield {'PGHOST': directory, 'PGPORT': port, 'PGUSER': 'postgres', 'PGDATABASE': 'test',
+               'PGSSLMODE': 'disable'}
+    finally:
+        subprocess.run(['pg_ctl', '-D', data, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@pytest.fixture
+def local_database(postgres_cluster, clean_environment, monkeypatch):
+    # The throwaway cluster as the database of db.py
+    for variable, value in postgres_cluster.items():
+        monkeypatch.setenv(variable, value)
+    return postgres_cluster
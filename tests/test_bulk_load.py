@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('psycopg2')
+import db
+from bulk_load import read_query
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+def test_read_query_matches_read_sql_query(local_database):
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE listings AS SELECT i AS id, i * 1.5 AS price, "
+                   "CASE WHEN i > 2500 THEN 'Sants' END AS neighbourhood, (i % 3 = 0) AS floor_elevator "
+                   "FROM generate_series(1, 3000) AS i;")
+    conn.commit()
+    query = "SELECT * FROM listings ORDER BY id;"
+    expected = pd.read_sql_query(query, conn)
+    # The first chunks only hold NULL neighbourhoods
+    df = read_query(conn, query, chunk_size=700)
+    pd.testing.assert_frame_equal(df, expected)
+    df = read_query(conn, query, dtypes={'neighbourhood': 'category'}, chunk_size=700)
+    assert df['neighbourhood'].dtype == 'category'
+    assert df['neighbourhood'].isna().sum() == 2500
+    cursor.execute("DROP TABLE listings;")
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.filterwarnings('ignore:pandas only supports SQLAlchemy')
+def test_read_query_lowers_folded_names(local_database):
+    # PostgreSQL folds ROB_FORÇA to rob_forÇa, read back as rob_força like the dataframes kept in memory
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE crime (DISTRICTE VARCHAR(50), ROB_FORÇA INTEGER);")
+    cursor.execute("INSERT INTO crime VALUES ('Sants-Montjuïc', 12);")
+    conn.commit()
+    assert list(read_query(conn, "SELECT * FROM crime;").columns) == ['districte', 'rob_força']
+    cursor.execute("DELETE FROM crime;")
+    conn.commit()
+    assert list(read_query(conn, "SELECT * FROM crime;").columns) == ['districte', 'rob_força']
+    cursor.execute("DROP TABLE crime;")
+    conn.commit()
+    conn.close()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cleaning import apply_rules, keep_mask
+
+RULES = [
+    ('bathrooms', 'iqr', 3),
+    ('discount', 'iqr', 5),
+    ('price', 'max', 15000),
+    ('price', 'iqr', 5),
+    ('rooms', 'iqr', 3),
+    ('sq_meters', 'iqr', 5),
+]
+
+
+def clean_reference(df, rules):
+    # The filters of the original cleaning, one dataframe copy per rule
+    for col, kind, value in rules:
+        if kind == 'max':
+            df = df[-(df[col] > value)]
+        elif kind == 'min':
+            df = df[-(df[col] < value)]
+        else:
+            Q1 = df[col].quantile(0.25)
+            Q3 = df[col].quantile(0.75)
+            IQR = Q3 - Q1
+            df = df[-((df[col] < Q1 - value * IQR) | (df[col] > Q3 + value * IQR))]
+    return df
+
+
+def housing(n=5000, seed=0):
+    # Heavy-tailed variables with missing values (NaN, as read from the housing file or the database)
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'id': np.arange(n),
+                       'bathrooms': rng.choice([1, 1, 1, 2, 2, 3, 4, 9], n).astype(np.float64),
+                       'discount': np.where(rng.random(n) < 0.9, 0, rng.lognormal(4, 1.5, n).round()),
+                       'price': rng.lognormal(7, 0.6, n).round(),
+                       'rooms': rng.choice([1, 2, 2, 3, 3, 4, 5, 12], n),
+                       'sq_meters': rng.lognormal(4.3, 0.5, n).round()})
+    for col in ['bathrooms', 'discount', 'price', 'sq_meters']:
+        df.loc[rng.random(n) < 0.01, col] = np.nan
+    df.loc[rng.random(n) < 0.005, 'price'] = 20000
+    return df
+
+
+@pytest.mark.parametrize('rules', [RULES, RULES[::-1], [('price', 'min', 500), ('price', 'iqr', 1)]])
+def test_rules_match_sequential_filters(rules):
+    df = housing()
+    expected = clean_reference(df, rules)
+    cleaned = apply_rules(df, rules)
+    assert len(cleaned) < len(df)
+    pd.testing.assert_frame_equal(cleaned, expected)
+
+
+def test_iqr_rule_on_missing_values_only_keeps_every_row():
+    df = pd.DataFrame({'price': [np.nan, np.nan], 'rooms': [1, 50]})
+    assert keep_mask(df, [('price', 'iqr', 1), ('rooms', 'max', 10)]).tolist() == [True, False]
+
+
+def test_unknown_rule_kind_raises():
+    with pytest.raises(AssertionError, match='Unknown cleaning rule kind'):
+        keep_mask(housing(10), [('price', 'median', 1)])
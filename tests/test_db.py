@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+import db
+
+
+def test_settings_are_required(clean_environment):
+    with pytest.raises(RuntimeError, match='PGHOST, PGDATABASE, PGUSER'):
+        db.load_config()
+
+
+def test_environment_overrides_config_file(clean_environment, monkeypatch, tmp_path):
+    path = tmp_path / 'local.ini'
+    path.write_text("[postgres]\nhost = db.example\ndbname = adsdb\nuser = reader\nsslmode = require\n")
+    monkeypatch.setenv('DB_CONFIG', str(path))
+    monkeypatch.setenv('PGSSLMODE', 'disable')
+    config = db.load_config()
+    assert (config['host'], config['dbname'], config['user'], config['sslmode']) == \
+        ('db.example', 'adsdb', 'reader', 'disable')
+    assert config['port'] == db.DEFAULTS['port']
+
+
+def test_statement_timeout_in_dsn(clean_environment, monkeypatch):
+    for variable, value in {'PGHOST': 'localhost', 'PGDATABASE': 'adsdb', 'PGUSER': 'reader',
+                            'DB_STATEMENT_TIMEOUT': '2500'}.items():
+        monkeypatch.setenv(variable, value)
+    dsn = psycopg2.extensions.parse_dsn(db.database_dsn())
+    assert dsn['options'] == '-c statement_timeout=2500'
+    assert 'password' not in dsn
+
+
+def test_connections_count_queries(local_database):
+    conn = db.connect()
+    cursor = conn.cursor()
+    for value in range(3):
+        cursor.execute("SELECT %s;", (value,))
+    assert cursor.fetchone() == (2,)
+    assert conn.queries == 3 and conn.query_time > 0
+    assert any(stats['backend_pid'] == conn.info.backend_pid and stats['queries'] == 3 for stats in db.query_stats())
+    conn.close()
+
+
+def test_server_side_cursor_streams_rows(local_database):
+    conn = db.connect()
+    cursor = db.server_side_cursor(conn, itersize=1000)
+    cursor.execute("SELECT generate_series(1, 25000);")
+    assert sum(row[0] for row in cursor) == 25000 * 25001 // 2
+    cursor.close()
+    conn.close()
+
+
+def test_borrow_rolls_back_on_error(local_database):
+    pool = db.create_pool(2)
+    with db.borrow(pool) as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE borrowed (ID INTEGER);")
+        conn.commit()
+    with pytest.raises(psycopg2.errors.UndefinedColumn):
+        with db.borrow(pool) as conn:
+            conn.cursor().execute("INSERT INTO borrowed (MISSING) VALUES (1);")
+    with db.borrow(pool) as conn:
+        # The failed transaction was rolled back, so the connection is usable again
+        cursor = conn.cursor()
+        cursor.execute("SELECT count(*) FROM borrowed;")
+        assert cursor.fetchone() == (0,)
+    pool.closeall()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('scipy')
+from design_matrix import compact_view, design_matrix
+
+DISTRICT_COLUMNS = ['superficie', 'poblacio', 'furt']
+
+
+def housing_view(n=3000, neighbourhoods=120, seed=0):
+    # Neighbourhood codes in int8 but their dummies past the 127th column, and listings without a conservation
+    # state
+    rng = np.random.default_rng(seed)
+    district_of = rng.integers(0, 10, neighbourhoods)
+    neighbourhood = rng.integers(0, neighbourhoods, n)
+    df = pd.DataFrame({'bathrooms': rng.integers(1, 4, n),
+                       'building_subtype': rng.choice(['Flat', 'Attic', 'Duplex', 'Studio'], n),
+                       'conservation_state': rng.choice(['Good', 'Nearly new', 'To renovate', None], n),
+                       'floor_elevator': rng.random(n) < 0.7,
+                       'price': rng.lognormal(7, 0.5, n).round(),
+                       'sq_meters': rng.integers(30, 200, n),
+                       'districte': np.array([f'Districte {d}' for d in range(10)])[district_of[neighbourhood]],
+                       'neighbourhood': np.array([f'Barri {b:03d}' for b in range(neighbourhoods)])[neighbourhood]})
+    districts = pd.DataFrame({'districte': [f'Districte {d}' for d in range(10)],
+                              'superficie': rng.uniform(5, 25, 10).round(2),
+                              'poblacio': rng.integers(50000, 250000, 10),
+                              'furt': rng.integers(0, 20000, 10)})
+    return df.merge(districts, on='districte')
+
+
+def test_design_matrix_matches_get_dummies():
+    df = housing_view()
+    listings, districts = compact_view(df, DISTRICT_COLUMNS)
+    X, names = design_matrix(listings, districts, DISTRICT_COLUMNS)
+    X.check_format(full_check=True)
+
+    # The one-hot encoding of the wide frame, as final_script.py trains on it
+    expected = pd.concat([df[['bathrooms', 'floor_elevator', 'sq_meters'] + DISTRICT_COLUMNS],
+                          pd.get_dummies(df.building_subtype, prefix='bs'),
+                          pd.get_dummies(df.conservation_state, prefix='cs'),
+                          pd.get_dummies(df.districte, prefix='d'),
+                          pd.get_dummies(df.neighbourhood, prefix='n')], axis=1)
+    assert names == list(expected.columns)
+    assert X.shape[1] > 127
+    np.testing.assert_array_equal(X.toarray(), expected.to_numpy(dtype=np.float64))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('psycopg2')
+import entity_resolution
+from entity_resolution import similar, score_matches, entity
+
+SYLLABLES = ['sant', 'la', 'el', 'vila', 'poble', 'nou', 'barri', 'font', 'torre', 'mar', 'gràcia', 'horta',
+             'sarrià', 'les', 'corts', 'clot', 'raval', 'besòs', 'port']
+
+
+def exhaustive_matches(names_1, names_2):
+    # Every pair compared with similar(), keeping the first best match as the original loop did
+    matching = {}
+    for name in names_1:
+        best, best_name = 0, 'None'
+        for candidate in names_2:
+            distance = similar(name, candidate)
+            if distance > best:
+                best, best_name = distance, candidate
+        matching[name] = (best_name, best)
+    return matching
+
+
+def raw_names(rng, canonical, n):
+    # Lower case names with suffixes and swapped letters, as in the housing extracts
+    names = []
+    for name in rng.choice(canonical, n):
+        name = name.lower()
+        if rng.random() < 0.3:
+            name += ' - aei ' + name.split(' ')[-1]
+        if rng.random() < 0.3 and len(name) > 3:
+            i = rng.integers(0, len(name) - 1)
+            name = name[:i] + name[i + 1] + name[i] + name[i + 2:]
+        names.append(name)
+    return list(dict.fromkeys(names))
+
+
+@pytest.mark.parametrize('block_size', [7, entity_resolution.BLOCK_SIZE])
+def test_score_matches_equals_exhaustive_comparison(monkeypatch, block_size):
+    monkeypatch.setattr(entity_resolution, 'BLOCK_SIZE', block_size)
+    rng = np.random.default_rng(0)
+    canonical = list(dict.fromkeys(' '.join(rng.choice(SYLLABLES, rng.integers(2, 5))).title() for _ in range(80)))
+    names_1 = raw_names(rng, canonical, 150) + ['', 'xyz', 'Sant']
+    assert score_matches(names_1, canonical) == exhaustive_matches(names_1, canonical)
+
+
+def test_ties_keep_the_first_best_candidate():
+    # Candidates with the same ratio, and the same bound, in every order
+    candidates = ['abc x', 'abc y', 'x abc', 'cba', 'abc', 'bca']
+    names_1 = ['abc', 'ab', 'abcx', 'c', 'q']
+    for order in (candidates, candidates[::-1], candidates[2:] + candidates[:2]):
+        assert score_matches(names_1, order) == exhaustive_matches(names_1, order)
+    assert score_matches(['q'], candidates) == {'q': ('None', 0)}
+    # 'abdc' has the higher bound, so it is compared first, but 'abcx' comes first with the same ratio
+    assert score_matches(['abcd'], ['abcx', 'abdc']) == {'abcd': ('abcx', 0.75)}
+
+
+def test_entity_rewrites_the_column_with_the_matches():
+    df1 = pd.DataFrame({'neighbourhood': ['sants', 'la salut', 'sants', 'hostafrancs - aei']})
+    df2 = pd.DataFrame({'neighbourhood': ['Sants', 'la Salut', 'Hostafrancs', 'Sant Antoni']})
+    df1, matching = entity(df1, df2, 'neighbourhood', 'neighbourhood')
+    assert df1['neighbourhood'].tolist() == ['Sants', 'la Salut', 'Sants', 'Hostafrancs']
+    assert matching == {name: match for name, (match, _) in
+                        exhaustive_matches(['sants', 'la salut', 'hostafrancs - aei'], df2['neighbourhood']).items()}
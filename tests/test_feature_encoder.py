@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pytest
+
+from conftest import barris_frame, random_flats, model_features
+from feature_encoder import FeatureEncoder
+from flat_inputs import BUILDING_SUBTYPES, CONSERVATION_STATES
+
+
+def build(barris_view):
+    return FeatureEncoder.build(model_features(), barris_view, BUILDING_SUBTYPES, CONSERVATION_STATES)
+
+
+def test_encode_one_matches_encode():
+    encoder = build(barris_frame())
+    flats = random_flats(20, seed=6)
+    X = encoder.encode(flats)
+    for i, flat in enumerate(flats.to_dict('records')):
+        np.testing.assert_array_equal(encoder.encode_one(flat)[0], X[i])
+
+
+@pytest.mark.parametrize('change', [lambda df: df.drop(columns=['furt']),
+                                    lambda df: df.rename(columns={'poblacio': 'població'})])
+def test_missing_attribute_raises(change):
+    with pytest.raises(ValueError, match='missing from barris_view'):
+        build(change(barris_frame()))
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('sklearn')
+import imputation
+from imputation import knn_impute
+
+
+def imputed_reference(df, target):
+    from sklearn.impute import KNNImputer
+    return KNNImputer(n_neighbors=5, weights='uniform').fit_transform(df)[:, list(df.columns).index(target)]
+
+
+def numeric_housing(n=1500, seed=0, discrete=True):
+    # Numeric columns passed to the imputation, with missing values in several of them and a row to
+    # impute without any other value (imputed with the mean of the column)
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'discount': np.where(rng.random(n) < 0.8, 0, rng.integers(1, 300, n)).astype(float),
+                       'price': rng.lognormal(7, 0.5, n).round(),
+                       'rooms': rng.integers(1, 6, n).astype(float),
+                       'sq_meters': rng.lognormal(4.3, 0.5, n).round(),
+                       'neighbourhood_mean_price': rng.uniform(10, 25, n).round(2)})
+    if not discrete:
+        df = df + rng.normal(0, 1e-3, df.shape)
+    for col, rate in [('sq_meters', 0.1), ('discount', 0.05), ('price', 0.02)]:
+        df.loc[rng.random(n) < rate, col] = np.nan
+    df.iloc[0] = np.nan
+    return df
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_exact_matches_knn_imputer(monkeypatch, workers):
+    # Rows to impute split in several chunks of distances
+    monkeypatch.setattr(imputation, 'WORKING_MEMORY', 8 * 1500 * 16)
+    df = numeric_housing()
+    np.testing.assert_allclose(knn_impute(df, 'sq_meters', method='exact', workers=workers),
+                               imputed_reference(df, 'sq_meters'), rtol=1e-12)
+
+
+def test_tree_matches_knn_imputer_without_equidistant_donors():
+    df = numeric_housing(discrete=False)
+    np.testing.assert_allclose(knn_impute(df, 'sq_meters', method='tree'), imputed_reference(df, 'sq_meters'),
+                               rtol=1e-9)
+
+
+def test_known_values_are_kept():
+    df = numeric_housing(200)
+    known = df['sq_meters'].notna().to_numpy()
+    for method in imputation.METHODS:
+        imputed = knn_impute(df, 'sq_meters', method=method)
+        assert not np.isnan(imputed).any()
+        np.testing.assert_array_equal(imputed[known], df['sq_meters'].to_numpy()[known])
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+import scipy.sparse as sp
+from linear_fit import LeastSquaresRegression, fit_chunks
+
+NAMES = ['sq_meters', 'rooms', 'furt', 'd_0', 'd_1', 'd_2', 'n_0', 'n_1', 'n_2', 'n_3', 'n_4', 'n_5']
+
+
+def regression(n=3000, seed=0):
+    # District dummies are sums of neighbourhood dummies, so the design matrix is rank deficient
+    # like that of the model (its coefficients are not unique, its fitted values are)
+    rng = np.random.default_rng(seed)
+    neighbourhood = rng.integers(0, 6, n)
+    X = np.column_stack([rng.uniform(30, 200, n), rng.integers(1, 6, n), rng.integers(100, 9000, n),
+                         np.eye(3)[neighbourhood // 2], np.eye(6)[neighbourhood]])
+    y = X @ rng.normal(0, 5, X.shape[1]) + rng.normal(0, 10, n)
+    return X, y
+
+
+def chunks_of(X, y, chunk_size, sparse):
+    for start in range(0, len(X), chunk_size):
+        chunk = X[start:start + chunk_size]
+        yield (sp.csr_matrix(chunk) if sparse else chunk), y[start:start + chunk_size]
+
+
+@pytest.mark.parametrize('sparse, workers', [(False, 1), (True, 1), (True, 3)])
+def test_fit_chunks_matches_linear_regression(sparse, workers):
+    from sklearn.linear_model import LinearRegression
+    X, y = regression()
+    expected = LinearRegression().fit(X, y)
+    reg, names = fit_chunks(chunks_of(X, y, 700, sparse), lambda chunk: (*chunk, NAMES), workers)
+    assert names == NAMES
+    np.testing.assert_allclose(reg.predict(X), expected.predict(X), rtol=1e-9)
+
+
+def test_coefficients_match_linear_regression_without_collinear_columns():
+    from sklearn.linear_model import LinearRegression
+    X, y = regression()
+    reg = LeastSquaresRegression().fit(X[:, :3], y)
+    expected = LinearRegression().fit(X[:, :3], y)
+    np.testing.assert_allclose(reg.coef_, expected.coef_, rtol=1e-9)
+    assert reg.intercept_ == pytest.approx(expected.intercept_, rel=1e-9)
+
+
+def test_fit_chunks_rejects_chunks_with_different_features():
+    X, y = regression(100)
+    chunks = [(X[:50], y[:50], NAMES), (X[50:], y[50:], NAMES[::-1])]
+    with pytest.raises(AssertionError, match='different features'):
+        fit_chunks(chunks, lambda chunk: chunk)
+    with pytest.raises(AssertionError, match='No rows'):
+        fit_chunks([], lambda chunk: chunk)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+import scipy.sparse as sp
+from model_selection import FEATURE_SETS, cross_validate, evaluate, feature_columns, fold_indices, select_model
+
+
+def design(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    names = ['sq_meters', 'rooms', 'furt', 'd_Gràcia', 'd_Sants-Montjuïc', 'n_la Salut', 'n_Hostafrancs']
+    X = np.column_stack([rng.uniform(30, 200, n), rng.integers(1, 6, n), rng.integers(100, 9000, n),
+                         np.eye(2)[rng.integers(0, 2, n)], np.eye(2)[rng.integers(0, 2, n)]])
+    y = X @ rng.normal(0, 5, X.shape[1]) + rng.normal(0, 1, n)
+    return sp.csr_matrix(X), y, names
+
+
+def test_cross_validate_matches_fold_by_fold_evaluation():
+    from sklearn.linear_model import Ridge
+    X, y, names = design()
+    estimators = {'ridge_1': Ridge(alpha=1.0)}
+    leaderboard = cross_validate(X, y, names, ['furt'], estimators, folds=3, n_jobs=2)
+    assert len(leaderboard) == len(FEATURE_SETS)
+
+    # Every feature set scored as if its fold matrices were sliced by hand
+    for feature_set, flags in FEATURE_SETS.items():
+        columns = feature_columns(names, ['furt'], *flags)
+        rmse = []
+        for validation in fold_indices(X.shape[0], 3):
+            train = np.ones(X.shape[0], dtype=bool)
+            train[validation] = False
+            rmse.append(evaluate(estimators['ridge_1'], X[train][:, columns], y[train],
+                                 X[validation][:, columns], y[validation])['rmse'])
+        row = leaderboard[leaderboard['features'] == feature_set].iloc[0]
+        assert row['rmse'] == pytest.approx(np.mean(rmse))
+        assert row['n_features'] == len(columns)
+
+
+def test_cross_validate_matches_cross_val_score():
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import KFold, cross_val_score
+    from linear_fit import LeastSquaresRegression
+    X, y, names = design()
+    leaderboard = cross_validate(X, y, names, ['furt'], {'least_squares': LeastSquaresRegression()},
+                                 feature_sets=['all', 'district_no_crime'], folds=4, n_jobs=1)
+    for feature_set in ['all', 'district_no_crime']:
+        columns = feature_columns(names, ['furt'], *FEATURE_SETS[feature_set])
+        scores = -cross_val_score(LinearRegression(), X[:, columns].toarray(), y, scoring='neg_root_mean_squared_error',
+                                  cv=KFold(4, shuffle=True, random_state=42))
+        row = leaderboard[leaderboard['features'] == feature_set].iloc[0]
+        assert row['rmse'] == pytest.approx(scores.mean(), rel=1e-9)
+
+
+def test_select_model_refits_the_best_candidate():
+    from sklearn.linear_model import Ridge
+    X, y, names = design()
+    estimators = {'ridge_1': Ridge(alpha=1.0), 'ridge_1000': Ridge(alpha=1000.0)}
+    leaderboard, model, feature_order = select_model(X, y, names, ['furt'], estimators, folds=3, n_jobs=1)
+    assert leaderboard['rmse'].is_monotonic_increasing
+    best = leaderboard.iloc[0]
+    columns = feature_columns(names, ['furt'], *FEATURE_SETS[best['features']])
+    assert feature_order == [names[j] for j in columns]
+    expected = estimators[best['estimator']].fit(X[:, columns], y)
+    np.testing.assert_allclose(model.coef_, expected.coef_, rtol=1e-9)
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import pandas as pd
+import pytest
+
+pytest.importorskip('pyarrow')
+from parquet_mirror import ParquetMirror
+
+SQL_CREATE = """CREATE TABLE IF NOT EXISTS formatted_zone.housing (
+    ID INTEGER PRIMARY KEY,
+    PRICE FLOAT,
+    NEIGHBOURHOOD VARCHAR(80)
+);"""
+
+TABLE = 'formatted_zone.housing'
+
+
+def listings(ids, price=1000.0):
+    return pd.DataFrame({'ID': ids, 'PRICE': price, 'NEIGHBOURHOOD': 'Sants'})
+
+
+def mirrored(mirror):
+    df = mirror.read(TABLE)
+    return dict(zip(df['id'], df['price']))
+
+
+@pytest.mark.parametrize('partitions', [None, {TABLE: ['neighbourhood']}])
+def test_mirror_follows_the_loads(tmp_path, partitions):
+    mirror = ParquetMirror(str(tmp_path), partitions)
+    mirror.write(TABLE, SQL_CREATE, listings([1, 2, 3]))
+    # An overwriting load replaces the rows of the previous run, also those no longer in the table
+    mirror.write(TABLE, SQL_CREATE, listings([2, 3], 1500.0))
+    assert mirrored(mirror) == {2: 1500.0, 3: 1500.0}
+    # Upserted rows replace the mirrored rows of their keys
+    mirror.write(TABLE, SQL_CREATE, listings([3, 4], 2000.0), key='id')
+    assert mirrored(mirror) == {2: 1500.0, 3: 2000.0, 4: 2000.0}
+    # Appended chunks are added next to the mirrored rows
+    mirror.write(TABLE, SQL_CREATE, listings([5, 6], 900.0), append=True)
+    assert mirrored(mirror) == {2: 1500.0, 3: 2000.0, 4: 2000.0, 5: 900.0, 6: 900.0}
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pytest
+
+pytest.importorskip('psycopg2')
+import db
+from conftest import ATTRIBUTES, barris_frame, random_flats
+from flat_inputs import NEIGHBOURHOODS
+from reference_data import stamp_build
+from predictor import Predictor, load_model, build_encoder, predict_matrix, predict_batch
+
+
+@pytest.fixture
+def barris_view(local_database):
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute("CREATE SCHEMA IF NOT EXISTS exploitation_zone;")
+    cursor.execute("CREATE TABLE exploitation_zone.barris_view (DISTRICTE VARCHAR(50), NEIGHBOURHOOD VARCHAR(45), "
+                   "SUPERFICIE FLOAT, POBLACIO INTEGER, FURT INTEGER, ROB_FORÇA INTEGER);")
+    cursor.executemany("INSERT INTO exploitation_zone.barris_view VALUES (%s, %s, %s, %s, %s, %s);",
+                       [tuple(row) for row in barris_frame().astype(object).itertuples(index=False)])
+    conn.commit()
+    stamp_build(conn)
+    yield conn
+    cursor = conn.cursor()
+    cursor.execute("DROP SCHEMA exploitation_zone CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+def test_predictor_reads_barris_view_through_lookup(barris_view, model_file):
+    predictor = Predictor(model_file)
+    assert len(predictor.barris_view[0]) == len(NEIGHBOURHOODS)
+    assert predictor.lookup.stats()['misses'] == len(NEIGHBOURHOODS)
+    # Only the barris_view columns of the model are fetched
+    assert list(predictor.barris_view[0].columns) == ['districte', 'neighbourhood'] + ATTRIBUTES
+
+    flats = random_flats(50, seed=2)
+    pickle_model, feature_order, _ = predictor.model
+    expected = predict_matrix(pickle_model, build_encoder(feature_order, barris_frame()).encode(flats))
+    np.testing.assert_allclose(predictor.predict(flats.to_dict('records')), expected)
+
+    # A rebuild of the exploitation zone empties the lookup cache and reloads barris_view
+    stamp_build(barris_view)
+    predictor.lookup.stamp_interval = 0
+    predictor.refresh()
+    assert predictor.barris_view[2] == predictor.lookup.stamp
+    assert predictor.lookup.stats()['invalidations'] == 1
+    predictor.close()
+
+
+def test_predict_batch_reports_unknown_neighbourhoods(model_file):
+    pickle_model, feature_order = load_model(model_file)
+    barris = barris_frame()
+    encoder = build_encoder(feature_order, barris[barris['neighbourhood'] != 'la Salut'])
+    flats = random_flats(200, seed=5)
+    flats.loc[0, 'neighbourhood'] = 'la Salut'
+    flats.loc[1, 'rooms'] = 50
+    scored, errors = predict_batch(pickle_model, encoder, flats, chunk_size=64)
+    unknown = flats.index[flats['neighbourhood'] == 'la Salut']
+    assert (errors[unknown] == "Neighbourhood not in barris_view.").all()
+    assert errors[1] == "Number of rooms is not valid."
+    assert len(scored) + len(errors) == len(flats)
+    np.testing.assert_allclose(scored['predicted_price'],
+                               predict_matrix(pickle_model, encoder.encode(flats.loc[scored['input_row']])))
+
+
+def post(port, payload):
+    import json
+    import http.client
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('POST', '/predict', json.dumps(payload), {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+def test_server_rejects_flats_it_cannot_score(barris_view, model_file):
+    import threading
+    from http.server import ThreadingHTTPServer
+    from prediction_server import PredictionHandler
+    cursor = barris_view.cursor()
+    cursor.execute("DELETE FROM exploitation_zone.barris_view WHERE neighbourhood = 'la Salut';")
+    barris_view.commit()
+    PredictionHandler.predictor = Predictor(model_file)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PredictionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    flat = random_flats(1, seed=4).astype(object).to_dict('records')[0]
+    try:
+        status, body = post(port, {**flat, 'neighbourhood': 'Sants'})
+        assert status == 200 and 'price' in body
+        status, body = post(port, {**flat, 'neighbourhood': 'la Salut'})
+        assert status == 400 and body['error'] == "Neighbourhood not in barris_view: la Salut."
+        assert post(port, [])[0] == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+        PredictionHandler.predictor.close()
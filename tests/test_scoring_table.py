@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import numpy as np
+import pytest
+
+pytest.importorskip('psycopg2')
+from conftest import barris_frame, random_flats
+from scoring_table import ScoringTable
+from predictor import load_model, build_encoder, predict_matrix
+
+
+def test_scoring_table_matches_model(model_file):
+    pickle_model, feature_order = load_model(model_file)
+    encoder = build_encoder(feature_order, barris_frame())
+    table = ScoringTable.from_model(pickle_model, encoder)
+    flats = random_flats(500, seed=3)
+    expected = predict_matrix(pickle_model, encoder.encode(flats))
+    np.testing.assert_allclose(table.score_frame(flats), expected, rtol=1e-9)
+    np.testing.assert_allclose([table.score(flat) for flat in flats.to_dict('records')], expected, rtol=1e-9)
+    assert table.check(pickle_model, encoder) < 1e-6
+
+
+def test_check_raises_on_a_different_model(model_file):
+    pickle_model, feature_order = load_model(model_file)
+    encoder = build_encoder(feature_order, barris_frame())
+    table = ScoringTable.from_model(pickle_model, encoder)
+    table.neighbourhood_partial = {name: value + 1 for name, value in table.neighbourhood_partial.items()}
+    with pytest.raises(ValueError, match='differs from the model'):
+        table.check(pickle_model, encoder)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import sys
+import importlib
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+import pandas as pd
+import db
+import bulk_load
+import stage_runner
+
+
+def write_modules(directory, helper_body):
+    (directory / 'helper.py').write_text(f"def scale(value):\n    return {helper_body}\n")
+    (directory / 'stage.py').write_text("from helper import scale\n\n\n"
+                                        "def inner(value):\n    return scale(value) + 1\n\n\n"
+                                        "def run(value):\n    return [inner(item) for item in value]\n")
+
+
+def load_stage():
+    for name in ['helper', 'stage']:
+        sys.modules.pop(name, None)
+    importlib.invalidate_caches()
+    return importlib.import_module('stage').run
+
+
+def test_code_identity_follows_called_modules(monkeypatch, tmp_path):
+    monkeypatch.setattr(stage_runner, 'PROJECT_DIRECTORY', str(tmp_path))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    write_modules(tmp_path, 'value * 2')
+    before = stage_runner.code_identity(load_stage())
+    assert 'def inner' in before
+    write_modules(tmp_path, 'value * 3')
+    assert stage_runner.code_identity(load_stage()) != before
+    write_modules(tmp_path, 'value * 2')
+    assert stage_runner.code_identity(load_stage()) == before
+
+
+def test_failed_load_raises(local_database):
+    conn = db.connect()
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE loaded (ID INTEGER PRIMARY KEY, PRICE FLOAT);")
+    conn.commit()
+    df = pd.DataFrame({'id': [1, 1], 'price': [850.0, 900.0]})
+    # The duplicated key fails the load, which must fail its stage instead of being checkpointed as done
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        bulk_load.copy_dataframe(conn, df, 'loaded')
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM loaded;")
+    assert cursor.fetchone() == (0,)
+    conn.close()